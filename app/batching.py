@@ -0,0 +1,140 @@
+import time
+import asyncio
+import numpy as np
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+
+@dataclass
+class BatchingStats:
+    batches: int = 0
+    requests: int = 0
+    rows: int = 0
+    max_batch_rows: int = 0
+    queue_wait_total: float = 0.0
+    queue_wait_max: float = 0.0
+
+    def record(self, batch_rows: int, queue_waits: List[float]) -> None:
+        self.batches += 1
+        self.requests += len(queue_waits)
+        self.rows += batch_rows
+        self.max_batch_rows = max(self.max_batch_rows, batch_rows)
+        self.queue_wait_total += sum(queue_waits)
+        self.queue_wait_max = max([self.queue_wait_max, *queue_waits])
+
+    def to_dict(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "rows": self.rows,
+            "mean_batch_rows": self.rows / self.batches if self.batches else 0.0,
+            "max_batch_rows": self.max_batch_rows,
+            "mean_queue_wait_ms": 1000 * self.queue_wait_total / self.requests if self.requests else 0.0,
+            "max_queue_wait_ms": 1000 * self.queue_wait_max,
+        }
+
+
+# rows of a request, future where its predictions are set and the time it was enqueued
+BatchItem = Tuple[np.ndarray, asyncio.Future, float]
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent prediction requests into a single model call.
+    Requests are collected until max_batch_rows rows are queued or max_wait_ms milliseconds passed since the first one,
+    then the batch is predicted in a worker thread so the event loop is never blocked and every caller receives
+    its own slice of the predictions.
+    """
+
+    def __init__(self, predict: Callable[[np.ndarray], np.ndarray], max_batch_rows: int = 256,
+                 max_wait_ms: float = 5.0, n_features: Optional[int] = None):
+        self.predict_batch = predict
+        self.n_features = n_features
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000
+        self.stats = BatchingStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._pending: Optional[BatchItem] = None
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    async def predict(self, rows) -> np.ndarray:
+        """
+        Enqueues the rows of one request and waits for its predictions.
+        :param rows: 2d array like with the request rows, a 1d array is a single row.
+        :return: predictions for these rows only.
+        :raises ValueError: when there aren't rows or they don't have n_features columns, before being enqueued.
+        """
+        rows = self.validate_rows(rows)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((rows, future, time.perf_counter()))
+        return await future
+
+    def validate_rows(self, rows) -> np.ndarray:
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.ndim == 1 and rows.size:
+            rows = rows.reshape(1, -1)
+        if rows.ndim != 2 or not len(rows) or (self.n_features is not None and rows.shape[1] != self.n_features):
+            raise ValueError(f"Expected a non empty 2d array with {self.n_features or 'any'} columns, got shape "
+                             f"{rows.shape}")
+        return rows
+
+    async def _next_batch(self) -> List[BatchItem]:
+        loop = asyncio.get_running_loop()
+        first = self._pending or await self._queue.get()
+        self._pending = None
+        batch, batch_rows = [first], len(first[0])
+        deadline = loop.time() + self.max_wait
+        while batch_rows < self.max_batch_rows:
+            timeout = deadline - loop.time()
+            try:
+                if timeout > 0:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                else:
+                    # the wait is over but requests already queued still join the batch
+                    item = self._queue.get_nowait()
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+            if batch_rows + len(item[0]) > self.max_batch_rows:
+                # keep it for the next batch, a single request bigger than the limit goes alone
+                self._pending = item
+                break
+            batch.append(item)
+            batch_rows += len(item[0])
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            await self._predict(await self._next_batch())
+
+    async def _predict(self, batch: List[BatchItem]) -> None:
+        """
+        Predicts a batch and sets the predictions of every request. When the model raises with several requests, as
+        with nan values of one of them, every request is predicted alone so the error only reaches its caller.
+        """
+        start = time.perf_counter()
+        try:
+            batch_rows = np.concatenate([item[0] for item in batch])
+            predictions = await asyncio.get_running_loop().run_in_executor(None, self.predict_batch, batch_rows)
+        except Exception as e:
+            if len(batch) > 1:
+                for item in batch:
+                    await self._predict([item])
+                return
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.stats.record(len(batch_rows), [start - enqueued for _, _, enqueued in batch])
+        offsets = np.cumsum([len(item[0]) for item in batch])[:-1]
+        for (_, future, _), prediction in zip(batch, np.split(predictions, offsets)):
+            if not future.done():
+                future.set_result(prediction)
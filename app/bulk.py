@@ -0,0 +1,103 @@
+import io
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # arrow bodies are optional, .npy works with numpy only
+    pa = None
+
+NPY_MEDIA_TYPE = "application/x-npy"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+SUPPORTED_MEDIA_TYPES = [NPY_MEDIA_TYPE, "application/octet-stream"] + ([ARROW_MEDIA_TYPE] if pa is not None else [])
+
+
+class BulkFormatError(ValueError):
+    pass
+
+
+def check_features(data: np.ndarray, n_features: int) -> np.ndarray:
+    if data.ndim != 2 or data.shape[1] != n_features or data.shape[0] == 0:
+        raise BulkFormatError(f"Expected a non empty array with shape (n, {n_features}), got {data.shape}")
+    if data.dtype.kind != "f" or data.dtype.itemsize not in (4, 8):
+        raise BulkFormatError(f"Expected float32 or float64 values, got {data.dtype}")
+    return data
+
+
+def decode_npy(body: bytes, n_features: int) -> np.ndarray:
+    """
+    Reads a .npy payload as a read only view over the request body, values are not copied.
+    :param body: request body with a .npy file content.
+    :param n_features: expected number of columns.
+    :return: array with shape (n, n_features)
+    """
+    buffer = io.BytesIO(body)
+    try:
+        version = np.lib.format.read_magic(buffer)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(buffer)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(buffer)
+        else:
+            raise BulkFormatError(f"Unsupported .npy format version {version}")
+    except ValueError as e:
+        raise BulkFormatError(f"Invalid .npy body: {e}")
+    if dtype.hasobject:
+        raise BulkFormatError("Object arrays are not supported")
+    count = int(np.prod(shape))
+    if len(body) - buffer.tell() != count * dtype.itemsize:
+        raise BulkFormatError(f"Body size doesn't match the .npy header shape {shape}")
+    data = np.frombuffer(body, dtype=dtype, count=count, offset=buffer.tell())
+    data = data.reshape(shape, order="F" if fortran_order else "C")
+    return check_features(data, n_features)
+
+
+def encode_npy(predictions: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, np.asarray(predictions), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def decode_arrow(body: bytes, n_features: int) -> np.ndarray:
+    """
+    Reads an arrow IPC stream with one float column per feature.
+    Arrow is columnar then the columns are written once into a fortran ordered array, the only copy done.
+    :param body: request body with an arrow IPC stream.
+    :param n_features: expected number of columns.
+    :return: array with shape (n, n_features)
+    """
+    if pa is None:
+        raise BulkFormatError("pyarrow is not installed, arrow bodies are not supported")
+    try:
+        table = pa.ipc.open_stream(body).read_all()
+    except pa.ArrowInvalid as e:
+        raise BulkFormatError(f"Invalid arrow body: {e}")
+    if table.num_columns != n_features:
+        raise BulkFormatError(f"Expected {n_features} columns, got {table.num_columns}")
+    dtypes = {np.dtype(column.type.to_pandas_dtype()) for column in table.columns}
+    if len(dtypes) != 1:
+        raise BulkFormatError(f"All columns must have the same type, got {dtypes}")
+    data = np.empty((table.num_rows, n_features), dtype=dtypes.pop(), order="F")
+    for index, column in enumerate(table.columns):
+        data[:, index] = column.to_numpy()
+    return check_features(data, n_features)
+
+
+def encode_arrow(predictions: np.ndarray) -> bytes:
+    table = pa.table({"prediction": np.asarray(predictions)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def decode(body: bytes, media_type: str, n_features: int) -> np.ndarray:
+    if media_type == ARROW_MEDIA_TYPE:
+        return decode_arrow(body, n_features)
+    return decode_npy(body, n_features)
+
+
+def encode(predictions: np.ndarray, media_type: str) -> bytes:
+    if media_type == ARROW_MEDIA_TYPE:
+        return encode_arrow(predictions)
+    return encode_npy(predictions)
@@ -0,0 +1,20 @@
+import os
+from src import __version__
+
+MODEL_PATH = os.getenv("MODEL_PATH", f"pipeline-model-{__version__}.joblib")
+# directory with the artifacts of other versions served by /milk-price/{version}/predict, loaded on their first request
+MODEL_DIR = os.getenv("MODEL_DIR", os.path.dirname(MODEL_PATH) or ".")
+# memory budget in MB of the versions kept in memory besides the default one
+MODEL_CACHE_MB = float(os.getenv("MODEL_CACHE_MB", "512"))
+# load the model when the module is imported, with gunicorn --preload workers share it through copy-on-write
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "false").lower() == "true"
+# seconds between artifact modification checks, 0 disables the file watcher
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "0"))
+# token of the X-Admin-Token header required by /admin/reload, the endpoint is disabled without it
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# micro-batching of concurrent prediction requests
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "256"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+# prediction cache by row, 0 rows disables it
+PREDICTION_CACHE_ROWS = int(os.getenv("PREDICTION_CACHE_ROWS", "100000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "3600"))
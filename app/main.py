@@ -1,26 +1,211 @@
-from pydantic import BaseModel, conlist
-from fastapi import FastAPI
-from joblib import load
-from typing import List
-from src import __version__
+import os
+import time
+import secrets
+import threading
+import numpy as np
+from pydantic import BaseModel, ValidationError, conlist
+from pydantic.error_wrappers import ErrorWrapper
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from starlette.routing import Match
+from typing import Optional
+from app.constants import MODEL_PATH, MODEL_PRELOAD, MODEL_WATCH_INTERVAL, BATCH_MAX_ROWS, BATCH_MAX_WAIT_MS, \
+    MODEL_DIR, MODEL_CACHE_MB, PREDICTION_CACHE_ROWS, PREDICTION_CACHE_TTL, ADMIN_TOKEN
+from app.batching import MicroBatcher
+from app import bulk, metrics
+from app.model_holder import ModelHolder, wait_for_file_change, N_FEATURES
+from app.registry import ModelRegistry, UnknownModelVersion
+from app.prediction_cache import PredictionCache, predict_cached
 
 
 class MilkInput(BaseModel):
-    data: List[conlist(float, min_items=48, max_items=48)]
+    data: conlist(conlist(float, min_items=N_FEATURES, max_items=N_FEATURES), min_items=1)
+
+
+MILK_INPUT_BODY = {"requestBody": {"content": {"application/json": {"schema": MilkInput.schema()}}, "required": True}}
 
 
 app = FastAPI(title="Milk price endpoint", description="API to predict milk price", version="0.1.0")
 
+model_holder = ModelHolder(MODEL_PATH)
+stop_watcher = threading.Event()
+batcher = MicroBatcher(model_holder.predict, max_batch_rows=BATCH_MAX_ROWS, max_wait_ms=BATCH_MAX_WAIT_MS,
+                       n_features=N_FEATURES)
+registry = ModelRegistry(MODEL_DIR, model_holder, int(MODEL_CACHE_MB * 1024 ** 2), os.path.splitext(MODEL_PATH)[1])
+prediction_cache = PredictionCache(PREDICTION_CACHE_ROWS, PREDICTION_CACHE_TTL) if PREDICTION_CACHE_ROWS > 0 else None
+if MODEL_PRELOAD:
+    model_holder.load()
+
+
+@app.on_event("startup")
+async def load_model():
+    if not model_holder.loaded:
+        model_holder.load()
+    if MODEL_WATCH_INTERVAL > 0:
+        watcher = threading.Thread(target=wait_for_file_change, args=(model_holder, MODEL_WATCH_INTERVAL, stop_watcher),
+                                   daemon=True)
+        watcher.start()
+    await batcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    stop_watcher.set()
+    await batcher.stop()
+
+
+def route_path(request: Request) -> str:
+    """Path template of the route of a request, metrics are labeled by route to keep a bounded number of labels"""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    endpoint = route_path(request)
+    metrics.IN_FLIGHT.labels(endpoint=endpoint).inc()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        metrics.REQUEST_ERRORS.labels(endpoint=endpoint, status="500").inc()
+        raise
+    finally:
+        metrics.IN_FLIGHT.labels(endpoint=endpoint).dec()
+        metrics.REQUEST_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - start)
+    if response.status_code >= 400:
+        metrics.REQUEST_ERRORS.labels(endpoint=endpoint, status=str(response.status_code)).inc()
+    return response
+
 
 @app.get("/")
 async def root():
     return {"message": "Milk price predictor"}
 
 
-@app.post('/milk-price/predict', tags=["predictions"])
-async def get_prediction(milk_input: MilkInput):
-    model = load(f"pipeline-model-{__version__}.joblib")
-    if not model:
-        raise Exception(f"Model pipeline-model-{__version__}.pkl not initialized correctly")
-    prediction = model.predict(milk_input.data).tolist()
-    return {"prediction": prediction}
+async def predict_rows(holder: ModelHolder, rows: np.ndarray) -> np.ndarray:
+    """
+    Predictions of a model holder, rows of the default model are micro-batched. With the prediction cache only
+    rows not cached for the artifact loaded when the request arrives are predicted.
+    """
+    async def predict(missing_rows: np.ndarray) -> np.ndarray:
+        if holder is model_holder:
+            return await batcher.predict(missing_rows)
+        return await run_in_threadpool(holder.predict, missing_rows)
+
+    if prediction_cache is None:
+        return await predict(rows)
+    return await predict_cached(prediction_cache, holder.token, rows, predict)
+
+
+async def parse_milk_input(request: Request, endpoint: str) -> MilkInput:
+    """
+    The body is parsed in the endpoint instead of by fastapi to time its validation, invalid bodies are answered
+    with the same 422 response.
+    """
+    body = await request.body()
+    with metrics.stage(endpoint, "validation"):
+        try:
+            milk_input = MilkInput.parse_raw(body)
+        except ValidationError as e:
+            raise RequestValidationError([ErrorWrapper(e, ("body",))], body=body)
+    metrics.REQUEST_ROWS.labels(endpoint=endpoint).observe(len(milk_input.data))
+    return milk_input
+
+
+@app.post('/milk-price/predict', tags=["predictions"], openapi_extra=MILK_INPUT_BODY)
+async def get_prediction(request: Request):
+    """Predicts with the default model version"""
+    endpoint = route_path(request)
+    milk_input = await parse_milk_input(request, endpoint)
+    # inference time includes the wait for the micro batch
+    with metrics.stage(endpoint, "inference"):
+        prediction = await predict_rows(model_holder, np.asarray(milk_input.data, dtype=np.float64))
+    with metrics.stage(endpoint, "serialization"):
+        return JSONResponse({"prediction": prediction.tolist()})
+
+
+@app.post('/milk-price/{version}/predict', tags=["predictions"], openapi_extra=MILK_INPUT_BODY)
+async def get_version_prediction(version: str, request: Request):
+    """
+    Predicts with a model version, it's loaded on its first request. The default version is the same model than
+    /milk-price/predict, other versions aren't micro-batched.
+    """
+    endpoint = route_path(request)
+    try:
+        holder = await run_in_threadpool(registry.get, version)
+    except UnknownModelVersion:
+        raise HTTPException(status_code=404, detail=f"Model version {version} not found in {registry.model_dir}")
+    milk_input = await parse_milk_input(request, endpoint)
+    with metrics.stage(endpoint, "inference"):
+        prediction = await predict_rows(holder, np.asarray(milk_input.data, dtype=np.float64))
+    with metrics.stage(endpoint, "serialization"):
+        return JSONResponse({"prediction": prediction.tolist()})
+
+
+@app.get('/milk-price/cache/stats', tags=["predictions"])
+async def get_prediction_cache_stats():
+    return prediction_cache.stats() if prediction_cache else {"enabled": False}
+
+
+@app.get('/milk-price/versions', tags=["predictions"])
+async def get_versions():
+    return {"default": registry.default_version, "available": registry.available_versions(),
+            "loaded": registry.loaded_versions(), "loaded_mb": registry.loaded_bytes / 1024 ** 2}
+
+
+@app.post('/milk-price/predict/bulk', tags=["predictions"])
+async def get_bulk_prediction(request: Request):
+    """
+    Predicts a binary body with shape (n, 48): a .npy file (application/x-npy) or an arrow IPC stream
+    (application/vnd.apache.arrow.stream) with one column per feature. Predictions are returned in the same format.
+    """
+    endpoint = route_path(request)
+    media_type = request.headers.get("content-type", bulk.NPY_MEDIA_TYPE).split(";")[0].strip()
+    if media_type not in bulk.SUPPORTED_MEDIA_TYPES:
+        raise HTTPException(status_code=415, detail=f"Supported content types: {bulk.SUPPORTED_MEDIA_TYPES}")
+    if media_type != bulk.ARROW_MEDIA_TYPE:
+        media_type = bulk.NPY_MEDIA_TYPE
+    body = await request.body()
+    with metrics.stage(endpoint, "validation"):
+        try:
+            data = bulk.decode(body, media_type, N_FEATURES)
+        except bulk.BulkFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    metrics.REQUEST_ROWS.labels(endpoint=endpoint).observe(len(data))
+    with metrics.stage(endpoint, "inference"):
+        prediction = await run_in_threadpool(model_holder.predict, data)
+    with metrics.stage(endpoint, "serialization"):
+        content = bulk.encode(prediction, media_type)
+    return Response(content=content, media_type=media_type)
+
+
+@app.get('/milk-price/batching/stats', tags=["predictions"])
+async def get_batching_stats():
+    return batcher.stats.to_dict()
+
+
+@app.get('/metrics', tags=["monitoring"])
+async def get_metrics():
+    """Request latency by stage, rows by request, errors, in-flight requests and loaded model in prometheus format"""
+    return Response(content=metrics.latest_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.post('/admin/reload', tags=["admin"])
+async def reload_model(x_admin_token: Optional[str] = Header(None)):
+    """
+    Reloads the default model of the worker receiving the request only, with several gunicorn workers use
+    MODEL_WATCH_INTERVAL to reload all of them. It needs the ADMIN_TOKEN env variable in the X-Admin-Token header.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Reload is disabled, set ADMIN_TOKEN to enable it")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    await run_in_threadpool(model_holder.load)
+    return {"message": f"Model {model_holder.model_path} reloaded"}
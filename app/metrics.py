@@ -0,0 +1,68 @@
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Optional
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+
+# with gunicorn every worker writes its metrics to this directory and /metrics aggregates them
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+ROWS_BUCKETS = (1, 2, 5, 10, 50, 100, 500, 1000, 10_000, 100_000, 1_000_000)
+
+REQUEST_SECONDS = Histogram("milk_price_request_seconds", "Request latency by endpoint", ["endpoint"],
+                            buckets=LATENCY_BUCKETS)
+STAGE_SECONDS = Histogram("milk_price_request_stage_seconds",
+                          "Request latency by endpoint and stage: validation, inference and serialization",
+                          ["endpoint", "stage"], buckets=LATENCY_BUCKETS)
+REQUEST_ROWS = Histogram("milk_price_request_rows", "Rows predicted by request", ["endpoint"], buckets=ROWS_BUCKETS)
+REQUEST_ERRORS = Counter("milk_price_request_errors_total", "Requests answered with an error status code",
+                         ["endpoint", "status"])
+IN_FLIGHT = Gauge("milk_price_requests_in_flight", "Requests being processed", ["endpoint"],
+                  multiprocess_mode="livesum")
+MODEL_LOAD_SECONDS = Gauge("milk_price_model_load_seconds", "Time to load and warm up the last load of a model version",
+                           ["version"], multiprocess_mode="liveall")
+MODEL_INFO = Gauge("milk_price_model_info", "Loaded models, the value is 1 for models in memory and 0 for removed ones",
+                   ["version", "path"], multiprocess_mode="liveall")
+PREDICTION_CACHE_ROWS = Counter("milk_price_prediction_cache_rows_total", "Rows looked up in the prediction cache",
+                                ["result"])
+
+
+def model_version(model_path: str) -> str:
+    """Version of an artifact named pipeline-model-{version}.joblib or .npz, the file name otherwise"""
+    match = re.match(r"pipeline-model-(.+)\.(joblib|npz)$", os.path.basename(model_path))
+    return match.group(1) if match else os.path.basename(model_path)
+
+
+def record_model_load(model_path: str, seconds: float, previous_path: Optional[str] = None) -> None:
+    """Records a model load, previous_path is the model replaced by this one"""
+    MODEL_LOAD_SECONDS.labels(version=model_version(model_path)).set(seconds)
+    if previous_path and previous_path != model_path:
+        record_model_unload(previous_path)
+    MODEL_INFO.labels(version=model_version(model_path), path=model_path).set(1)
+
+
+def record_model_unload(model_path: str) -> None:
+    # in multiprocess mode removed labels stay in the worker file, the model is set to 0 instead
+    MODEL_INFO.labels(version=model_version(model_path), path=model_path).set(0)
+
+
+@contextmanager
+def stage(endpoint: str, name: str):
+    """Times a stage of a request in milk_price_request_stage_seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(endpoint=endpoint, stage=name).observe(time.perf_counter() - start)
+
+
+def latest_metrics() -> bytes:
+    """Metrics in prometheus text format, aggregated from every worker in multiprocess mode"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
@@ -0,0 +1,98 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+from joblib import load
+from typing import Any, Optional
+from src.model.compiled import load_compiled_pipeline
+from app.metrics import record_model_load
+
+N_FEATURES = 48
+
+logger = logging.getLogger(__name__)
+
+
+class ModelHolder:
+    """
+    Keeps a loaded model pipeline resident in memory for the api.
+    The artifact is loaded once, warmed up with a dummy prediction and then shared by every request.
+    A reload loads and warms up the new artifact before swapping the reference, in this way in-flight
+    requests keep using the model they already took and never see a partially loaded one.
+    """
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+        self._model = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> Any:
+        if self._model is None:
+            raise Exception(f"Model {self.model_path} not initialized correctly")
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def token(self) -> str:
+        """Identifies the loaded artifact, it changes when a new artifact is loaded"""
+        return f"{self.model_path}:{self._mtime}"
+
+    def load(self, model_path: Optional[str] = None) -> Any:
+        """
+        Loads the artifact, runs a warm-up prediction and swaps it in atomically.
+        :param model_path: optional new artifact path, by default the current one is reloaded.
+        :return: the loaded model.
+        """
+        with self._lock:
+            start = time.perf_counter()
+            path = model_path or self.model_path
+            mtime = os.path.getmtime(path)
+            model = load_model(path)
+            model.predict(np.zeros((1, N_FEATURES)))
+            record_model_load(path, time.perf_counter() - start, self.model_path if self._model is not None else None)
+            # a single reference assignment, requests holding the previous model finish with it
+            self._model = model
+            self.model_path = path
+            self._mtime = mtime
+            return model
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reloads the artifact if the file was modified since the last load.
+        :return: True if a new artifact was swapped in.
+        """
+        try:
+            mtime = os.path.getmtime(self.model_path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self.load()
+        return True
+
+    def predict(self, data) -> np.ndarray:
+        return self.model.predict(data)
+
+
+def load_model(path: str) -> Any:
+    """Loads a compiled numpy artifact (.npz) or a joblib serialized sklearn pipeline."""
+    if path.endswith(".npz"):
+        return load_compiled_pipeline(path)
+    return load(path)
+
+
+def wait_for_file_change(holder: ModelHolder, interval: float, stop: threading.Event) -> None:
+    """Polls the artifact file every interval seconds and reloads it when it changes."""
+    while not stop.wait(interval):
+        start = time.perf_counter()
+        try:
+            if holder.reload_if_changed():
+                logger.info(f"Model {holder.model_path} reloaded in {time.perf_counter() - start:.3f}s")
+        except Exception as e:
+            # the previous model keeps serving, next poll tries again
+            logger.error(f"Model {holder.model_path} reload failed: {e}")
@@ -0,0 +1,100 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Tuple
+from app import metrics
+
+
+class PredictionCache:
+    """
+    Bounded least recently used cache of predictions by row with a time to live.
+    A row is keyed by the model token and its float64 bytes, hashed by the dict, slicing the bytes of the request
+    array is several times faster than a cryptographic hash and keys can't collide. A new artifact or another version
+    never reads the predictions of a previous one and these are removed by the LRU or the TTL. Every row takes
+    around half a kilobyte.
+    """
+
+    def __init__(self, max_rows: int = 100_000, ttl_seconds: float = 3600):
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.predicted_rows = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def keys(self, token: str, rows: np.ndarray) -> List[Tuple[str, bytes]]:
+        """Key of every row, there aren't keys without rows as np.asarray([]) which is 1d"""
+        rows = np.ascontiguousarray(rows, dtype=np.float64)
+        if rows.size == 0:
+            return []
+        rows = rows.reshape(len(rows), -1)
+        buffer, width = rows.tobytes(), rows.shape[1] * rows.itemsize
+        return [(token, buffer[start:start + width]) for start in range(0, len(buffer), width)]
+
+    def get_many(self, keys: List[Tuple[str, bytes]]) -> Tuple[np.ndarray, List[int]]:
+        """
+        :return: predictions of the cached rows, nan for the others, and positions of the rows not cached.
+        """
+        predictions = np.full(len(keys), np.nan)
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for position, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] < now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    missing.append(position)
+                    continue
+                self._entries.move_to_end(key)
+                predictions[position] = entry[0]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        metrics.PREDICTION_CACHE_ROWS.labels(result="hit").inc(len(keys) - len(missing))
+        metrics.PREDICTION_CACHE_ROWS.labels(result="miss").inc(len(missing))
+        return predictions, missing
+
+    def put_many(self, keys: List[Tuple[str, bytes]], predictions: np.ndarray) -> None:
+        expires = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for key, prediction in zip(keys, predictions.tolist()):
+                self._entries[key] = (prediction, expires)
+                self._entries.move_to_end(key)
+            self.predicted_rows += len(keys)
+            while len(self._entries) > self.max_rows:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            requested = self.hits + self.misses
+            return {"rows": len(self._entries), "max_rows": self.max_rows, "ttl_seconds": self.ttl_seconds,
+                    "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / requested if requested else 0.0,
+                    "predicted_rows": self.predicted_rows, "evictions": self.evictions,
+                    "expirations": self.expirations}
+
+
+async def predict_cached(cache: PredictionCache, token: str, rows: np.ndarray,
+                         predict: Callable[[np.ndarray], Awaitable[np.ndarray]]) -> np.ndarray:
+    """
+    Predictions of rows where only the rows not cached are predicted with predict, a row repeated in the request
+    is predicted once.
+    :param token: model token, see ModelHolder.token.
+    """
+    keys = cache.keys(token, rows)
+    predictions, missing = cache.get_many(keys)
+    if missing:
+        first_positions = {}
+        for position in missing:
+            first_positions.setdefault(keys[position], position)
+        new_predictions = np.asarray(await predict(rows[list(first_positions.values())]), dtype=np.float64)
+        cache.put_many(list(first_positions), new_predictions)
+        by_key = dict(zip(first_positions, new_predictions))
+        predictions[missing] = [by_key[keys[position]] for position in missing]
+    return predictions
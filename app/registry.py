@@ -0,0 +1,103 @@
+import os
+import re
+import glob
+import pickle
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, List
+from app.model_holder import ModelHolder
+from app.metrics import model_version, record_model_unload
+from src.model.compiled import CompiledPipeline
+
+VERSION_PATTERN = re.compile(r"^[\w.\-]+$")
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownModelVersion(KeyError):
+    pass
+
+
+def model_nbytes(model: Any) -> int:
+    """Memory of a compiled pipeline arrays, other models are measured by their pickle size"""
+    if isinstance(model, CompiledPipeline):
+        return sum(value.nbytes for value in vars(model).values() if isinstance(value, np.ndarray))
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class ModelRegistry:
+    """
+    Serves every artifact version available in model_dir, named pipeline-model-{version}{extension}.
+    The default holder serves the default version and it's always loaded. Other versions are loaded on their first
+    request and kept in a least recently used cache, when their memory is over max_bytes the least recently used
+    versions are dropped, the last loaded one is kept even if it's bigger than the budget.
+    """
+
+    def __init__(self, model_dir: str, default: ModelHolder, max_bytes: int = 512 * 1024 ** 2,
+                 extension: str = ".npz"):
+        self.model_dir = model_dir
+        self.default = default
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self._holders = OrderedDict()
+        self._nbytes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def default_version(self) -> str:
+        return model_version(self.default.model_path)
+
+    def artifact_path(self, version: str) -> str:
+        if not VERSION_PATTERN.match(version):
+            raise UnknownModelVersion(version)
+        return os.path.join(self.model_dir, f"pipeline-model-{version}{self.extension}")
+
+    def available_versions(self) -> List[str]:
+        paths = glob.glob(os.path.join(glob.escape(self.model_dir), f"pipeline-model-*{self.extension}"))
+        return sorted(model_version(path) for path in paths)
+
+    def loaded_versions(self) -> List[str]:
+        """Versions in memory, the default one first and then from the least to the most recently used"""
+        with self._lock:
+            return [self.default_version] + list(self._holders)
+
+    @property
+    def loaded_bytes(self) -> int:
+        with self._lock:
+            return sum(self._nbytes.values())
+
+    def get(self, version: str) -> ModelHolder:
+        """
+        Holder of a version, it's loaded when it isn't in memory.
+        :raises UnknownModelVersion: when there isn't an artifact for the version.
+        """
+        if version == self.default_version:
+            return self.default
+        with self._lock:
+            if version in self._holders:
+                self._holders.move_to_end(version)
+                return self._holders[version]
+        path = self.artifact_path(version)
+        if not os.path.exists(path):
+            raise UnknownModelVersion(version)
+        # loaded without the lock, requests to versions in memory don't wait for it
+        holder = ModelHolder(path)
+        nbytes = model_nbytes(holder.load())
+        with self._lock:
+            if version in self._holders:
+                # loaded at the same time by another request
+                self._holders.move_to_end(version)
+                return self._holders[version]
+            self._holders[version] = holder
+            self._nbytes[version] = nbytes
+            self._evict()
+        return holder
+
+    def _evict(self) -> None:
+        while len(self._holders) > 1 and sum(self._nbytes.values()) > self.max_bytes:
+            version, holder = self._holders.popitem(last=False)
+            del self._nbytes[version]
+            record_model_unload(holder.model_path)
+            logger.info(f"Model {version} removed from memory")
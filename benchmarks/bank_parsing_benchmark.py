@@ -0,0 +1,42 @@
+import json
+import click
+import pandas as pd
+import src.utils as utils
+from benchmarks.common import scale_rows, best_time
+
+
+@click.command()
+@click.option("-f", "--file-bank-path", type=str, default="./data/banco_central.csv", show_default=True)
+@click.option("-r", "--rows", type=int, default=1_000_000, show_default=True,
+              help="Number of rows of the scaled central bank dataset")
+@click.option("--repeat", type=int, default=3, show_default=True, help="Repetitions, the best time is reported")
+def bank_parsing_benchmark_command(file_bank_path: str, rows: int, repeat: int):
+    """
+    Compares per cell parsing functions of src.utils with their vectorized versions
+    on banco_central.csv scaled to the requested number of rows.
+    """
+    df = pd.read_csv(file_bank_path)
+    cols_pib = [column for column in df.columns if 'PIB' in column]
+    cols_imacec = [column for column in df.columns if 'Imacec' in column]
+    df_pib = scale_rows(df[cols_pib].dropna(), rows)
+    df_imacec = scale_rows(df[cols_imacec].dropna(), rows)
+    periods = scale_rows(df[["Periodo"]], rows)["Periodo"]
+
+    cases = {
+        "convert_int": (lambda: df_pib.applymap(utils.convert_int),
+                        lambda: df_pib.apply(utils.convert_int_series), df_pib.size),
+        "to_100": (lambda: df_imacec.apply(lambda column: column.apply(utils.to_100)),
+                   lambda: df_imacec.apply(utils.to_100_series), df_imacec.size),
+        "match_date": (lambda: periods.apply(utils.match_date),
+                       lambda: utils.match_date_series(periods), periods.size),
+    }
+    report = {}
+    for name, (per_cell, vectorized, cells) in cases.items():
+        per_cell_time, vectorized_time = best_time(per_cell, repeat), best_time(vectorized, repeat)
+        report[name] = {"rows": rows, "cells": int(cells), "per_cell_seconds": per_cell_time,
+                        "vectorized_seconds": vectorized_time, "speedup": per_cell_time / vectorized_time}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    bank_parsing_benchmark_command()
@@ -0,0 +1,52 @@
+import os
+import json
+import click
+import tempfile
+import pandas as pd
+from src.preprocess import columnar
+from src.preprocess.preprocess_bank import load_and_clean_central_bank_data, is_etl_column, process_pib_columns, \
+    process_imacec_columns, process_iv, load_and_process_central_bank_data_chunked
+from benchmarks.common import scale_rows, best_time, peak_memory_mb
+
+
+def process_bank(file: str):
+    df_bank_clean = load_and_clean_central_bank_data(file)
+    return process_pib_columns(df_bank_clean), process_imacec_columns(df_bank_clean), process_iv(df_bank_clean)
+
+
+@click.command()
+@click.option("-f", "--file-bank-path", type=str, default="./data/banco_central.csv", show_default=True)
+@click.option("-r", "--rows", type=int, default=200_000, show_default=True,
+              help="Number of rows of the scaled central bank dataset")
+@click.option("--repeat", type=int, default=3, show_default=True, help="Repetitions, the best time is reported")
+@click.option("--chunk-size", type=int, default=10_000, show_default=True, help="Rows by chunk of the streaming loader")
+def columnar_benchmark_command(file_bank_path: str, rows: int, repeat: int, chunk_size: int):
+    """
+    Compares reading banco_central.csv scaled to the requested number of rows as csv and as the feather file
+    generated by ingest.py: read time and peak memory of the raw read and of load_and_clean_central_bank_data.
+    The load and processing of the csv file is also compared with the chunked streaming loader.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        csv_file = os.path.join(temp_dir, "banco_central.csv")
+        scale_rows(pd.read_csv(file_bank_path, dtype=str), rows).to_csv(csv_file, index=False)
+        feather_file = columnar.convert_csv(csv_file, temp_dir, columnar.bank_schema)
+
+        cases = {
+            "read_csv": (pd.read_csv, csv_file),
+            "read_columnar": (lambda file: columnar.read_columnar(file, is_etl_column), feather_file),
+            "load_bank_csv": (load_and_clean_central_bank_data, csv_file),
+            "load_bank_columnar": (load_and_clean_central_bank_data, feather_file),
+            "process_bank_csv": (process_bank, csv_file),
+            "process_bank_chunked": (lambda file: load_and_process_central_bank_data_chunked(file, chunk_size),
+                                     csv_file),
+        }
+        report = {"rows": rows, "csv_mb": os.path.getsize(csv_file) / 1024 ** 2,
+                  "feather_mb": os.path.getsize(feather_file) / 1024 ** 2}
+        for name, (function, file) in cases.items():
+            report[name] = {"seconds": best_time(lambda: function(file), repeat),
+                            "peak_memory_mb": peak_memory_mb(function, file)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    columnar_benchmark_command()
@@ -0,0 +1,63 @@
+import os
+import time
+import resource
+import multiprocessing
+import pandas as pd
+from typing import Any, Callable, Tuple
+from src.preprocess.preprocess_milk import load_and_preprocess_milk
+from src.preprocess.preprocess_bank import load_and_clean_central_bank_data, process_pib_columns, \
+    process_imacec_columns, process_iv, join_preprocess_bank_data
+from src.preprocess.preprocess_precipitations import load_and_preprocess_precipitations
+from src.preprocess.preprocess import join_precipitations_milk_data, join_preprocess_milk_bank_data
+
+
+def load_training_table(data_dir: str = "./data", extension: str = ".csv") -> pd.DataFrame:
+    """
+    Runs the etl stage of the flow without prefect and returns the training table.
+    Use extension .feather and the ingest.py output directory to read columnar files.
+    """
+    df_bank_clean = load_and_clean_central_bank_data(os.path.join(data_dir, f"banco_central{extension}"))
+    df_bank = join_preprocess_bank_data(process_pib_columns(df_bank_clean), process_imacec_columns(df_bank_clean),
+                                        process_iv(df_bank_clean))
+    df_precipitations = load_and_preprocess_precipitations(os.path.join(data_dir, f"precipitaciones{extension}"))
+    df_milk = load_and_preprocess_milk(os.path.join(data_dir, f"precio_leche{extension}"))
+    return join_preprocess_milk_bank_data(df_bank, join_precipitations_milk_data(df_precipitations, df_milk))
+
+
+def scale_rows(df: pd.DataFrame, rows: int) -> pd.DataFrame:
+    """Repeats the dataframe rows until it has the requested number of rows."""
+    repeats = -(-rows // len(df))
+    return pd.concat([df] * repeats, ignore_index=True).iloc[:rows]
+
+
+def best_time(function: Callable, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_in_fresh_process(function: Callable, *args) -> Tuple[Any, float]:
+    """
+    Runs function(*args) in a forked process.
+    :return: function result and peak resident memory increase of the process in MB.
+    """
+    def child(queue):
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result = function(*args)
+        queue.put((result, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) / 1024))
+
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    process = context.Process(target=child, args=(queue,))
+    process.start()
+    result, peak = queue.get()
+    process.join()
+    return result, peak
+
+
+def peak_memory_mb(function: Callable, *args) -> float:
+    """Peak resident memory increase in MB of a fresh process running function(*args)"""
+    return run_in_fresh_process(lambda: function(*args) and None)[1]
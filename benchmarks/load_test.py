@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import time
+import click
+import socket
+import psutil
+import threading
+import subprocess
+import http.client
+import numpy as np
+from typing import List, Optional
+from urllib.parse import urlparse
+from src import __version__
+
+N_FEATURES = 48
+
+
+def listening_socket() -> socket.socket:
+    """
+    Localhost socket on a free port for the api. Accepted connections inherit TCP_NODELAY as with gunicorn in the docker
+    image, uvicorn doesn't set it on the sockets it binds for several workers and responses wait for delayed acks.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+def start_server(model_path: str, sock: socket.socket, workers: int) -> subprocess.Popen:
+    """Starts the api with uvicorn serving on sock, the model is loaded by every worker"""
+    env = {**os.environ, "MODEL_PATH": model_path, "MODEL_PRELOAD": "false"}
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--fd", str(sock.fileno()),
+                             "--workers", str(workers), "--log-level", "warning"], env=env, pass_fds=[sock.fileno()])
+
+
+def wait_until_ready(host: str, port: int, timeout: float = 60) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1)
+            connection.request("GET", "/")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Api on {host}:{port} not ready after {timeout} seconds")
+
+
+def worker_processes(server: subprocess.Popen) -> List[psutil.Process]:
+    """Processes serving requests, the uvicorn workers or the server itself when it runs a single worker"""
+    process = psutil.Process(server.pid)
+    # uvicorn starts a resource tracker besides the workers when workers > 1
+    children = [child for child in process.children()
+                if "multiprocessing.resource_tracker" not in " ".join(child.cmdline())]
+    return children or [process]
+
+
+def cpu_seconds(processes: List[psutil.Process]) -> List[float]:
+    return [sum(process.cpu_times()[:2]) for process in processes]
+
+
+def send_requests(host: str, port: int, body: bytes, deadline: float, latencies: List[float],
+                  errors: List[int]) -> None:
+    """Sends requests back to back through a keep-alive connection until deadline"""
+    connection = http.client.HTTPConnection(host, port)
+    headers = {"Content-Type": "application/json"}
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            connection.request("POST", "/milk-price/predict", body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection(host, port)
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(1)
+    connection.close()
+
+
+def run_case(host: str, port: int, concurrency: int, batch_size: int, duration: float,
+             processes: Optional[List[psutil.Process]]) -> dict:
+    """
+    Sends requests with batch_size random rows from concurrency threads during duration seconds.
+    :return: throughput, latency percentiles in milliseconds and cpu usage of every worker in % of a core.
+    """
+    rows = np.random.RandomState(batch_size).uniform(0, 100, size=(batch_size, N_FEATURES))
+    body = json.dumps({"data": rows.tolist()}).encode()
+    latencies, errors = [], []
+    cpu_before = cpu_seconds(processes) if processes else None
+    start = time.perf_counter()
+    threads = [threading.Thread(target=send_requests, args=(host, port, body, start + duration, latencies, errors))
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    report = {"concurrency": concurrency, "batch_size": batch_size, "requests": len(latencies), "errors": len(errors),
+              "requests_per_second": len(latencies) / elapsed, "rows_per_second": len(latencies) * batch_size / elapsed}
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        report.update({"p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "mean_ms": float(np.mean(latencies)) * 1000})
+    if processes:
+        cpu = [100 * (after - before) / elapsed for before, after in zip(cpu_before, cpu_seconds(processes))]
+        report.update({"worker_cpu_percent": cpu, "total_cpu_percent": sum(cpu)})
+    return report
+
+
+@click.command()
+@click.option("-m", "--model-path", type=str, default=f"artifacts/pipeline-model-{__version__}.npz",
+              show_default=True, help="Artifact served by the api")
+@click.option("-w", "--workers", type=int, default=1, show_default=True, help="Uvicorn workers")
+@click.option("-c", "--concurrency", type=str, default="1,4,16", show_default=True,
+              help="Comma separated numbers of concurrent clients")
+@click.option("-b", "--batch-sizes", type=str, default="1,16,256", show_default=True,
+              help="Comma separated numbers of rows by request")
+@click.option("-d", "--duration", type=float, default=10, show_default=True, help="Seconds of every case")
+@click.option("--url", type=str, default=None,
+              help="Url of a running api, for example a docker container, instead of starting one. "
+                   "Cpu usage is not reported")
+@click.option("-o", "--output", type=str, default=None, help="Json file to write the report, stdout by default")
+def load_test_command(model_path: str, workers: int, concurrency: str, batch_sizes: str, duration: float,
+                      url: Optional[str], output: Optional[str]):
+    """
+    Load test of /milk-price/predict, the api is started with uvicorn on localhost unless --url is provided.
+    Every combination of concurrency and batch size runs during --duration seconds with closed loop clients:
+    every client sends a request when it receives the previous response.
+    The report has the throughput, latency percentiles and cpu usage of every api worker by case.
+    """
+    server, sock = None, None
+    if url:
+        parsed = urlparse(url)
+        host, port = parsed.hostname, parsed.port or 80
+    else:
+        sock = listening_socket()
+        host, port = sock.getsockname()
+        server = start_server(model_path, sock, workers)
+    try:
+        wait_until_ready(host, port)
+        processes = worker_processes(server) if server else None
+        cases = []
+        for clients in [int(value) for value in concurrency.split(",")]:
+            for batch_size in [int(value) for value in batch_sizes.split(",")]:
+                cases.append(run_case(host, port, clients, batch_size, duration, processes))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+            sock.close()
+    report = json.dumps({"workers": workers if server else None, "model_path": model_path if server else url,
+                         "duration": duration, "cases": cases}, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    load_test_command()
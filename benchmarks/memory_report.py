@@ -0,0 +1,63 @@
+import os
+import json
+import click
+import tempfile
+import pandas as pd
+from pipeline import flow_definition
+from src.containers import SearchConfig
+from src.model.model import SEARCH_STRATEGIES
+from benchmarks.common import run_in_fresh_process
+
+
+def frames_memory_mb(value) -> float:
+    """Memory of the dataframes and series of a task result, also inside lists and tuples"""
+    if isinstance(value, pd.DataFrame):
+        return value.memory_usage(deep=True).sum() / 1024 ** 2
+    if isinstance(value, pd.Series):
+        return value.memory_usage(deep=True) / 1024 ** 2
+    if isinstance(value, (list, tuple)):
+        return sum(frames_memory_mb(item) for item in value)
+    return 0.0
+
+
+def run_flow(data_dir: str, compact_dtypes: bool, strategy: str) -> dict:
+    with tempfile.TemporaryDirectory() as save_model_dir:
+        flow = flow_definition("memory_report_flow", SearchConfig(strategy=strategy))
+        state = flow.run(parameters={"file_bank_path": os.path.join(data_dir, "banco_central.csv"),
+                                     "file_precipitation_path": os.path.join(data_dir, "precipitaciones.csv"),
+                                     "file_milk_path": os.path.join(data_dir, "precio_leche.csv"),
+                                     "save_model_dir": save_model_dir},
+                         context={"compact_dtypes": compact_dtypes})
+    report = {}
+    for task, task_state in state.result.items():
+        memory = frames_memory_mb(task_state.result)
+        if memory:
+            report[task.name] = report.get(task.name, 0.0) + memory
+    return report
+
+
+@click.command()
+@click.option("-d", "--data-dir", type=str, default="./data", show_default=True)
+@click.option("-s", "--search-strategy", type=click.Choice(list(SEARCH_STRATEGIES)), default="grid",
+              show_default=True)
+@click.option("-o", "--output", type=str, default=None, help="Json file to write the report, stdout by default")
+def memory_report_command(data_dir: str, search_strategy: str, output: str):
+    """
+    Runs the flow with the default and the compact dtypes policy, every run in a new process.
+    Reports the peak resident memory of every run and the memory of the dataframes returned by every task.
+    """
+    report = {}
+    for name, compact_dtypes in [("default_dtypes", False), ("compact_dtypes", True)]:
+        frames, peak = run_in_fresh_process(run_flow, data_dir, compact_dtypes, search_strategy)
+        report[name] = {"peak_rss_mb": peak, "task_results_mb": frames,
+                        "total_task_results_mb": sum(frames.values())}
+    report = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    memory_report_command()
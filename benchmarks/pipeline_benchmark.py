@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import click
+import prefect
+import tempfile
+import pandas as pd
+from typing import Dict, List
+from prefect import Parameter
+from pipeline import flow_definition
+from src.containers import SearchConfig
+from src.model.model import SEARCH_STRATEGIES
+from benchmarks.common import scale_rows, run_in_fresh_process
+
+# columns of every source that aren't copied when columns are scaled, milk price is the target
+KEY_COLUMNS = {"banco_central.csv": ["Periodo"], "precipitaciones.csv": ["date"],
+               "precio_leche.csv": ["Anio", "Mes", "Precio_leche"]}
+
+
+class TaskTimer:
+    """Prefect state handler that accumulates the wall time of every task run by task name"""
+    def __init__(self):
+        self.started = {}
+        self.timings = {}
+
+    def __call__(self, task, old_state, new_state):
+        key = (task.name, prefect.context.get("map_index"))
+        if new_state.is_running():
+            self.started[key] = time.perf_counter()
+        elif new_state.is_finished() and not new_state.is_mapped() and key in self.started:
+            timing = self.timings.setdefault(task.name, {"seconds": 0.0, "runs": 0})
+            timing["seconds"] += time.perf_counter() - self.started.pop(key)
+            timing["runs"] += 1
+        return new_state
+
+
+def scale_columns(df: pd.DataFrame, columns: int, keys: List[str]) -> pd.DataFrame:
+    """Adds columns - 1 copies of every column not in keys, copies are named with the suffix _{copy}"""
+    values = df.drop(keys, axis=1)
+    copies = [values.add_suffix(f"_{copy}") for copy in range(1, columns)]
+    return pd.concat([df] + copies, axis=1)
+
+
+def write_scaled_sources(data_dir: str, output_dir: str, rows: int = 1, columns: int = 1) -> Dict[str, str]:
+    """
+    Synthetic versions of the source csv files with rows and columns multiplied by the given factors.
+    Rows are repeated, central bank and precipitations loaders drop repeated months and repeated milk months are
+    repeated rows of the training table. Value columns are copied, the etl processes copies of PIB, Imacec and
+    regions columns as new features. The milk file only has the target as value column then only its rows are scaled.
+    :return: path of every scaled file by file name.
+    """
+    paths = {}
+    for file, keys in KEY_COLUMNS.items():
+        # central bank values are kept as strings to write them with the same format
+        df = pd.read_csv(os.path.join(data_dir, file), dtype=str if file == "banco_central.csv" else None)
+        df = scale_columns(scale_rows(df, len(df) * rows), columns, keys)
+        paths[file] = os.path.join(output_dir, file)
+        df.to_csv(paths[file], index=False)
+    return paths
+
+
+def run_flow(paths: Dict[str, str], search: SearchConfig) -> dict:
+    """Runs the flow and reports its time, the time of every task and the training table shape"""
+    flow = flow_definition("pipeline_benchmark_flow", search)
+    timer = TaskTimer()
+    for task in flow.tasks:
+        if not isinstance(task, Parameter):
+            task.state_handlers = task.state_handlers + [timer]
+    with tempfile.TemporaryDirectory() as save_model_dir:
+        start = time.perf_counter()
+        state = flow.run(parameters={"file_bank_path": paths["banco_central.csv"],
+                                     "file_precipitation_path": paths["precipitaciones.csv"],
+                                     "file_milk_path": paths["precio_leche.csv"],
+                                     "save_model_dir": save_model_dir})
+        flow_seconds = time.perf_counter() - start
+    report = {"success": state.is_successful(), "flow_seconds": flow_seconds, "tasks": timer.timings}
+    for task, task_state in state.result.items():
+        if task.name == "join_preprocess_milk_bank_data_task" and task_state.is_successful():
+            report["training_rows"], report["training_columns"] = task_state.result.shape
+    return report
+
+
+@click.command()
+@click.option("-d", "--data-dir", type=str, default="./data", show_default=True, help="Directory with source csv files")
+@click.option("--scales", type=str, default="10,100,1000", show_default=True,
+              help="Comma separated factors to scale the source files")
+@click.option("--axes", type=str, default="rows,columns", show_default=True,
+              help="Comma separated axes scaled by every factor, each axis is scaled on its own")
+@click.option("-s", "--search-strategy", type=click.Choice(list(SEARCH_STRATEGIES)), default="grid",
+              show_default=True)
+@click.option("-o", "--output", type=str, default=None, help="Json file to write the report, stdout by default")
+def pipeline_benchmark_command(data_dir: str, scales: str, axes: str, search_strategy: str, output: str):
+    """
+    Times every task of the flow on the bundled data and on synthetic versions of the source files scaled by rows
+    or columns, every run in a new process. The report has the flow and task times and the peak resident memory of
+    every run by case name, bundled for the original data and {axis}_x{scale} for scaled data.
+    """
+    search = SearchConfig(strategy=search_strategy)
+    cases = [("bundled", 1, 1)]
+    for scale in [int(scale) for scale in scales.split(",")]:
+        for axis in axes.split(","):
+            cases.append((f"{axis}_x{scale}", scale if axis == "rows" else 1, scale if axis == "columns" else 1))
+
+    report = {}
+    for name, rows, columns in cases:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = write_scaled_sources(data_dir, temp_dir, rows, columns)
+            sizes_mb = {file: os.path.getsize(path) / 1024 ** 2 for file, path in paths.items()}
+            result, peak = run_in_fresh_process(run_flow, paths, search)
+        report[name] = {"rows_scale": rows, "columns_scale": columns, "sources_mb": sizes_mb,
+                        "peak_rss_mb": peak, **result}
+    report = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    pipeline_benchmark_command()
@@ -0,0 +1,36 @@
+import json
+import click
+from benchmarks.common import load_training_table
+from src.containers import SearchConfig
+from src.model.model import SEARCH_STRATEGIES, compare_search_strategies, generate_train_test_data
+
+
+@click.command()
+@click.option("-s", "--strategies", type=str, default=",".join(SEARCH_STRATEGIES), show_default=True,
+              help="Comma separated search strategies to compare, grid is the reference")
+@click.option("-j", "--search-jobs", type=int, default=1, show_default=True,
+              help="Number of processes used to evaluate search candidates")
+@click.option("--search-iter", type=int, default=30, show_default=True,
+              help="Number of sampled candidates for budgeted strategies")
+@click.option("-d", "--data-dir", type=str, default="./data", show_default=True, help="Directory with source csv files")
+@click.option("-o", "--output", type=str, default=None, help="Json file to write the report, stdout by default")
+def search_benchmark_command(strategies: str, search_jobs: int, search_iter: int, data_dir: str, output: str):
+    """
+    Compares search time, time to best score and test metrics of the selected model of hyper parameters search
+    strategies.
+    """
+    df = load_training_table(data_dir)
+    x_train, x_test, y_train, y_test = generate_train_test_data(df.drop(['Precio_leche'], axis=1), df['Precio_leche'],
+                                                                0.2)
+    search = SearchConfig(n_jobs=search_jobs, n_iter=search_iter)
+    reports = compare_search_strategies(x_train, y_train, strategies.split(","), search, x_test, y_test)
+    report = json.dumps(reports, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    search_benchmark_command()
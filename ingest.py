@@ -0,0 +1,23 @@
+import os
+import click
+import prefect
+from src.preprocess.columnar import SCHEMAS, convert_csv
+
+
+@click.command()
+@click.option("-i", "--input-dir", type=str, default="./data", show_default=True,
+              help="Directory with banco_central.csv, precio_leche.csv and precipitaciones.csv")
+@click.option("-o", "--output-dir", type=str, default="./data/columnar", show_default=True,
+              help="Directory of the generated feather files")
+def ingest_command(input_dir: str, output_dir: str) -> None:
+    """
+    Converts the source csv files into typed feather files read by the pipeline with --columnar.
+    """
+    logger = prefect.context.get("logger")
+    for name, schema_definition in SCHEMAS.items():
+        output_file = convert_csv(os.path.join(input_dir, f"{name}.csv"), output_dir, schema_definition)
+        logger.info(f"{name}.csv converted to {output_file}")
+
+
+if __name__ == "__main__":
+    ingest_command()
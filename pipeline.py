@@ -1,19 +1,30 @@
 import time
+import tempfile
 import click
 import prefect
-from prefect import Flow, Parameter
+from prefect import Flow, Parameter, unmapped, case
 from prefect.engine import state
 from src.pipeline_tasks.etl_tasks import load_and_preprocess_precipitations_data_task, \
     load_and_preprocess_milk_data_task, \
     load_and_preprocess_central_bank_data_task, process_pib_columns_task, process_imacec_columns_task, \
     process_iv_task, join_precipitations_milk_data_task, join_preprocess_milk_bank_data_task, \
-    join_preprocess_bank_data_task
+    join_preprocess_bank_data_task, update_training_table_task, load_and_process_central_bank_data_chunked_task
 from src.pipeline_tasks.model_tasks import generate_datasets_task, model_generation_task, select_best_model_task, \
-    model_serialization_task
-from prefect.executors import LocalDaskExecutor
+    model_serialization_task, refresh_model_task
+from prefect.executors import Executor, DaskExecutor, LocalDaskExecutor, LocalExecutor
+from src.containers import SearchConfig, RefreshConfig
+from src.cache import EtlCache
+from src.preprocess.backend import ETL_BACKENDS
+from src.profiling import TaskProfiler, ProfilingFlowRunner
+from src.model.model import SEARCH_STRATEGIES
+from typing import Optional
 
 
-def flow_definition(flow_name: str) -> Flow:
+def flow_definition(flow_name: str, search: Optional[SearchConfig] = None,
+                    bank_chunk_size: Optional[int] = None) -> Flow:
+    """
+    Milk price flow, with bank_chunk_size the central bank file is loaded and processed by a single streaming task.
+    """
     with Flow(flow_name) as flow:
         # Parameters definition
         file_precipitation_path = Parameter("file_precipitation_path")
@@ -24,26 +35,73 @@ def flow_definition(flow_name: str) -> Flow:
         # etl stage
         df_precipitations = load_and_preprocess_precipitations_data_task(file_precipitation_path)
         df_milk = load_and_preprocess_milk_data_task(file_milk_path)
-        df_bank_clean = load_and_preprocess_central_bank_data_task(file_bank_path)
+        if bank_chunk_size:
+            df_pib, df_imacec, df_iv = load_and_process_central_bank_data_chunked_task(file_bank_path, bank_chunk_size)
+        else:
+            df_bank_clean = load_and_preprocess_central_bank_data_task(file_bank_path)
 
-        df_pib = process_pib_columns_task(df_bank_clean)
-        df_imacec = process_imacec_columns_task(df_bank_clean)
-        df_iv = process_iv_task(df_bank_clean)
+            df_pib = process_pib_columns_task(df_bank_clean)
+            df_imacec = process_imacec_columns_task(df_bank_clean)
+            df_iv = process_iv_task(df_bank_clean)
         df_bank = join_preprocess_bank_data_task(df_pib, df_imacec, df_iv)
 
         df_milk_price_pp = join_precipitations_milk_data_task(df_precipitations, df_milk)
         df_milk_price_pp_pib = join_preprocess_milk_bank_data_task(df_bank, df_milk_price_pp)
 
         # model training, selection and serialization stage
-        datasets = generate_datasets_task(df_milk_price_pp_pib)
-        models = model_generation_task.map(datasets)
+        datasets = generate_datasets_task(df_milk_price_pp_pib, search=search)
+        models = model_generation_task.map(datasets, search=unmapped(search))
 
         best_model = select_best_model_task(models)
-        model_serialization_task(best_model, save_model_dir)
+        model_serialization_task(best_model, save_model_dir, df_milk_price_pp_pib)
+    return flow
+
+
+def incremental_flow_definition(flow_name: str, search: Optional[SearchConfig] = None,
+                                refresh: Optional[RefreshConfig] = None) -> Flow:
+    """
+    Flow where the etl stage only processes months newer than the training table of previous runs. With refresh the
+    serialized model is refreshed with the new months and the search only runs when refresh_model_task needs it.
+    """
+    with Flow(flow_name) as flow:
+        # Parameters definition
+        training_table_path = Parameter("training_table_path")
+        file_precipitation_path = Parameter("file_precipitation_path")
+        file_milk_path = Parameter("file_milk_path")
+        file_bank_path = Parameter("file_bank_path")
+        save_model_dir = Parameter("save_model_dir")
+
+        # incremental etl stage
+        df_milk_price_pp_pib = update_training_table_task(training_table_path, file_precipitation_path,
+                                                          file_milk_path, file_bank_path)
+
+        if refresh:
+            refreshed = refresh_model_task(df_milk_price_pp_pib, save_model_dir, refresh)
+            with case(refreshed, False):
+                full_search_stage(df_milk_price_pp_pib, save_model_dir, search)
+        else:
+            full_search_stage(df_milk_price_pp_pib, save_model_dir, search)
     return flow
 
 
-def parameters_definition() -> dict:
+def full_search_stage(df_milk_price_pp_pib, save_model_dir, search: Optional[SearchConfig] = None) -> None:
+    """Model training, selection and serialization tasks of the incremental flow"""
+    datasets = generate_datasets_task(df_milk_price_pp_pib, search=search)
+    models = model_generation_task.map(datasets, search=unmapped(search))
+
+    best_model = select_best_model_task(models)
+    model_serialization_task(best_model, save_model_dir, df_milk_price_pp_pib)
+
+
+def parameters_definition(columnar: bool = False) -> dict:
+    if columnar:
+        # feather files generated by ingest.py
+        return {
+            "file_bank_path": "./data/columnar/banco_central.feather",
+            "file_precipitation_path": "./data/columnar/precipitaciones.feather",
+            "file_milk_path": "./data/columnar/precio_leche.feather",
+            "save_model_dir": "artifacts"
+        }
     return {
         "file_bank_path": "./data/banco_central.csv",
         "file_precipitation_path": "./data/precipitaciones.csv",
@@ -52,30 +110,160 @@ def parameters_definition() -> dict:
     }
 
 
-def run_pipeline(parallel: bool = False, workers: int = 4) -> state:
-    flow = flow_definition("milk_price_flow")
-    parameters = parameters_definition()
-    state = flow.run(
-        parameters=parameters,
-        executor=None if parallel else LocalDaskExecutor(scheduler="threads", num_workers=workers)
-    )
+EXECUTORS = ("sequential", "threads", "processes")
+
+
+def flow_executor(executor: str = "threads", workers: int = 4, threads_per_worker: int = 1) -> Executor:
+    """
+    Executor of the flow runs: sequential runs a task at a time, threads runs tasks in a pool of workers threads and
+    processes starts a local dask distributed cluster of workers processes with threads_per_worker threads each, so
+    cpu bound tasks aren't limited by the GIL.
+    """
+    if executor == "sequential":
+        return LocalExecutor()
+    if executor == "threads":
+        return LocalDaskExecutor(scheduler="threads", num_workers=workers)
+    if executor == "processes":
+        return DaskExecutor(cluster_kwargs={"n_workers": workers, "threads_per_worker": threads_per_worker,
+                                            "processes": True, "dashboard_address": None})
+    raise ValueError(f"Unknown executor {executor}, available executors: {EXECUTORS}")
+
+
+def run_pipeline(executor: str = "threads", workers: int = 4, search: Optional[SearchConfig] = None,
+                 etl_cache: Optional[EtlCache] = None, columnar: bool = False,
+                 training_table_path: Optional[str] = None, bank_chunk_size: Optional[int] = None,
+                 compact_dtypes: bool = False, profiler: Optional[TaskProfiler] = None,
+                 etl_backend: str = "pandas", threads_per_worker: int = 1,
+                 refresh: Optional[RefreshConfig] = None) -> state:
+    """
+    Runs the milk price flow, when training_table_path is provided the incremental flow updates that table
+    instead of processing the whole history. With search.feature_subsets the features matrix is shared by all
+    feature subsets through a memory mapped file in a temporary directory. With a profiler every task run is profiled.
+    The etl_backend runs the etl functions, see src.preprocess.backend.ETL_BACKENDS.
+    With refresh incremental runs refresh the serialized model instead of searching a new one, see RefreshConfig.
+    With the processes executor task results stay in the workers and the features matrix is always shared through a
+    memory mapped file, so the mapped model_generation_task runs only receive the file paths.
+    """
+    if executor == "processes" and profiler:
+        raise ValueError("Task profiling needs the sequential or threads executor, the processes one runs the tasks "
+                         "in other processes")
+    if executor == "processes" and etl_backend == "polars":
+        raise ValueError("Polars lazy frames can't be sent to other processes, use the sequential or threads executor")
+    parameters = parameters_definition(columnar)
+    if training_table_path:
+        flow = incremental_flow_definition("milk_price_incremental_flow", search, refresh)
+        parameters["training_table_path"] = training_table_path
+    else:
+        flow = flow_definition("milk_price_flow", search, bank_chunk_size)
+    flow_runs_executor = flow_executor(executor, workers, threads_per_worker)
+    if profiler:
+        profiler.start(flow=flow.name, executor=type(flow_runs_executor).__name__,
+                       workers=1 if executor == "sequential" else workers,
+                       search_strategy=search.strategy if search else "grid")
+    share_datasets = bool(search and search.feature_subsets) or executor == "processes"
+    with tempfile.TemporaryDirectory() as shared_dataset_dir:
+        state = flow.run(
+            parameters=parameters,
+            executor=flow_runs_executor,
+            runner_cls=ProfilingFlowRunner if profiler else None,
+            context={"etl_cache": etl_cache, "compact_dtypes": compact_dtypes, "task_profiler": profiler,
+                     "etl_backend": etl_backend,
+                     "shared_dataset_dir": shared_dataset_dir if share_datasets else None}
+        )
+    if profiler:
+        profiler.stop()
     return state
 
 
 @click.command()
-@click.option("-p", "--parallel", type=bool, default=False, show_default=True,
-              help="Boolean flag to run the pipeline in parallel")
+@click.option("-e", "--executor", type=click.Choice(list(EXECUTORS)), default="threads", show_default=True,
+              help="Run tasks one at a time, in a pool of threads or in a local dask cluster of processes")
 @click.option("-w", "--workers", type=int, default=4, show_default=True,
-              help="Number of workers to be used in parallel execution")
-def run_pipeline_command(parallel: bool, workers: int) -> state:
+              help="Number of threads or processes of the threads and processes executors")
+@click.option("--threads-per-worker", type=int, default=1, show_default=True,
+              help="Threads of every process of the processes executor")
+@click.option("-s", "--search-strategy", type=click.Choice(list(SEARCH_STRATEGIES)), default="grid",
+              show_default=True, help="Hyper parameters search strategy, cached_grid and ridge_path select features "
+                                      "with a seeded mutual information and can select another model than grid")
+@click.option("-j", "--search-jobs", type=int, default=1, show_default=True,
+              help="Number of processes used to evaluate search candidates")
+@click.option("--search-cache-dir", type=str, default=None,
+              help="Directory to cache fitted transformers during the search, by default a temporary one")
+@click.option("--search-iter", type=int, default=30, show_default=True,
+              help="Number of sampled candidates for the random search strategy")
+@click.option("--search-max-cost", type=float, default=None,
+              help="Skip candidates whose estimated cost is over this number of millions of operations, halving "
+                   "and random strategies skip them before the search")
+@click.option("--halving-factor", type=int, default=3, show_default=True,
+              help="Successive halving keeps 1 / factor candidates on each iteration")
+@click.option("--feature-subsets", is_flag=True, default=False,
+              help="Train a model for every feature group (without precipitations, by region, PIB only, ...) "
+                   "and keep the best one")
+@click.option("--cache/--no-cache", default=True, show_default=True,
+              help="Reuse etl results of previous runs when inputs and code didn't change")
+@click.option("--clear-cache", is_flag=True, default=False, help="Remove all cached etl results before running")
+@click.option("--cache-dir", type=str, default=".etl_cache", show_default=True, help="Directory of the etl cache")
+@click.option("--cache-size-mb", type=int, default=512, show_default=True,
+              help="Maximum size of the etl cache, least recently used results are removed")
+@click.option("--columnar", is_flag=True, default=False,
+              help="Read the feather files generated by ingest.py instead of the csv files")
+@click.option("--incremental", is_flag=True, default=False,
+              help="Only process months newer than the training table of previous runs and update it")
+@click.option("--training-table-path", type=str, default="./data/training_table.pkl", show_default=True,
+              help="Training table updated by incremental runs")
+@click.option("--refresh", is_flag=True, default=False,
+              help="Incremental run that refreshes the serialized model with the new months keeping its hyper "
+                   "parameters, the search only runs on drift or when the last one is too old")
+@click.option("--drift-threshold", type=float, default=0.2, show_default=True,
+              help="Run the search with --refresh when the r2 of the refreshed months is lower than the r2 of the "
+                   "last search minus this threshold")
+@click.option("--full-search-days", type=float, default=30, show_default=True,
+              help="Run the search with --refresh when the last one is older than this number of days")
+@click.option("--bank-chunk-size", type=int, default=None,
+              help="Stream the central bank file in chunks of this number of rows, for files that don't fit in memory")
+@click.option("--etl-backend", type=click.Choice(list(ETL_BACKENDS)), default="pandas", show_default=True,
+              help="Dataframe engine of the etl, polars runs it as one lazy multi-threaded query without the etl cache")
+@click.option("--compact-dtypes", is_flag=True, default=False,
+              help="Store etl results with downcast integers and float32 values to reduce memory")
+@click.option("--profile-report", type=str, default=None,
+              help="Json file to write the time, cpu time, peak memory and input and output shapes of every task")
+@click.option("--profile-dir", type=str, default=None,
+              help="Directory to write a cProfile dump of every task run, it needs --profile-report")
+def run_pipeline_command(executor: str, workers: int, threads_per_worker: int, search_strategy: str, search_jobs: int,
+                         search_cache_dir: Optional[str], search_iter: int, search_max_cost: Optional[float],
+                         halving_factor: int,
+                         feature_subsets: bool, cache: bool,
+                         clear_cache: bool, cache_dir: str, cache_size_mb: int, columnar: bool, incremental: bool,
+                         training_table_path: str, refresh: bool, drift_threshold: float,
+                         full_search_days: float, bank_chunk_size: Optional[int], etl_backend: str,
+                         compact_dtypes: bool, profile_report: Optional[str], profile_dir: Optional[str]) -> state:
     """
     Pipeline execution to train milk price model.
     """
     logger = prefect.context.get("logger")
+    search = SearchConfig(strategy=search_strategy, n_jobs=search_jobs, cache_dir=search_cache_dir,
+                          n_iter=search_iter, factor=halving_factor, feature_subsets=feature_subsets,
+                          max_cost=search_max_cost)
+    etl_cache = None
+    if cache or clear_cache:
+        etl_cache = EtlCache(cache_dir, max_bytes=cache_size_mb * 1024 ** 2)
+        if clear_cache:
+            etl_cache.clear()
+            logger.info(f"Etl cache {cache_dir} cleared")
+    profiler = TaskProfiler(profile_dir) if profile_report else None
     start = time.perf_counter()
-    state = run_pipeline(parallel, workers)
+    state = run_pipeline(executor, workers, search, etl_cache if cache else None, columnar,
+                         training_table_path if incremental or refresh else None, bank_chunk_size, compact_dtypes,
+                         profiler, etl_backend, threads_per_worker,
+                         RefreshConfig(drift_threshold, full_search_days) if refresh else None)
     end = time.perf_counter()
     logger.info(f"Pipeline execution time: {end - start}")
+    if profiler:
+        profiler.save(profile_report)
+        logger.info(f"Profile report saved on {profile_report}, hot task: {profiler.report()['hot_task']}")
+    # with the processes executor the cache is used by copies in the workers
+    if cache and executor != "processes":
+        logger.info(f"Etl cache hits: {etl_cache.hits}, misses: {etl_cache.misses}")
     return state
 
 
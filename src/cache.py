@@ -0,0 +1,163 @@
+import os
+import glob
+import pickle
+import hashlib
+import importlib
+import tempfile
+import threading
+import prefect
+import pandas as pd
+from pathlib import Path
+from typing import Any, Callable, Optional
+from src import __version__
+
+# modules whose source is part of the key of every cached etl result
+ETL_CODE_MODULES = ["src.preprocess", "src.utils"]
+
+
+def etl_code_version() -> str:
+    """Hash of the package version and the source code of the etl modules"""
+    digest = hashlib.sha256(__version__.encode())
+    for name in ETL_CODE_MODULES:
+        module = importlib.import_module(name)
+        path = Path(module.__file__)
+        files = sorted(path.parent.glob("*.py")) if path.name == "__init__.py" else [path]
+        for file in files:
+            digest.update(file.read_bytes())
+    return digest.hexdigest()
+
+
+def update_hash(digest, value: Any) -> None:
+    """
+    Adds a task input to the hash: files are hashed by content, dataframes by values, index, columns and dtypes.
+    """
+    if isinstance(value, pd.DataFrame):
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        digest.update(repr((list(value.columns), list(value.dtypes))).encode())
+    elif isinstance(value, pd.Series):
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        digest.update(repr((value.name, value.dtype)).encode())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            update_hash(digest, item)
+    elif isinstance(value, str) and os.path.isfile(value):
+        with open(value, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+    else:
+        digest.update(repr(value).encode())
+
+
+def remove_file(path: str) -> None:
+    """Removes a file that can be already removed by another task"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class EtlCache:
+    """
+    Disk cache of etl results keyed by the content of the task inputs, the task name and the etl code version,
+    then any change of input files, upstream results or code is a cache miss.
+    Results are stored with pickle, the least recently used ones are removed when the cache is bigger than max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.code_version = etl_code_version()
+        self.hits = 0
+        self.misses = 0
+        # tasks of the threads executor update the stats concurrently
+        self._stats_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __getstate__(self) -> dict:
+        # the processes executor sends the cache to its workers, every copy has its own lock
+        state = self.__dict__.copy()
+        del state["_stats_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._stats_lock = threading.Lock()
+
+    def key(self, name: str, *args) -> str:
+        digest = hashlib.sha256(f"{name}:{self.code_version}".encode())
+        update_hash(digest, args)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                value = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        # modification time is the last access time for the lru eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        # written to a temporary file and renamed then readers never see a partial result
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(file_descriptor, "wb") as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self._path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        """Tasks of the threads executor evict concurrently, files removed by another task are skipped"""
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*.pkl")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            remove_file(path)
+            total -= size
+
+    def clear(self) -> None:
+        for path in glob.glob(os.path.join(self.cache_dir, "*.pkl")):
+            remove_file(path)
+
+    def cached(self, name: str, function: Callable, *args) -> Any:
+        """Returns the cached result of function(*args) or computes and stores it"""
+        logger = prefect.context.get("logger")
+        key = self.key(name, *args)
+        value = self.get(key)
+        if value is not None:
+            with self._stats_lock:
+                self.hits += 1
+            logger.info(f"{name} result loaded from etl cache")
+            return value
+        with self._stats_lock:
+            self.misses += 1
+        value = function(*args)
+        self.put(key, value)
+        return value
+
+
+def run_cached(function: Callable, *args) -> Any:
+    """
+    Runs an etl function through the EtlCache set in prefect context as etl_cache, without it the function is
+    always executed.
+    """
+    cache = prefect.context.get("etl_cache")
+    if cache is None:
+        return function(*args)
+    return cache.cached(prefect.context.get("task_name", function.__name__), function, *args)
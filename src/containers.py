@@ -1,11 +1,102 @@
+import numpy as np
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 from sklearn.model_selection import GridSearchCV
 
 
+@dataclass
+class RidgeStatistics:
+    """
+    Sufficient statistics of the Ridge step of a fitted pipeline, the rows are its polynomial features with the
+    scaler and selector kept fixed. Together with alpha they solve the Ridge coefficients without the rows.
+    n_rows: number of rows
+    feature_mean: mean of every polynomial feature
+    target_mean: mean of the target
+    gram: centered Gram matrix of the polynomial features
+    xty: centered polynomial features times the centered target
+    features: training table columns used by the pipeline
+    baseline_r2: holdout r2 of the last full search
+    searched_at: unix time of the last full search
+    high_water_mark: period key of the last month in the statistics, see incremental.high_water_mark
+    refreshes: number of refreshes since the last full search
+    scored_rows, scored_sse, scored_target_mean, scored_target_scatter: errors of the predictions of refreshed rows
+                                                                        before they were added, to compute their r2
+    """
+    n_rows: int
+    feature_mean: np.ndarray
+    target_mean: float
+    gram: np.ndarray
+    xty: np.ndarray
+    features: List[str]
+    baseline_r2: float
+    searched_at: float = 0.0
+    high_water_mark: int = -1
+    refreshes: int = 0
+    scored_rows: int = 0
+    scored_sse: float = 0.0
+    scored_target_mean: float = 0.0
+    scored_target_scatter: float = 0.0
+
+
 @dataclass
 class Model:
+    """
+    statistics: sufficient statistics of the best estimator to refresh it with new rows, None when its polynomial
+                features are too many to store their Gram matrix
+    """
     model: GridSearchCV
     rmse: float
     r2: float
     features: List[str]
+    statistics: Optional[RidgeStatistics] = None
+
+
+@dataclass
+class SearchConfig:
+    """
+    Hyper parameters search options.
+    strategy: name of a strategy registered in model.SEARCH_STRATEGIES
+    n_jobs: number of processes used to evaluate candidates
+    cache_dir: directory to cache fitted transformers, a temporary one is used when it's None
+    n_iter: number of sampled candidates for budgeted strategies
+    factor: proportion of candidates kept on each successive halving iteration is 1 / factor
+    feature_subsets: train a model for every feature subset of model.generate_feature_subsets instead of
+                     only with all features
+    max_cost: strategies skip candidates whose estimated cost, in millions of operations, is over it,
+              see search.estimate_candidate_cost
+    """
+    strategy: str = "grid"
+    n_jobs: int = 1
+    cache_dir: Optional[str] = None
+    n_iter: int = 30
+    factor: int = 3
+    feature_subsets: bool = False
+    max_cost: Optional[float] = None
+
+
+@dataclass
+class RefreshConfig:
+    """
+    Model refresh options.
+    drift_threshold: a full search runs when the r2 of the refreshed rows is lower than the r2 of the last full
+                     search minus drift_threshold
+    full_search_days: a full search runs when the last one is older than this number of days
+    """
+    drift_threshold: float = 0.2
+    full_search_days: float = 30
+
+
+@dataclass
+class SharedDataset:
+    """
+    Feature subset of a design matrix stored once in a .npy file, workers load it memory mapped
+    by column positions instead of receiving a copy of the data.
+    features_path: fortran ordered .npy file with all features
+    target_path: .npy file with the target
+    columns: names of the features_path columns
+    features: positions of the subset features in features_path
+    """
+    features_path: str
+    target_path: str
+    columns: List[str]
+    features: List[int]
@@ -0,0 +1,77 @@
+import numpy as np
+from dataclasses import dataclass
+
+
+@dataclass
+class CompiledPipeline:
+    """
+    Fitted StandardScaler -> SelectKBest -> PolynomialFeatures -> Ridge pipeline reduced to its arrays.
+    Only numpy is needed to predict, in this way the api doesn't have to import sklearn.
+    Scaler statistics are stored already restricted to the selected columns.
+    """
+    mean: np.ndarray
+    scale: np.ndarray
+    selected: np.ndarray
+    powers: np.ndarray
+    coef: np.ndarray
+    intercept: np.ndarray
+    n_features_in: int
+
+    def predict(self, x) -> np.ndarray:
+        """
+        Predicts in a single vectorized pass:
+        select columns -> standardize -> polynomial expansion -> linear model.
+        :param x: array like of shape (n_samples, n_features_in).
+        :return: predictions with shape (n_samples,)
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if x.ndim != 2 or x.shape[1] != self.n_features_in:
+            raise ValueError(f"Expected input with shape (n, {self.n_features_in}), got {x.shape}")
+        z = (x[:, self.selected] - self.mean) / self.scale
+        # z_powers[:, j, d] = z[:, j] ** d, every polynomial term is a product of these
+        z_powers = z[:, :, np.newaxis] ** np.arange(self.powers.max() + 1)
+        poly = np.ones((z.shape[0], self.powers.shape[0]))
+        for column in range(self.powers.shape[1]):
+            poly *= z_powers[:, column, self.powers[:, column]]
+        return poly @ self.coef + self.intercept
+
+
+def compile_pipeline(pipeline) -> CompiledPipeline:
+    """
+    Extracts the fitted arrays from a pipeline defined by model.model_pipeline_definition.
+    :param pipeline: fitted sklearn pipeline, usually GridSearchCV.best_estimator_
+    :return: CompiledPipeline with the same predictions
+    """
+    scaler = pipeline.named_steps["scale"]
+    selector = pipeline.named_steps["selector"]
+    poly = pipeline.named_steps["poly"]
+    ridge = pipeline.named_steps["model"]
+
+    selected = selector.get_support(indices=True)
+    n_features_in = scaler.n_features_in_
+    mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(n_features_in)
+    scale = scaler.scale_ if scaler.scale_ is not None else np.ones(n_features_in)
+    return CompiledPipeline(mean=np.asarray(mean[selected], dtype=np.float64),
+                            scale=np.asarray(scale[selected], dtype=np.float64),
+                            selected=np.asarray(selected, dtype=np.intp),
+                            powers=np.asarray(poly.powers_, dtype=np.intp),
+                            coef=np.asarray(ridge.coef_, dtype=np.float64).T,
+                            intercept=np.asarray(ridge.intercept_, dtype=np.float64),
+                            n_features_in=int(n_features_in))
+
+
+def save_compiled_pipeline(compiled: CompiledPipeline, path: str) -> None:
+    np.savez(path, mean=compiled.mean, scale=compiled.scale, selected=compiled.selected,
+             powers=compiled.powers, coef=compiled.coef, intercept=compiled.intercept,
+             n_features_in=compiled.n_features_in)
+
+
+def load_compiled_pipeline(path: str) -> CompiledPipeline:
+    with np.load(path, allow_pickle=False) as artifact:
+        return CompiledPipeline(mean=artifact["mean"],
+                                scale=artifact["scale"],
+                                selected=artifact["selected"],
+                                powers=artifact["powers"],
+                                coef=artifact["coef"],
+                                intercept=artifact["intercept"],
+                                n_features_in=int(artifact["n_features_in"]))
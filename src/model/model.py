@@ -1,20 +1,33 @@
 import os
 import joblib
 import json
+import time
+import tempfile
+import uuid
 import prefect
 import pandas as pd
 import numpy as np
-from typing import List, Tuple
+from typing import List, Tuple, Optional, Union
 from sklearn.model_selection import train_test_split
-from sklearn.model_selection import GridSearchCV
+from sklearn.model_selection import GridSearchCV, RandomizedSearchCV
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 required to import HalvingGridSearchCV
+from sklearn.model_selection import HalvingGridSearchCV
 from sklearn.preprocessing import StandardScaler, PolynomialFeatures
 from sklearn.pipeline import Pipeline
+from sklearn.base import clone
 from sklearn.linear_model import Ridge
 from sklearn.metrics import mean_squared_error, r2_score
 from sklearn.feature_selection import SelectKBest, mutual_info_regression
-from src.containers import Model
+from scipy.stats import spearmanr
+from src.containers import Model, SearchConfig, SharedDataset
+from src.constants import REGIONES
+from src.model.search import RidgePathSearchCV, CostAwareGridSearchCV, affordable_grid
+from src.model.refresh import ridge_statistics
 from src import __version__
 
+# integers up to 2^24 are exact in float32
+FLOAT32_MAX_INTEGER = 2 ** 24
+
 np.random.seed(0)
 
 
@@ -32,6 +45,14 @@ def model_pipeline_definition() -> Pipeline:
     return pipe
 
 
+def seeded_mutual_info_regression(x, y):
+    """
+    mutual_info_regression adds a small noise to the data using the global random state,
+    with a fixed seed the scores only depend on the data then they can be cached and computed in any process.
+    """
+    return mutual_info_regression(x, y, random_state=0)
+
+
 # TODO: this grid can be loaded from a config file using a pipeline parameter for easier experimentation
 def grid_definition() -> dict:
     grid = {"selector__k": [3, 4, 5, 6, 7, 10],
@@ -42,25 +63,314 @@ def grid_definition() -> dict:
     return grid
 
 
-def hyperparameter_tuning(model_pipeline: Pipeline, x_train: pd.DataFrame, y_train: pd.DataFrame,
-                          grid: dict) -> GridSearchCV:
-    grid = GridSearchCV(estimator=model_pipeline,
-                        param_grid=grid,
-                        cv=3,
-                        scoring='r2')
+def grid_search(model_pipeline: Pipeline, x_train: pd.DataFrame, y_train: pd.DataFrame, grid: dict,
+                search: SearchConfig) -> GridSearchCV:
+    """
+    Exhaustive grid search, candidates are evaluated from the most to the least expensive and the ones over
+    search.max_cost are skipped, see CostAwareGridSearchCV.
+    """
+    grid = CostAwareGridSearchCV(estimator=model_pipeline,
+                                 param_grid=grid,
+                                 max_cost=search.max_cost,
+                                 cv=3,
+                                 scoring='r2',
+                                 n_jobs=search.n_jobs)
     grid.fit(x_train, y_train)
     return grid
 
 
-def generate_feature_subsets(df_x: pd.DataFrame) -> List[List[str]]:
-    # The dataset without columns that contains "leche" word doesn't apply then is commented,
-    # but the function to explore more than dataset is available
-    # df_x_cols_filtered_milk = [column for column in df_x.columns if 'leche' not in column]
-    df_x_cols_all = df_x.columns
-    return [df_x_cols_all]
+def cached_grid_search(model_pipeline: Pipeline, x_train: pd.DataFrame, y_train: pd.DataFrame, grid: dict,
+                       search: SearchConfig) -> GridSearchCV:
+    """
+    Exhaustive grid search running candidates in a pool of search.n_jobs processes.
+    Fitted transformers are cached on disk, scaler and selector only depend on the fold and selector__k
+    then they are fitted once and reused by every model__alpha and poly__degree combination.
+    Selector scores use seeded_mutual_info_regression in order to be cacheable while grid_search draws a different
+    noise on every fit, then the selected features and the best model can be different: on the bundled data it
+    selects selector__k=5 with a test r2 of 0.69 and grid_search selector__k=3 with 0.74.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        memory = joblib.Memory(location=search.cache_dir or temp_dir, verbose=0)
+        cached_pipeline = clone(model_pipeline).set_params(memory=memory,
+                                                           selector__score_func=seeded_mutual_info_regression)
+        grid = grid_search(cached_pipeline, x_train, y_train, grid, search)
+    # cache and scores function are only used on fit, serialized models keep the default pipeline definition
+    grid.best_estimator_.set_params(memory=None, selector__score_func=mutual_info_regression)
+    return grid
+
+
+def ridge_path_search(model_pipeline: Pipeline, x_train: pd.DataFrame, y_train: pd.DataFrame, grid: dict,
+                      search: SearchConfig) -> RidgePathSearchCV:
+    """
+    Exhaustive search where polynomial features are expanded and factorized once per fold, selector__k and
+    poly__degree and every model__alpha is solved from that factorization, see RidgePathSearchCV.
+    It uses the same seeded selector than cached_grid_search and gives the same scores, then it can select
+    another model than grid_search, see cached_grid_search.
+    """
+    seeded_pipeline = clone(model_pipeline).set_params(selector__score_func=seeded_mutual_info_regression)
+    grid = RidgePathSearchCV(seeded_pipeline, grid, cv=3, n_jobs=search.n_jobs,
+                             max_cost=search.max_cost).fit(x_train, y_train)
+    grid.best_estimator_.set_params(selector__score_func=mutual_info_regression)
+    return grid
+
+
+def halving_search(model_pipeline: Pipeline, x_train: pd.DataFrame, y_train: pd.DataFrame, grid: dict,
+                   search: SearchConfig) -> HalvingGridSearchCV:
+    """
+    Successive halving: all candidates are evaluated with few samples and only the best 1 / search.factor
+    of them are evaluated again with search.factor times more samples until the whole train data is used.
+    Candidates over search.max_cost are skipped, see affordable_grid.
+    """
+    grid = HalvingGridSearchCV(estimator=model_pipeline,
+                               param_grid=affordable_grid(grid, *x_train.shape, 3, search.max_cost),
+                               cv=3,
+                               scoring='r2',
+                               factor=search.factor,
+                               random_state=0,
+                               n_jobs=search.n_jobs)
+    grid.fit(x_train, y_train)
+    return grid
+
+
+def random_search(model_pipeline: Pipeline, x_train: pd.DataFrame, y_train: pd.DataFrame, grid: dict,
+                  search: SearchConfig) -> RandomizedSearchCV:
+    """
+    Budgeted search evaluating search.n_iter candidates sampled from the grid, candidates over search.max_cost are
+    skipped before sampling, see affordable_grid.
+    """
+    grid = RandomizedSearchCV(estimator=model_pipeline,
+                              param_distributions=affordable_grid(grid, *x_train.shape, 3, search.max_cost),
+                              n_iter=search.n_iter,
+                              cv=3,
+                              scoring='r2',
+                              random_state=0,
+                              n_jobs=search.n_jobs)
+    grid.fit(x_train, y_train)
+    return grid
+
+
+SEARCH_STRATEGIES = {
+    "grid": grid_search,
+    "cached_grid": cached_grid_search,
+    "ridge_path": ridge_path_search,
+    "halving": halving_search,
+    "random": random_search,
+}
+
+
+def hyperparameter_tuning(model_pipeline: Pipeline, x_train: pd.DataFrame, y_train: pd.DataFrame,
+                          grid: dict, search: Optional[SearchConfig] = None) -> GridSearchCV:
+    """
+    Runs the hyper parameters search selected by search.strategy.
+    The returned search object also has the search wall time in search_time_ and the time needed to reach
+    its best score evaluating candidates sequentially in time_to_best_, both in seconds.
+    """
+    search = search or SearchConfig()
+    if search.strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"Unknown search strategy {search.strategy}, available: {list(SEARCH_STRATEGIES)}")
+    start = time.perf_counter()
+    grid = SEARCH_STRATEGIES[search.strategy](model_pipeline, x_train, y_train, grid, search)
+    grid.search_time_ = time.perf_counter() - start
+    grid.time_to_best_ = time_to_best_score(grid)
+    return grid
+
+
+def time_to_best_score(grid) -> float:
+    """
+    Sum of fit and score times of every candidate evaluated up to the best one, in evaluation order. Cost aware
+    searches keep cv_results_ in grid order and their evaluation order in evaluation_order_, other searches store
+    results in evaluation order.
+    """
+    results = grid.cv_results_
+    candidate_times = (np.asarray(results["mean_fit_time"]) + np.asarray(results["mean_score_time"])) * grid.n_splits_
+    order = list(getattr(grid, "evaluation_order_", range(len(candidate_times))))
+    return float(candidate_times[order[:order.index(grid.best_index_) + 1]].sum())
+
+
+def candidate_timings(grid) -> List[dict]:
+    """
+    Estimated cost, in millions of operations, and fit and score times in seconds of every candidate of a cost aware
+    search, in grid order as cv_results_.
+    """
+    results = grid.cv_results_
+    return [{"params": params, "estimated_cost": float(cost),
+             "fit_time": float(fit_time) * grid.n_splits_, "score_time": float(score_time) * grid.n_splits_}
+            for params, cost, fit_time, score_time in zip(results["params"], grid.estimated_costs_,
+                                                          results["mean_fit_time"], results["mean_score_time"])]
 
 
-def model_generation(data: Tuple[pd.DataFrame, pd.DataFrame], test_size: float) -> Model:
+def search_report(grid, strategy: str) -> dict:
+    """
+    Search times and best candidate. Cost aware searches also report the candidates skipped by the budget and
+    the rank correlation between estimated costs and measured times to check the cost model.
+    """
+    report = {"strategy": strategy,
+              "candidates": len(grid.cv_results_["params"]),
+              "search_time": grid.search_time_,
+              "time_to_best": grid.time_to_best_,
+              "best_score": float(grid.best_score_),
+              "best_params": grid.best_params_}
+    if hasattr(grid, "estimated_costs_"):
+        timings = candidate_timings(grid)
+        costs = [timing["estimated_cost"] for timing in timings]
+        times = [timing["fit_time"] + timing["score_time"] for timing in timings]
+        report["skipped_candidates"] = len(grid.skipped_candidates_)
+        report["cost_time_correlation"] = float(spearmanr(costs, times)[0]) if len(timings) > 1 else None
+    return report
+
+
+def compare_search_strategies(x_train: pd.DataFrame, y_train: pd.DataFrame, strategies: List[str],
+                              search: Optional[SearchConfig] = None, x_test: Optional[pd.DataFrame] = None,
+                              y_test: Optional[pd.Series] = None) -> List[dict]:
+    """
+    Runs every strategy on the same data and reports its search time and time to best score,
+    the reference for time comparisons is the exhaustive grid strategy. Strategies can select another model than
+    grid, cached_grid and ridge_path select features with a seeded mutual information, then with test data the
+    rmse and r2 of the selected model are reported too.
+    :param x_train: train features.
+    :param y_train: train target.
+    :param strategies: names of SEARCH_STRATEGIES to compare.
+    :param search: other search options shared by all strategies.
+    :param x_test: test features to evaluate the model selected by every strategy.
+    :param y_test: test target.
+    :return: a report by strategy.
+    """
+    search = search or SearchConfig()
+    grid = grid_definition()
+    reports = []
+    for strategy in strategies:
+        strategy_search = SearchConfig(**{**search.__dict__, "strategy": strategy})
+        result = hyperparameter_tuning(model_pipeline_definition(), x_train, y_train, grid, strategy_search)
+        report = search_report(result, strategy)
+        if x_test is not None:
+            report["test_rmse"], report["test_r2"] = model_evaluation(y_test, result.predict(x_test))
+        reports.append(report)
+    reference = next((report for report in reports if report["strategy"] == "grid"), None)
+    if reference:
+        for report in reports:
+            report["search_time_vs_grid"] = report["search_time"] / reference["search_time"]
+            report["time_to_best_vs_grid"] = report["time_to_best"] / reference["time_to_best"]
+            report["same_params_as_grid"] = report["best_params"] == reference["best_params"]
+    return reports
+
+
+def generate_feature_subsets(df_x: pd.DataFrame, all_subsets: bool = False) -> List[List[str]]:
+    """
+    Feature subsets to train a model with each one, by default only all features.
+    With all_subsets these groups are also explored, repeated or empty subsets are removed:
+    - without milk columns
+    - without precipitations, and all features with the precipitations of a single region
+    - calendar features with PIB, with Imacec and with precipitations
+    :param df_x: features dataframe, only its columns are used.
+    :param all_subsets: explore all feature groups.
+    :return: list of features for every subset.
+    """
+    df_x_cols_all = list(df_x.columns)
+    if not all_subsets:
+        return [df_x_cols_all]
+    calendar = [column for column in df_x_cols_all if column in ['ano', 'mes']]
+    regions = [column for column in df_x_cols_all if column in REGIONES]
+    pib = [column for column in df_x_cols_all if 'PIB' in column]
+    imacec = [column for column in df_x_cols_all if 'Imacec' in column or column == 'num']
+    without_regions = [column for column in df_x_cols_all if column not in regions]
+    subsets = [df_x_cols_all,
+               [column for column in df_x_cols_all if 'leche' not in column],
+               without_regions]
+    subsets += [[column for column in df_x_cols_all if column not in regions or column == region] for region in regions]
+    subsets += [calendar + pib, calendar + imacec, calendar + regions]
+    unique_subsets = []
+    for subset in subsets:
+        if subset and subset not in unique_subsets:
+            unique_subsets.append(subset)
+    return unique_subsets
+
+
+def feature_matrix_dtype(df: pd.DataFrame, columns: List[str]) -> type:
+    """
+    float32 when float columns are float32 as compact_dtypes stores them and every integer value is exact in float32,
+    float64 otherwise. PIB columns have values up to 10^9 that float32 would round.
+    """
+    dtypes = df.dtypes[columns]
+    float_dtypes = {dtype for dtype in dtypes if pd.api.types.is_float_dtype(dtype)}
+    if float_dtypes != {np.dtype('float32')}:
+        return np.float64
+    integer_columns = [column for column, dtype in dtypes.items() if pd.api.types.is_integer_dtype(dtype)]
+    if integer_columns and df[integer_columns].abs().to_numpy().max(initial=0) > FLOAT32_MAX_INTEGER:
+        return np.float64
+    return np.float32
+
+
+def feature_matrix(df: pd.DataFrame, columns: List[str], path: Optional[str] = None) -> np.ndarray:
+    """
+    Copies the columns into a single fortran ordered matrix with the dtype of feature_matrix_dtype. Every column is
+    contiguous in memory.
+    :param df: training table.
+    :param columns: columns of the matrix.
+    :param path: .npy file to write the matrix as a memory mapped array, by default it's kept in memory.
+    :return: the features matrix.
+    """
+    dtype = feature_matrix_dtype(df, columns)
+    if path:
+        matrix = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(len(df), len(columns)),
+                                           fortran_order=True)
+    else:
+        matrix = np.empty((len(df), len(columns)), dtype=dtype, order='F')
+    for index, column in enumerate(columns):
+        matrix[:, index] = df[column].to_numpy()
+    return matrix
+
+
+def subset_view(matrix: np.ndarray, positions: List[int]) -> np.ndarray:
+    """Columns of the matrix at positions, consecutive columns are a view and other subsets a copy"""
+    if positions == list(range(positions[0], positions[-1] + 1)):
+        return matrix[:, positions[0]:positions[-1] + 1]
+    return matrix[:, positions]
+
+
+def generate_datasets(df: pd.DataFrame, target: str = 'Precio_leche', all_subsets: bool = False,
+                      shared_dir: Optional[str] = None) -> List[Union[Tuple[pd.DataFrame, pd.Series], SharedDataset]]:
+    """
+    Datasets for every feature subset of generate_feature_subsets, features are copied once into a single matrix.
+    In memory subsets of consecutive columns are views over it, other subsets are copied.
+    With shared_dir the matrix is written once to a .npy file in that directory and every subset is a SharedDataset,
+    workers load their columns with load_shared_dataset.
+    :param df: training table.
+    :param target: target column.
+    :param all_subsets: explore all feature groups of generate_feature_subsets.
+    :param shared_dir: directory to store the features matrix.
+    :return: features and target or a SharedDataset for every feature subset.
+    """
+    columns = [column for column in df.columns if column != target]
+    # feature subsets only depend on the columns
+    features_search = generate_feature_subsets(pd.DataFrame(columns=columns), all_subsets)
+    if shared_dir:
+        dataset_id = uuid.uuid4().hex
+        features_path = os.path.join(shared_dir, f"features-{dataset_id}.npy")
+        target_path = os.path.join(shared_dir, f"target-{dataset_id}.npy")
+        feature_matrix(df, columns, features_path).flush()
+        np.save(target_path, df[target].to_numpy())
+        return [SharedDataset(features_path=features_path, target_path=target_path, columns=columns,
+                              features=[columns.index(feature) for feature in features])
+                for features in features_search]
+    matrix = feature_matrix(df, columns)
+    df_y = df[target]
+    datasets = []
+    for features in features_search:
+        values = subset_view(matrix, [columns.index(feature) for feature in features])
+        datasets.append((pd.DataFrame(values, index=df.index, columns=list(features), copy=False), df_y))
+    return datasets
+
+
+def load_shared_dataset(dataset: SharedDataset) -> Tuple[pd.DataFrame, pd.Series]:
+    """Features and target of a SharedDataset, the features file is memory mapped and shared by every subset"""
+    matrix = np.load(dataset.features_path, mmap_mode='r')
+    values = subset_view(matrix, dataset.features)
+    df_x = pd.DataFrame(values, columns=[dataset.columns[index] for index in dataset.features], copy=False)
+    return df_x, pd.Series(np.load(dataset.target_path))
+
+
+def model_generation(data: Tuple[pd.DataFrame, pd.DataFrame], test_size: float,
+                     search: Optional[SearchConfig] = None) -> Model:
     """
     This functions generates a model based on a dataframe.
     Model generations consists in the follow steps:
@@ -68,20 +378,29 @@ def model_generation(data: Tuple[pd.DataFrame, pd.DataFrame], test_size: float)
     - model pipeline definition
     - grid search for hyper parameters tuning
     - model evaluation imputing rms2 and r2
+    - sufficient statistics of the best estimator train rows to refresh it later, see refresh.refresh_model
 
     :param data: dataframe to be used for model generation.
     :param test_size: size of data test.
-    :return: Model dataclass which contains GridSearchCV results, rmse and r2
+    :param search: hyper parameters search options, by default an exhaustive grid search.
+    :return: Model dataclass which contains GridSearchCV results, rmse, r2 and Ridge statistics
     """
     df_x, df_y = data
     x_train, x_test, y_train, y_test = generate_train_test_data(df_x, df_y, test_size)
     grid = grid_definition()
     model = model_pipeline_definition()
-    grid_model = hyperparameter_tuning(model, x_train, y_train, grid)
+    grid_model = hyperparameter_tuning(model, x_train, y_train, grid, search)
+    logger = prefect.context.get("logger")
+    logger.info(f"Search report: {search_report(grid_model, (search or SearchConfig()).strategy)}")
+    if hasattr(grid_model, "estimated_costs_"):
+        [logger.debug(f"Candidate {timing['params']} estimated cost {timing['estimated_cost']:.3f} Mflop, "
+                      f"fit time {timing['fit_time']:.4f}s, score time {timing['score_time']:.4f}s")
+         for timing in candidate_timings(grid_model)]
     y_predicted = grid_model.predict(x_test)
     rmse, r2 = model_evaluation(y_test, y_predicted)
+    statistics = ridge_statistics(grid_model.best_estimator_, x_train, y_train, r2)
 
-    return Model(model=grid_model, rmse=rmse, r2=r2, features=list(x_train.columns))
+    return Model(model=grid_model, rmse=rmse, r2=r2, features=list(x_train.columns), statistics=statistics)
 
 
 def model_evaluation(y_test, y_predicted) -> Tuple[float, float]:
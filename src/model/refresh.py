@@ -0,0 +1,142 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from dataclasses import replace
+from typing import Optional, Tuple
+from sklearn.pipeline import Pipeline
+from src import utils
+from src import __version__
+from src.containers import RefreshConfig, RidgeStatistics
+from src.preprocess.incremental import high_water_mark
+
+# a gram matrix of 4096 polynomial features takes 128MB, bigger models are only updated by full searches
+MAX_STATISTICS_FEATURES = 4096
+# minimum refreshed rows to compare their r2 with the full search one
+DRIFT_MIN_ROWS = 3
+
+
+def statistics_path(save_model_dir: str) -> str:
+    """Statistics of the model artifacts of this version, the api doesn't serve this file"""
+    return os.path.join(save_model_dir, f"pipeline-statistics-{__version__}.npz")
+
+
+def polynomial_features(pipeline: Pipeline, x: pd.DataFrame) -> np.ndarray:
+    """Rows of the Ridge step: scaled, selected and expanded features"""
+    return np.asarray(pipeline[:-1].transform(x), dtype=np.float64)
+
+
+def batch_statistics(phi: np.ndarray, y: np.ndarray) -> Tuple[int, np.ndarray, float, np.ndarray, np.ndarray]:
+    """:return: number of rows, feature means, target mean, centered gram matrix and centered x^T y"""
+    feature_mean, target_mean = phi.mean(axis=0), float(y.mean())
+    centered = phi - feature_mean
+    return phi.shape[0], feature_mean, target_mean, centered.T @ centered, centered.T @ (y - target_mean)
+
+
+def ridge_statistics(pipeline: Pipeline, x: pd.DataFrame, y: pd.Series, baseline_r2: float) -> \
+        Optional[RidgeStatistics]:
+    """
+    Statistics of the rows used to fit the Ridge step of pipeline.
+    :return: None when the polynomial features are more than MAX_STATISTICS_FEATURES.
+    """
+    if pipeline.named_steps["poly"].n_output_features_ > MAX_STATISTICS_FEATURES:
+        return None
+    n_rows, feature_mean, target_mean, gram, xty = batch_statistics(polynomial_features(pipeline, x),
+                                                                    np.asarray(y, dtype=np.float64))
+    return RidgeStatistics(n_rows=n_rows, feature_mean=feature_mean, target_mean=target_mean, gram=gram, xty=xty,
+                           features=list(x.columns), baseline_r2=baseline_r2)
+
+
+def add_rows(statistics: RidgeStatistics, phi: np.ndarray, y: np.ndarray) -> RidgeStatistics:
+    """
+    Merges the statistics of new rows with the pairwise update of means and centered products, it's stable
+    when features have large means unlike accumulating raw sums.
+    """
+    n_new, mean_new, target_mean_new, gram_new, xty_new = batch_statistics(phi, y)
+    n_rows = statistics.n_rows + n_new
+    weight = statistics.n_rows * n_new / n_rows
+    delta, target_delta = mean_new - statistics.feature_mean, target_mean_new - statistics.target_mean
+    return replace(statistics, n_rows=n_rows,
+                   feature_mean=statistics.feature_mean + delta * n_new / n_rows,
+                   target_mean=statistics.target_mean + target_delta * n_new / n_rows,
+                   gram=statistics.gram + gram_new + np.outer(delta, delta) * weight,
+                   xty=statistics.xty + xty_new + delta * target_delta * weight)
+
+
+def solve_ridge(statistics: RidgeStatistics, alpha: float) -> Tuple[np.ndarray, float]:
+    """
+    Coefficients and intercept of Ridge with intercept, the intercept isn't penalized as in sklearn.
+    The constant polynomial column is centered to zero and gets a zero coefficient.
+    """
+    gram = statistics.gram + alpha * np.eye(statistics.gram.shape[0])
+    coef = np.linalg.solve(gram, statistics.xty)
+    return coef, statistics.target_mean - statistics.feature_mean @ coef
+
+
+def score_rows(statistics: RidgeStatistics, y: np.ndarray, predictions: np.ndarray) -> RidgeStatistics:
+    """Adds the errors of predictions of new rows made before adding them"""
+    n_new = len(y)
+    scored_rows = statistics.scored_rows + n_new
+    target_mean_new = float(y.mean())
+    target_delta = target_mean_new - statistics.scored_target_mean
+    return replace(statistics, scored_rows=scored_rows,
+                   scored_sse=statistics.scored_sse + float(((y - predictions) ** 2).sum()),
+                   scored_target_mean=statistics.scored_target_mean + target_delta * n_new / scored_rows,
+                   scored_target_scatter=statistics.scored_target_scatter + float(((y - target_mean_new) ** 2).sum()) +
+                   target_delta ** 2 * statistics.scored_rows * n_new / scored_rows)
+
+
+def scored_r2(statistics: RidgeStatistics) -> Optional[float]:
+    """r2 of the refreshed rows since the last full search, None with less than DRIFT_MIN_ROWS rows"""
+    if statistics.scored_rows < DRIFT_MIN_ROWS or statistics.scored_target_scatter == 0:
+        return None
+    return 1 - statistics.scored_sse / statistics.scored_target_scatter
+
+
+def refresh_model(pipeline: Pipeline, statistics: RidgeStatistics, df: pd.DataFrame,
+                  refresh: Optional[RefreshConfig] = None, target: str = 'Precio_leche',
+                  now: Optional[float] = None) -> Tuple[Optional[RidgeStatistics], str]:
+    """
+    Adds the months of the training table newer than the statistics to the Ridge step of pipeline and solves it
+    again keeping the scaler, selected features, degree and alpha. New rows are predicted before being added and
+    a full search is needed when their r2 drifts or when the last full search is too old.
+    :param pipeline: fitted pipeline, its Ridge coefficients are updated in place.
+    :param statistics: statistics of the pipeline.
+    :param df: training table.
+    :param refresh: refresh options.
+    :param target: target column.
+    :param now: unix time, the current one by default.
+    :return: statistics with the new rows and the reason, or None and the reason when a full search is needed.
+    """
+    refresh = refresh or RefreshConfig()
+    now = time.time() if now is None else now
+    if now - statistics.searched_at > refresh.full_search_days * 24 * 3600:
+        return None, f"last full search is older than {refresh.full_search_days} days"
+    df_new = df[utils.period_key(df['ano'], df['mes']) > statistics.high_water_mark]
+    if df_new.empty:
+        return statistics, "no new months"
+
+    phi = polynomial_features(pipeline, df_new[statistics.features])
+    y = df_new[target].to_numpy(dtype=np.float64)
+    ridge = pipeline.named_steps["model"]
+    statistics = score_rows(statistics, y, phi @ ridge.coef_ + ridge.intercept_)
+    r2 = scored_r2(statistics)
+    if r2 is not None and r2 < statistics.baseline_r2 - refresh.drift_threshold:
+        return None, f"r2 {r2} of {statistics.scored_rows} refreshed rows drifted from {statistics.baseline_r2}"
+
+    statistics = add_rows(statistics, phi, y)
+    ridge.coef_, ridge.intercept_ = solve_ridge(statistics, ridge.alpha)
+    statistics = replace(statistics, high_water_mark=high_water_mark(df), refreshes=statistics.refreshes + 1)
+    return statistics, f"{len(df_new)} rows added"
+
+
+def save_statistics(statistics: RidgeStatistics, path: str) -> None:
+    np.savez(path, **{**statistics.__dict__, "features": np.array(statistics.features, dtype=str)})
+
+
+def load_statistics(path: str) -> RidgeStatistics:
+    with np.load(path, allow_pickle=False) as artifact:
+        values = {name: artifact[name] for name in artifact.files}
+    arrays = {"feature_mean", "gram", "xty"}
+    return RidgeStatistics(**{name: value if name in arrays else value.item() for name, value in values.items()
+                              if name != "features"}, features=values["features"].tolist())
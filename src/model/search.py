@@ -0,0 +1,228 @@
+import time
+import numpy as np
+import pandas as pd
+from math import comb, log2
+from joblib import Parallel, delayed
+from scipy.stats import rankdata
+from typing import List, Optional, Tuple, Union
+from sklearn.base import clone
+from sklearn.metrics import r2_score
+from sklearn.model_selection import GridSearchCV, ParameterGrid, check_cv
+from sklearn.pipeline import Pipeline
+
+
+def estimate_candidate_cost(params: dict, n_samples: int, n_features: int, n_splits: int = 3) -> float:
+    """
+    Estimated cost of evaluating a candidate of model.model_pipeline_definition on every fold, in millions of
+    floating point operations. On a fold with n train rows the k selected features are expanded to
+    p = comb(k + degree, degree) polynomial columns and the ridge fit costs min(n, p)^2 max(n, p) + min(n, p)^3 / 3,
+    the normal equations when p <= n and the kernel ones otherwise. Mutual information selection costs about
+    n log n by feature and it's the same for every candidate.
+    :param params: candidate parameters, selector__k and poly__degree.
+    :param n_samples: rows of the search data.
+    :param n_features: columns of the search data.
+    :param n_splits: cross validation folds.
+    """
+    n_train, n_test = n_samples * (n_splits - 1) / n_splits, n_samples / n_splits
+    k = params.get("selector__k", n_features)
+    k = n_features if k == "all" else min(k, n_features)
+    p = comb(k + params.get("poly__degree", 1), k)
+    small, large = min(n_train, p), max(n_train, p)
+    selection = n_features * n_train * log2(max(n_train, 2))
+    expansion = (n_train + n_test) * p * 2
+    solve = small ** 2 * large + small ** 3 / 3
+    return n_splits * (selection + expansion + solve) / 1e6
+
+
+def schedule_candidates(candidates: List[dict], n_samples: int, n_features: int, n_splits: int,
+                        max_cost: Optional[float] = None, parallel: bool = True) -> Tuple[List[int], np.ndarray]:
+    """
+    Dispatch order of candidates without the ones whose estimated cost is over max_cost. Parallel searches dispatch
+    them from the most to the least expensive, so a pool of workers doesn't wait for a few big fits at the end of
+    the search. Sequential searches keep the grid order, the default selector draws its noise from the global random
+    state and scores depend on the evaluation order.
+    :return: positions of the candidates to evaluate in dispatch order and estimated costs of all candidates.
+    :raises ValueError: when every candidate is over max_cost.
+    """
+    costs = np.array([estimate_candidate_cost(params, n_samples, n_features, n_splits) for params in candidates])
+    order = sorted(range(len(candidates)), key=lambda index: -costs[index]) if parallel else range(len(candidates))
+    scheduled = [index for index in order if max_cost is None or costs[index] <= max_cost]
+    if not scheduled:
+        raise ValueError(f"Every candidate is over the search budget of {max_cost} estimated Mflop, "
+                         f"the cheapest one costs {costs.min()}")
+    return scheduled, costs
+
+
+def affordable_grid(param_grid: dict, n_samples: int, n_features: int, n_splits: int,
+                    max_cost: Optional[float] = None) -> Union[dict, List[dict]]:
+    """
+    Grid of the candidates whose estimated cost isn't over max_cost for searches that don't schedule candidates,
+    as the successive halving and random ones, a list with a single candidate grid by candidate. Halving iterations
+    use fewer samples, the cost with all samples is an upper bound. Without max_cost the grid isn't changed.
+    :raises ValueError: when every candidate is over max_cost.
+    """
+    if max_cost is None:
+        return param_grid
+    candidates = list(ParameterGrid(param_grid))
+    scheduled, _ = schedule_candidates(candidates, n_samples, n_features, n_splits, max_cost, parallel=False)
+    return [{name: [value] for name, value in candidates[index].items()} for index in scheduled]
+
+
+class CostAwareGridSearchCV(GridSearchCV):
+    """
+    GridSearchCV that skips candidates whose cost estimated by estimate_candidate_cost is over max_cost, in millions
+    of operations, and dispatches them from the most to the least expensive when n_jobs isn't 1.
+    cv_results_ keep the grid order, evaluation_order_ has the positions of cv_results_ in dispatch order,
+    estimated_costs_ has the estimated cost of every evaluated candidate and skipped_candidates_ the candidates over
+    the budget.
+    """
+
+    def __init__(self, estimator, param_grid, *, max_cost: Optional[float] = None, scoring=None, n_jobs=None,
+                 refit=True, cv=None, verbose=0, pre_dispatch="2*n_jobs", error_score=np.nan,
+                 return_train_score=False):
+        super().__init__(estimator=estimator, param_grid=param_grid, scoring=scoring, n_jobs=n_jobs, refit=refit,
+                         cv=cv, verbose=verbose, pre_dispatch=pre_dispatch, error_score=error_score,
+                         return_train_score=return_train_score)
+        self.max_cost = max_cost
+
+    def fit(self, x, y=None, **fit_params) -> "CostAwareGridSearchCV":
+        self._search_shape = (np.shape(x)[0], np.shape(x)[1], check_cv(self.cv, y, classifier=False).get_n_splits())
+        super().fit(x, y, **fit_params)
+        # results are stored in dispatch order
+        positions = np.argsort(self._dispatch_order)
+        self.evaluation_order_ = np.argsort(positions)
+        self.cv_results_ = {key: [value[position] for position in positions] if isinstance(value, list)
+                            else value[positions] for key, value in self.cv_results_.items()}
+        if hasattr(self, "best_index_"):
+            self.best_index_ = int(np.flatnonzero(positions == self.best_index_)[0])
+        return self
+
+    def _run_search(self, evaluate_candidates):
+        n_samples, n_features, n_splits = self._search_shape
+        candidates = list(ParameterGrid(self.param_grid))
+        self._dispatch_order, costs = schedule_candidates(candidates, n_samples, n_features, n_splits, self.max_cost,
+                                                          parallel=self.n_jobs not in (None, 1))
+        evaluated = sorted(self._dispatch_order)
+        self.estimated_costs_ = costs[evaluated]
+        self.skipped_candidates_ = [params for index, params in enumerate(candidates) if index not in evaluated]
+        evaluate_candidates([candidates[index] for index in self._dispatch_order])
+
+
+def ridge_path_scores(x_train: np.ndarray, y_train: np.ndarray, x_test: np.ndarray, y_test: np.ndarray,
+                      alphas: List[float]) -> List[float]:
+    """
+    Fits a Ridge model with intercept for every alpha using a single SVD of the centered train data.
+    With X = U S V^T the coefficients are V diag(s / (s^2 + alpha)) U^T y, then every alpha costs
+    a matrix vector product instead of a new fit.
+    :return: r2 score on test data for every alpha, in the same order.
+    """
+    x_offset = x_train.mean(axis=0)
+    y_offset = y_train.mean()
+    u, s, vt = np.linalg.svd(x_train - x_offset, full_matrices=False)
+    uty = u.T @ (y_train - y_offset)
+    scores = []
+    for alpha in alphas:
+        coef = vt.T @ (s / (s ** 2 + alpha) * uty)
+        y_predicted = (x_test - x_offset) @ coef + y_offset
+        scores.append(r2_score(y_test, y_predicted))
+    return scores
+
+
+def poly_path_scores(estimator: Pipeline, z_train: np.ndarray, y_train: np.ndarray, z_test: np.ndarray,
+                     y_test: np.ndarray, degree: int, alphas: List[float]) -> Tuple[List[float], float]:
+    """
+    Expands the selected features once for a degree and scores the whole alpha path on it.
+    :return: scores for every alpha and elapsed time in seconds
+    """
+    start = time.perf_counter()
+    poly = clone(estimator.named_steps["poly"]).set_params(degree=degree).fit(z_train)
+    scores = ridge_path_scores(poly.transform(z_train), y_train, poly.transform(z_test), y_test, alphas)
+    return scores, time.perf_counter() - start
+
+
+class RidgePathSearchCV:
+    """
+    Exhaustive search over selector__k, poly__degree and model__alpha for the pipeline defined by
+    model.model_pipeline_definition that shares the work between candidates:
+    - scaler and selector scores are fitted once per fold
+    - polynomial features are expanded and factorized once per fold, selector__k and poly__degree
+    - all model__alpha values are read from that factorization
+    Scores, ranks and best_params_ are the same as GridSearchCV with scoring r2 given a deterministic selector.
+    The best candidate is refitted on the whole data as GridSearchCV does.
+    Candidates over max_cost are skipped and fold groups are dispatched from the most to the least expensive with
+    several jobs as in CostAwareGridSearchCV.
+    """
+
+    def __init__(self, estimator: Pipeline, param_grid: dict, cv: int = 3, n_jobs: int = 1,
+                 max_cost: Optional[float] = None):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.max_cost = max_cost
+        self.scoring = "r2"
+
+    def _fold_groups(self, x: np.ndarray, y: np.ndarray, train: np.ndarray, test: np.ndarray,
+                     candidates: List[dict]) -> List[Tuple[int, int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        scaler = clone(self.estimator.named_steps["scale"]).fit(x[train])
+        z_train, z_test = scaler.transform(x[train]), scaler.transform(x[test])
+        selector = clone(self.estimator.named_steps["selector"]).set_params(k="all").fit(z_train, y[train])
+        groups = []
+        # groups follow the candidates dispatch order, the cost doesn't depend on alpha
+        for k, degree in dict.fromkeys((params["selector__k"], params["poly__degree"]) for params in candidates):
+            # SelectKBest keeps the k best scores, scores don't depend on k
+            selector.k = k
+            groups.append((k, degree, selector.transform(z_train), y[train], selector.transform(z_test), y[test]))
+        return groups
+
+    def fit(self, x_train: pd.DataFrame, y_train: pd.Series) -> "RidgePathSearchCV":
+        x, y = np.asarray(x_train, dtype=np.float64), np.asarray(y_train, dtype=np.float64)
+        alphas = self.param_grid["model__alpha"]
+        splits = list(check_cv(self.cv, y, classifier=False).split(x, y))
+        grid_candidates = list(ParameterGrid(self.param_grid))
+        dispatch_order, costs = schedule_candidates(grid_candidates, x.shape[0], x.shape[1], len(splits),
+                                                    self.max_cost, parallel=self.n_jobs != 1)
+        evaluated = sorted(dispatch_order)
+        candidates = [grid_candidates[index] for index in evaluated]
+        self.evaluation_order_ = np.searchsorted(evaluated, dispatch_order)
+        self.estimated_costs_ = costs[evaluated]
+        self.skipped_candidates_ = [params for index, params in enumerate(grid_candidates) if index not in evaluated]
+
+        # with several jobs the most expensive groups of every fold are dispatched first
+        fold_groups = [self._fold_groups(x, y, train, test, [grid_candidates[index] for index in dispatch_order])
+                       for train, test in splits]
+        groups = [(fold, fold_groups[fold][index]) for index in range(len(fold_groups[0]))
+                  for fold in range(len(splits))]
+        group_scores = Parallel(n_jobs=self.n_jobs)(
+            delayed(poly_path_scores)(self.estimator, z_train, y_fold_train, z_test, y_fold_test, degree, alphas)
+            for _, (k, degree, z_train, y_fold_train, z_test, y_fold_test) in groups)
+        scores, times = {}, {}
+        for (fold, (k, degree, *_)), (path_scores, elapsed) in zip(groups, group_scores):
+            for alpha, score in zip(alphas, path_scores):
+                scores[(fold, k, degree, alpha)] = score
+                # the group work is shared by its alphas
+                times[(fold, k, degree, alpha)] = elapsed / len(alphas)
+
+        keys = [[(fold, params["selector__k"], params["poly__degree"], params["model__alpha"])
+                 for fold in range(len(splits))] for params in candidates]
+        split_scores = np.array([[scores[key] for key in candidate_keys] for candidate_keys in keys])
+        split_times = np.array([[times[key] for key in candidate_keys] for candidate_keys in keys])
+        mean_scores = split_scores.mean(axis=1)
+        ranks = rankdata(-mean_scores, method="min").astype(np.int32)
+        self.cv_results_ = {"params": candidates,
+                            "mean_fit_time": split_times.mean(axis=1),
+                            "mean_score_time": np.zeros(len(candidates)),
+                            "mean_test_score": mean_scores,
+                            "std_test_score": split_scores.std(axis=1),
+                            "rank_test_score": ranks}
+        for fold in range(len(splits)):
+            self.cv_results_[f"split{fold}_test_score"] = split_scores[:, fold]
+        self.best_index_ = int(ranks.argmin())
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = mean_scores[self.best_index_]
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(x_train, y_train)
+        self.n_splits_ = len(splits)
+        return self
+
+    def predict(self, x) -> np.ndarray:
+        return self.best_estimator_.predict(x)
@@ -1,21 +1,26 @@
 import prefect
 import pandas as pd
+from typing import Tuple
 from prefect import task
+from src.cache import run_cached
+from src.preprocess.dtypes import apply_dtypes_policy
+from src.preprocess.backend import run_etl, frame_shape
 from src.preprocess.preprocess_milk import load_and_preprocess_milk
 from src.preprocess.preprocess_bank import load_and_clean_central_bank_data, process_pib_columns, \
-    process_imacec_columns, process_iv, join_preprocess_bank_data
+    process_imacec_columns, process_iv, join_preprocess_bank_data, load_and_process_central_bank_data_chunked
 from src.preprocess.preprocess_precipitations import load_and_preprocess_precipitations
 from src.preprocess.preprocess import join_precipitations_milk_data, join_preprocess_milk_bank_data
+from src.preprocess.incremental import update_training_table
 
 
 @task
 def load_and_preprocess_precipitations_data_task(file_precipitation_path: str) -> pd.DataFrame:
     logger = prefect.context.get("logger")
     logger.info("Loading and preprocessing precipitations data")
-    data_precipitations = load_and_preprocess_precipitations(file_precipitation_path)
+    data_precipitations = run_etl(load_and_preprocess_precipitations, file_precipitation_path)
     logger.info("Precipitation data loaded and cleaned successfully")
     logger.debug(f"Data columns after load_and_preprocess_precipitations_data_task: {data_precipitations.columns}")
-    logger.debug(f"Data shape after load_and_preprocess_precipitations_data_task: {data_precipitations.shape}")
+    logger.debug(f"Data shape after load_and_preprocess_precipitations_data_task: {frame_shape(data_precipitations)}")
     return data_precipitations
 
 
@@ -23,10 +28,10 @@ def load_and_preprocess_precipitations_data_task(file_precipitation_path: str) -
 def load_and_preprocess_milk_data_task(file_milk_path: str) -> pd.DataFrame:
     logger = prefect.context.get("logger")
     logger.info("Loading and preprocessing milk data")
-    data_milk = load_and_preprocess_milk(file_milk_path)
+    data_milk = run_etl(load_and_preprocess_milk, file_milk_path)
     logger.info("milk data loaded and cleaned successfully")
     logger.debug(f"Data columns after load_and_preprocess_milk_data_task: {data_milk.columns}")
-    logger.debug(f"Data shape after load_and_preprocess_milk_data_task: {data_milk.shape}")
+    logger.debug(f"Data shape after load_and_preprocess_milk_data_task: {frame_shape(data_milk)}")
     return data_milk
 
 
@@ -34,64 +39,89 @@ def load_and_preprocess_milk_data_task(file_milk_path: str) -> pd.DataFrame:
 def load_and_preprocess_central_bank_data_task(file_bank_path: str) -> pd.DataFrame:
     logger = prefect.context.get("logger")
     logger.info("Loading and preprocessing bank data")
-    df = load_and_clean_central_bank_data(file_bank_path)
+    df = run_etl(load_and_clean_central_bank_data, file_bank_path)
     logger.info("bank data loaded and cleaned successfully")
     logger.debug(f"Data columns after load_and_preprocess_central_bank_data_task: {df.columns}")
-    logger.debug(f"Data shape after load_and_preprocess_central_bank_data_task: {df.shape}")
+    logger.debug(f"Data shape after load_and_preprocess_central_bank_data_task: {frame_shape(df)}")
     return df
 
 
+@task(nout=3)
+def load_and_process_central_bank_data_chunked_task(file_bank_path: str, chunk_size: int) -> \
+        Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    logger = prefect.context.get("logger")
+    logger.info(f"Loading and preprocessing bank data in chunks of {chunk_size} rows")
+    df_pib, df_imacec, df_iv = map(apply_dtypes_policy, run_cached(load_and_process_central_bank_data_chunked,
+                                                                   file_bank_path, chunk_size))
+    logger.info("bank data loaded and processed successfully")
+    logger.debug(f"Data shapes after load_and_process_central_bank_data_chunked_task: "
+                 f"{df_pib.shape}, {df_imacec.shape}, {df_iv.shape}")
+    return df_pib, df_imacec, df_iv
+
+
 @task
 def process_pib_columns_task(df: pd.DataFrame) -> pd.DataFrame:
     logger = prefect.context.get("logger")
     logger.info("Preprocessing bank data for pib columns")
-    df = process_pib_columns(df)
+    df = run_etl(process_pib_columns, df)
     logger.info("Bank data preprocessing for pib columns successful")
     logger.debug(f"Data columns after process_pib_columns_task: {df.columns}")
-    logger.debug(f"Data shape after process_pib_columns_task: {df.shape}")
+    logger.debug(f"Data shape after process_pib_columns_task: {frame_shape(df)}")
     return df
 
 
 @task
 def process_imacec_columns_task(df: pd.DataFrame) -> pd.DataFrame:
-    df = process_imacec_columns(df)
+    df = run_etl(process_imacec_columns, df)
     logger = prefect.context.get("logger")
     logger.debug(f"Data columns after process_imacec_columns_task: {df.columns}")
-    logger.debug(f"Data shape after process_imacec_columns_task: {df.shape}")
+    logger.debug(f"Data shape after process_imacec_columns_task: {frame_shape(df)}")
     return df
 
 
 @task
 def process_iv_task(df: pd.DataFrame) -> pd.DataFrame:
-    df = process_iv(df)
+    df = run_etl(process_iv, df)
     logger = prefect.context.get("logger")
     logger.debug(f"Data columns after process_iv_task: {df.columns}")
-    logger.debug(f"Data shape after process_iv_task: {df.shape}")
+    logger.debug(f"Data shape after process_iv_task: {frame_shape(df)}")
     return df
 
 
 @task
 def join_preprocess_bank_data_task(df_pib: pd.DataFrame, df_imacec: pd.DataFrame, df_iv: pd.DataFrame) -> pd.DataFrame:
     logger = prefect.context.get("logger")
-    df_joined = join_preprocess_bank_data(df_pib, df_imacec, df_iv)
+    df_joined = run_etl(join_preprocess_bank_data, df_pib, df_imacec, df_iv)
     logger.debug(f"Data columns after join_preprocess_bank_data_task: {df_joined.columns}")
-    logger.debug(f"Data shape after join_preprocess_bank_data_task: {df_joined.shape}")
+    logger.debug(f"Data shape after join_preprocess_bank_data_task: {frame_shape(df_joined)}")
     return df_joined
 
 
 @task
 def join_precipitations_milk_data_task(df_precipitations: pd.DataFrame, df_milk: pd.DataFrame) -> pd.DataFrame:
     logger = prefect.context.get("logger")
-    df_milk_price_by_pp = join_precipitations_milk_data(df_precipitations, df_milk)
+    df_milk_price_by_pp = run_etl(join_precipitations_milk_data, df_precipitations, df_milk)
     logger.debug(f"Data columns after join_precipitations_milk_data_task: {df_milk_price_by_pp.columns}")
-    logger.debug(f"Data shape after join_precipitations_milk_data_task: {df_milk_price_by_pp.shape}")
+    logger.debug(f"Data shape after join_precipitations_milk_data_task: {frame_shape(df_milk_price_by_pp)}")
     return df_milk_price_by_pp
 
 
 @task
 def join_preprocess_milk_bank_data_task(df_bank: pd.DataFrame, df_milk_price_pp: pd.DataFrame) -> pd.DataFrame:
-    df_milk_price_pp_pib = join_preprocess_milk_bank_data(df_bank, df_milk_price_pp)
+    df_milk_price_pp_pib = run_etl(join_preprocess_milk_bank_data, df_bank, df_milk_price_pp)
     logger = prefect.context.get("logger")
     logger.debug(f"Data columns after join_preprocess_milk_bank_data_task: {df_milk_price_pp_pib.columns}")
-    logger.debug(f"Data shape after join_preprocess_milk_bank_data_task: {df_milk_price_pp_pib.shape}")
+    logger.debug(f"Data shape after join_preprocess_milk_bank_data_task: {frame_shape(df_milk_price_pp_pib)}")
+    return df_milk_price_pp_pib
+
+
+@task
+def update_training_table_task(training_table_path: str, file_precipitation_path: str, file_milk_path: str,
+                               file_bank_path: str) -> pd.DataFrame:
+    logger = prefect.context.get("logger")
+    logger.info(f"Updating training table {training_table_path} with new months")
+    df_milk_price_pp_pib = apply_dtypes_policy(update_training_table(training_table_path, file_precipitation_path,
+                                                                     file_milk_path, file_bank_path))
+    logger.debug(f"Data columns after update_training_table_task: {df_milk_price_pp_pib.columns}")
+    logger.debug(f"Data shape after update_training_table_task: {df_milk_price_pp_pib.shape}")
     return df_milk_price_pp_pib
@@ -1,34 +1,52 @@
 import os
+import time
 import joblib
 import prefect
 import pandas as pd
-from typing import Tuple, List
+from dataclasses import replace
+from typing import Tuple, List, Optional, Union
 from prefect import task
-from src.model.model import model_generation, generate_feature_subsets
-from src.containers import Model
+from sklearn.pipeline import Pipeline
+from src.model.model import model_generation, generate_datasets, load_shared_dataset
+from src.model.compiled import compile_pipeline, save_compiled_pipeline
+from src.model.refresh import refresh_model, statistics_path, save_statistics, load_statistics
+from src.containers import Model, SearchConfig, SharedDataset, RefreshConfig
+from src.preprocess.incremental import high_water_mark
 from src import __version__
 from pathlib import Path
 
 
 @task
-def generate_datasets_task(df: pd.DataFrame) -> List[Tuple[pd.DataFrame, pd.DataFrame]]:
-    df_x = df.drop(['Precio_leche'], axis=1)
-    df_y = df['Precio_leche']
-    features_search = generate_feature_subsets(df_x)
+def generate_datasets_task(df: pd.DataFrame, search: Optional[SearchConfig] = None) -> \
+        List[Union[Tuple[pd.DataFrame, pd.DataFrame], SharedDataset]]:
+    """
+    Datasets for every feature subset, with search.feature_subsets all feature groups are explored. When a
+    shared_dataset_dir is set in prefect context the features are stored there once and every dataset is a
+    SharedDataset loaded by model_generation_task.
+    """
+    all_subsets = bool(search and search.feature_subsets)
+    datasets = generate_datasets(df, 'Precio_leche', all_subsets, prefect.context.get("shared_dataset_dir"))
 
     logger = prefect.context.get("logger")
-    logger.debug(f"All available features {df_x.columns}")
-    logger.debug(f"Features search space: {features_search}")
+    logger.debug(f"All available features {[column for column in df.columns if column != 'Precio_leche']}")
+    features_search = [[dataset.columns[index] for index in dataset.features] if isinstance(dataset, SharedDataset)
+                       else list(dataset[0].columns) for dataset in datasets]
+    logger.info(f"Features search space: {len(features_search)} subsets")
     [logger.debug(f"Dataset {index} generated with features: {features}") for index, features in
      enumerate(features_search)]
-    return [(df_x[features], df_y) for features in features_search]
+    return datasets
 
 
 @task
-def model_generation_task(data: Tuple[pd.DataFrame, pd.DataFrame], test_size: float = 0.2) -> Model:
+def model_generation_task(data: Union[Tuple[pd.DataFrame, pd.DataFrame], SharedDataset], test_size: float = 0.2,
+                          search: Optional[SearchConfig] = None) -> Model:
     logger = prefect.context.get("logger")
+    if isinstance(data, SharedDataset):
+        data = load_shared_dataset(data)
     logger.info(f"Training features: {data[0].columns}")
-    model = model_generation(data, test_size)
+    if search:
+        logger.info(f"Search options: {search}")
+    model = model_generation(data, test_size, search)
     return model
 
 
@@ -42,13 +60,23 @@ def select_best_model_task(models: List[Model]) -> Model:
     return best_model
 
 
+def save_pipeline(pipeline: Pipeline, save_model_dir: str) -> None:
+    """Writes the joblib and compiled artifacts of pipeline"""
+    model_path = os.path.join(save_model_dir, f"pipeline-model-{__version__}.joblib")
+    joblib.dump(pipeline, Path(model_path))
+    compiled_model_path = os.path.join(save_model_dir, f"pipeline-model-{__version__}.npz")
+    save_compiled_pipeline(compile_pipeline(pipeline), compiled_model_path)
+
+
 @task
-def model_serialization_task(model: Model, save_model_dir: str) -> None:
+def model_serialization_task(model: Model, save_model_dir: str, df: Optional[pd.DataFrame] = None) -> None:
     """
 
     :param model: model to serialize
     :param save_model_dir: a relative path where to store the model.
                            If the provided path doesn't exists a one will be created.
+    :param df: training table of the model, with it the model Ridge statistics are stored next to the artifacts
+               to refresh the model with newer months.
     :return:
     """
     logger = prefect.context.get("logger")
@@ -56,6 +84,42 @@ def model_serialization_task(model: Model, save_model_dir: str) -> None:
     logger.info(f"Model version {__version__}")
     if not os.path.exists(save_model_dir):
         os.makedirs(os.path.join(os.getcwd(), save_model_dir))
-    model_path = os.path.join(save_model_dir, f"pipeline-model-{__version__}.joblib")
-    joblib.dump(model.model.best_estimator_, Path(model_path))
+    save_pipeline(model.model.best_estimator_, save_model_dir)
+    path = statistics_path(save_model_dir)
+    if model.statistics and df is not None:
+        save_statistics(replace(model.statistics, searched_at=time.time(), high_water_mark=high_water_mark(df)), path)
+        logger.info(f"Model statistics saved on {path}")
+    elif os.path.exists(path):
+        # statistics of a previous model can't refresh this one
+        os.remove(path)
     logger.info(f"Model serialized successfully")
+
+
+@task
+def refresh_model_task(df: pd.DataFrame, save_model_dir: str, refresh: Optional[RefreshConfig] = None) -> bool:
+    """
+    Refreshes the serialized model with the months of the training table newer than its statistics, the model
+    configuration is kept and only the Ridge coefficients are solved again, see refresh.refresh_model.
+    :return: False when a full search is needed: the model or its statistics don't exist, the last full search is
+             too old or the r2 of the new months drifted.
+    """
+    logger = prefect.context.get("logger")
+    model_path = os.path.join(save_model_dir, f"pipeline-model-{__version__}.joblib")
+    path = statistics_path(save_model_dir)
+    if not (os.path.exists(model_path) and os.path.exists(path)):
+        logger.info(f"Full search needed: there isn't a model with statistics in {save_model_dir}")
+        return False
+    start = time.perf_counter()
+    pipeline = joblib.load(model_path)
+    previous = load_statistics(path)
+    statistics, reason = refresh_model(pipeline, previous, df, refresh)
+    if statistics is None:
+        logger.info(f"Full search needed: {reason}")
+        return False
+    # without new months the statistics and the model don't change
+    if statistics is not previous:
+        save_pipeline(pipeline, save_model_dir)
+        save_statistics(statistics, path)
+    logger.info(f"Model refreshed in {time.perf_counter() - start:.4f}s: {reason}, "
+                f"{statistics.refreshes} refreshes since the last full search")
+    return True
@@ -0,0 +1,31 @@
+import prefect
+import pandas as pd
+from typing import Any, Callable
+from src.cache import run_cached
+from src.preprocess.dtypes import apply_dtypes_policy
+
+# polars is imported when its backend is used, the pandas backend only needs pandas
+ETL_BACKENDS = ("pandas", "polars")
+
+
+def run_etl(function: Callable, *args) -> Any:
+    """
+    Runs an etl function with the backend of the prefect context etl_backend, pandas by default.
+    The pandas backend runs function through the etl cache. The polars backend runs the function of the same name
+    in src.preprocess.lazy, it returns a lazy frame that's collected by join_preprocess_milk_bank_data, so the etl
+    isn't cached with polars. The dtypes policy is applied to pandas results.
+    """
+    backend = prefect.context.get("etl_backend") or "pandas"
+    if backend not in ETL_BACKENDS:
+        raise ValueError(f"Unknown etl backend {backend}, available backends: {ETL_BACKENDS}")
+    if backend == "polars":
+        from src.preprocess import lazy
+        result = getattr(lazy, function.__name__)(*args)
+    else:
+        result = run_cached(function, *args)
+    return apply_dtypes_policy(result) if isinstance(result, pd.DataFrame) else result
+
+
+def frame_shape(df: Any) -> Any:
+    """Shape of a pandas frame, lazy frames don't have one until they're collected"""
+    return df.shape if isinstance(df, pd.DataFrame) else "lazy"
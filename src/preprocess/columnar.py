@@ -0,0 +1,88 @@
+import os
+import pandas as pd
+from typing import Callable, List, Optional, Union
+from src.constants import REGIONES
+
+# pyarrow is imported when columnar files are used, csv files only need pandas
+COLUMNAR_EXTENSION = ".feather"
+
+# central bank values are kept as the raw strings parsed by the etl (999.999.999 numbers and utc dates),
+# only these columns are plain decimal numbers
+BANK_FLOAT_COLUMNS = ['Precio_de_la_onza_troy_de_oro_dolaresoz', 'Precio_de_la_onza_troy_de_plata_dolaresoz',
+                      'Precio_del_diesel_centavos_de_dolargalon',
+                      'Precio_del_gas_natural_dolaresmillon_de_unidades_termicas_britanicas',
+                      'Precio_del_petroleo_Brent_dolaresbarril', 'Precio_del_petroleo_WTI_dolaresbarril',
+                      'Precio_del_propano_centavos_de_dolargalon_DTN', 'Ventas_autos_nuevos']
+
+
+def bank_schema(columns: List[str]):
+    import pyarrow as pa
+    return pa.schema([(column, pa.float64() if column in BANK_FLOAT_COLUMNS else pa.string()) for column in columns])
+
+
+def milk_schema(columns: List[str]):
+    import pyarrow as pa
+    return pa.schema([("Anio", pa.int64()), ("Mes", pa.string()), ("Precio_leche", pa.float64())])
+
+
+def precipitations_schema(columns: List[str]):
+    import pyarrow as pa
+    return pa.schema([("date", pa.timestamp("ns"))] + [(region, pa.float64()) for region in REGIONES])
+
+
+SCHEMAS = {
+    "banco_central": bank_schema,
+    "precio_leche": milk_schema,
+    "precipitaciones": precipitations_schema,
+}
+
+
+def is_columnar(file: str) -> bool:
+    return file.endswith(COLUMNAR_EXTENSION)
+
+
+def convert_csv(csv_file: str, output_dir: str, schema_definition: Callable) -> str:
+    """
+    Writes a csv file as an uncompressed feather file with the schema returned by schema_definition for its columns.
+    Uncompressed files can be memory mapped and read without copies.
+    :param csv_file: source csv path.
+    :param output_dir: directory of the feather file, it's named as the csv file.
+    :param schema_definition: function that receives the csv columns and returns a pyarrow schema.
+    :return: feather file path
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    columns = list(pd.read_csv(csv_file, nrows=0).columns)
+    schema = schema_definition(columns)
+    if sorted(schema.names) != sorted(columns):
+        raise ValueError(f"Schema columns {schema.names} don't match {csv_file} columns {columns}")
+    string_columns = [field.name for field in schema if pa.types.is_string(field.type)]
+    date_columns = [field.name for field in schema if pa.types.is_timestamp(field.type)]
+    df = pd.read_csv(csv_file, dtype={column: str for column in string_columns}, parse_dates=date_columns)
+    table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+    os.makedirs(output_dir, exist_ok=True)
+    output_file = os.path.join(output_dir, os.path.splitext(os.path.basename(csv_file))[0] + COLUMNAR_EXTENSION)
+    feather.write_feather(table, output_file, compression="uncompressed")
+    return output_file
+
+
+def columnar_columns(file: str) -> List[str]:
+    """Column names of a feather file, only its schema is read"""
+    import pyarrow as pa
+    with pa.memory_map(file) as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+def read_columnar(file: str, columns: Optional[Union[List[str], Callable[[str], bool]]] = None) -> pd.DataFrame:
+    """
+    Reads a feather file memory mapped, only the selected columns are read.
+    Numeric columns without nulls are not copied, pandas blocks are views over the mapped file.
+    :param file: feather file path.
+    :param columns: list of columns or a function that selects columns by name, all columns by default.
+    :return: dataframe with the selected columns.
+    """
+    import pyarrow.feather as feather
+    if callable(columns):
+        columns = [column for column in columnar_columns(file) if columns(column)]
+    table = feather.read_table(file, columns=columns, memory_map=True)
+    return table.to_pandas(split_blocks=True)
@@ -0,0 +1,31 @@
+import prefect
+import pandas as pd
+
+# columns kept in float64 by the compact dtypes policy
+FLOAT64_COLUMNS = ['Precio_leche']
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Memory compact dtypes policy:
+    - integer columns are downcast to the smallest integer type that holds their values,
+      calendar fields end as int16 (ano, period) and int8 (mes)
+    - float columns are stored as float32 except FLOAT64_COLUMNS
+    Other columns are not changed.
+    :param df: dataframe to compact.
+    :return: a dataframe with compact dtypes.
+    """
+    dtypes = {}
+    for column, dtype in df.dtypes.items():
+        if pd.api.types.is_integer_dtype(dtype):
+            dtypes[column] = pd.to_numeric(df[column], downcast='integer').dtype
+        elif pd.api.types.is_float_dtype(dtype) and column not in FLOAT64_COLUMNS:
+            dtypes[column] = 'float32'
+    return df.astype(dtypes) if dtypes else df
+
+
+def apply_dtypes_policy(df: pd.DataFrame) -> pd.DataFrame:
+    """Applies compact_dtypes when compact_dtypes is set in prefect context, the flow keeps pandas dtypes by default"""
+    if not prefect.context.get("compact_dtypes"):
+        return df
+    return compact_dtypes(df)
@@ -0,0 +1,85 @@
+import os
+import prefect
+import pandas as pd
+import src.utils as utils
+from typing import Optional
+from src.preprocess.preprocess_milk import load_and_preprocess_milk
+from src.preprocess.preprocess_bank import load_and_clean_central_bank_data, process_pib_columns, \
+    process_imacec_columns, process_iv, join_preprocess_bank_data, validate_imacec_columns
+from src.preprocess.preprocess_precipitations import load_and_preprocess_precipitations
+from src.preprocess.preprocess import join_precipitations_milk_data, join_preprocess_milk_bank_data
+
+
+def high_water_mark(table: Optional[pd.DataFrame]) -> int:
+    """Period key of the last month of the training table, -1 when there isn't a table"""
+    if table is None or table.empty:
+        return -1
+    return int(utils.period_key(table['ano'], table['mes']).max())
+
+
+def read_training_table(table_path: str) -> Optional[pd.DataFrame]:
+    return pd.read_pickle(table_path) if os.path.exists(table_path) else None
+
+
+def write_training_table(table: pd.DataFrame, table_path: str) -> None:
+    table_dir = os.path.dirname(table_path)
+    if table_dir:
+        os.makedirs(table_dir, exist_ok=True)
+    temp_path = f"{table_path}.tmp"
+    table.to_pickle(temp_path)
+    os.replace(temp_path, table_path)
+
+
+def upsert_training_table(table: Optional[pd.DataFrame], df_new: pd.DataFrame) -> pd.DataFrame:
+    """Appends new months to the table, a month already present is replaced by its new version"""
+    if table is None:
+        return df_new.reset_index(drop=True)
+    combined = pd.concat([table, df_new[table.columns]], ignore_index=True)
+    combined = combined.drop_duplicates(subset=['ano', 'mes'], keep='last')
+    return combined.sort_values(by=['ano', 'mes'], kind='stable').reset_index(drop=True)
+
+
+def process_new_months(file_precipitation_path: str, file_milk_path: str, file_bank_path: str,
+                       mark: int) -> pd.DataFrame:
+    """
+    Same etl than the flow for the rows newer than mark: sources are loaded and their dates parsed,
+    values are only parsed and joined for the new rows.
+    A month is part of the training table when the three sources have it, a month published by one source
+    is processed again by later runs until the others publish it.
+    :param mark: period key of the last month already in the training table.
+    :return: training table rows of the new months.
+    """
+    df_bank_clean = load_and_clean_central_bank_data(file_bank_path)
+    df_bank_clean = df_bank_clean[utils.dates_period_key(df_bank_clean['Periodo']) > mark]
+    df_precipitations = load_and_preprocess_precipitations(file_precipitation_path)
+    df_precipitations = df_precipitations[df_precipitations['period'] > mark]
+    df_milk = load_and_preprocess_milk(file_milk_path)
+    df_milk = df_milk[df_milk['period'] > mark]
+
+    df_bank = join_preprocess_bank_data(process_pib_columns(df_bank_clean),
+                                        process_imacec_columns(df_bank_clean, validate=False),
+                                        process_iv(df_bank_clean))
+    df_milk_price_pp = join_precipitations_milk_data(df_precipitations, df_milk)
+    return join_preprocess_milk_bank_data(df_bank, df_milk_price_pp)
+
+
+def update_training_table(table_path: str, file_precipitation_path: str, file_milk_path: str,
+                          file_bank_path: str) -> pd.DataFrame:
+    """
+    Incremental etl: the training table materialized in table_path is updated with the months newer than its
+    last month, without a table the whole history is processed. The updated table is saved in table_path.
+    :param table_path: pickle file with the training table of previous runs.
+    :param file_precipitation_path: path of precipitaciones file.
+    :param file_milk_path: path of precio_leche file.
+    :param file_bank_path: path of banco_central file.
+    :return: updated training table.
+    """
+    logger = prefect.context.get("logger")
+    table = read_training_table(table_path)
+    mark = high_water_mark(table)
+    df_new = process_new_months(file_precipitation_path, file_milk_path, file_bank_path, mark)
+    logger.info(f"Training table months after key {mark}: {len(df_new)} new rows")
+    table = upsert_training_table(table, df_new)
+    validate_imacec_columns(table)
+    write_training_table(table, table_path)
+    return table
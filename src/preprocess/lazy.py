@@ -0,0 +1,159 @@
+"""
+Polars version of the etl, functions build lazy query plans with the same rules than the pandas functions of the same
+name and only join_preprocess_milk_bank_data collects the plan as a pandas training table. Polars optimizes the whole
+plan: only the used columns are read from the source files, filters are pushed down and joins run multi-threaded.
+"""
+import pandas as pd
+import polars as pl
+from typing import Union
+from src.preprocess import columnar
+
+Frame = Union[pl.LazyFrame, pd.DataFrame]
+
+MONTHS = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+IV_COLUMN = 'Indice_de_ventas_comercio_real_no_durables_IVCM'
+
+
+def lazy(df: Frame) -> pl.LazyFrame:
+    """Inputs of other tasks can be pandas dataframes, for example the ones of the chunked central bank loader"""
+    return pl.from_pandas(df).lazy() if isinstance(df, pd.DataFrame) else df
+
+
+def scan(file: str, strings: bool = False) -> pl.LazyFrame:
+    """
+    :param strings: reads csv values as strings to be parsed by the etl rules, feather files keep their schema.
+    """
+    if columnar.is_columnar(file):
+        return pl.scan_ipc(file, memory_map=True)
+    return pl.scan_csv(file, infer_schema_length=0 if strings else 100)
+
+
+def to_date(df: pl.LazyFrame, column: str) -> pl.Expr:
+    if df.schema[column] == pl.Utf8:
+        return pl.col(column).str.strptime(pl.Date, '%Y-%m-%d')
+    return pl.col(column).cast(pl.Date)
+
+
+def period_key(years: pl.Expr, months: pl.Expr) -> pl.Expr:
+    """Same join key than utils.period_key"""
+    return years.cast(pl.Int64) * 12 + months.cast(pl.Int64)
+
+
+def dates_period_key(dates: pl.Expr) -> pl.Expr:
+    return period_key(dates.dt.year(), dates.dt.month())
+
+
+def convert_int(column: str) -> pl.Expr:
+    """utils.convert_int: 999.999.999 to 999999999"""
+    return pl.col(column).str.replace_all('.', '', literal=True).cast(pl.Int64)
+
+
+def to_100(column: str) -> pl.Expr:
+    """utils.to_100 rules over the parts of the value split by dots"""
+    parts = pl.col(column).str.split('.')
+    integer, decimal = parts.arr.get(0), parts.arr.get(1)
+    joined = pl.concat_str([integer, decimal])
+    short = integer.str.lengths() <= 2
+    value = pl.when(integer.str.starts_with('1') & ~short).then(pl.concat_str([integer, pl.lit('.'), decimal])) \
+        .when(integer.str.starts_with('1')).then(pl.concat_str([joined.str.slice(0, 3), pl.lit('.'),
+                                                                joined.str.slice(3)])) \
+        .when(~short).then(pl.concat_str([integer.str.slice(0, 2), pl.lit('.'), integer.str.slice(-1)])) \
+        .otherwise(pl.concat_str([joined.str.slice(0, 2), pl.lit('.'), joined.str.slice(2)]))
+    return value.cast(pl.Float64).alias(column)
+
+
+def load_and_preprocess_precipitations(file: str) -> pl.LazyFrame:
+    df = scan(file)
+    return df.with_column(to_date(df, 'date')) \
+        .drop_nulls('date') \
+        .sort('date') \
+        .unique(subset='date', keep='first', maintain_order=True) \
+        .with_column(dates_period_key(pl.col('date')).alias('period'))
+
+
+def load_and_preprocess_milk(file: str) -> pl.LazyFrame:
+    months = pl.DataFrame({'mes_pal': MONTHS, 'mes': list(range(1, 13))}).lazy()
+    df = scan(file).rename({'Anio': 'ano', 'Mes': 'mes_pal'})
+    return df.with_columns([pl.col('ano').cast(pl.Int64), pl.col('Precio_leche').cast(pl.Float64)]) \
+        .join(months, on='mes_pal', how='left') \
+        .with_column(period_key(pl.col('ano'), pl.col('mes')).alias('period'))
+
+
+def valid_dates(dates: pl.Expr) -> pl.Expr:
+    """
+    Year-month-day strings of existing dates and null for the others, as 2020-13-01 in the central bank data.
+    Polars strptime panics with out of range dates even when it isn't strict.
+    """
+    parts = dates.str.split('-')
+    year, month, day = [parts.arr.get(i).cast(pl.Int64) for i in range(3)]
+    leap = ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+    days = pl.when(month == 2).then(pl.when(leap).then(29).otherwise(28)) \
+        .when(month.is_in([4, 6, 9, 11])).then(30) \
+        .otherwise(31)
+    return pl.when((month >= 1) & (month <= 12) & (day >= 1) & (day <= days)).then(dates).otherwise(None)
+
+
+def load_and_clean_central_bank_data(file: str) -> pl.LazyFrame:
+    """Dates that don't match year-month-day are null as with errors="coerce" and these rows are dropped"""
+    df = scan(file, strings=True)
+    periods = valid_dates(pl.col('Periodo').cast(pl.Utf8).str.extract(r'(\d+-\d+-\d+)', 1))
+    return df.with_column(periods.str.strptime(pl.Date, '%Y-%m-%d', strict=False)) \
+        .unique(subset='Periodo', keep='first', maintain_order=True) \
+        .drop_nulls('Periodo')
+
+
+def process_pib_columns(df: Frame) -> pl.LazyFrame:
+    df = lazy(df)
+    cols_pib = [column for column in df.columns if 'PIB' in column]
+    return df.select(cols_pib + ['Periodo']).drop_nulls() \
+        .with_columns([convert_int(column) for column in cols_pib]) \
+        .sort('Periodo')
+
+
+def process_imacec_columns(df: Frame) -> pl.LazyFrame:
+    df = lazy(df)
+    cols_imacec = [column for column in df.columns if 'Imacec' in column]
+    return df.select(cols_imacec + ['Periodo']).drop_nulls() \
+        .with_columns([to_100(column) for column in cols_imacec]) \
+        .sort('Periodo')
+
+
+def process_iv(df: Frame) -> pl.LazyFrame:
+    return lazy(df).select([IV_COLUMN, 'Periodo']).drop_nulls() \
+        .sort('Periodo') \
+        .with_column(to_100(IV_COLUMN).alias('num'))
+
+
+def validate_imacec_columns(df: pl.LazyFrame) -> pl.LazyFrame:
+    """Aggregations checked by preprocess_bank.validate_imacec_columns, one row with the min and max of every column"""
+    cols_imacec = [column for column in df.columns if 'Imacec' in column]
+    return df.select([pl.col(column).min().alias(f'{column}_min') for column in cols_imacec] +
+                     [pl.col(column).max().alias(f'{column}_max') for column in cols_imacec])
+
+
+def join_preprocess_bank_data(df_pib: Frame, df_imacec: Frame, df_iv: Frame) -> pl.LazyFrame:
+    return lazy(df_pib).join(lazy(df_imacec), on='Periodo', how='inner') \
+        .join(lazy(df_iv), on='Periodo', how='inner') \
+        .with_column(dates_period_key(pl.col('Periodo')).alias('period'))
+
+
+def join_precipitations_milk_data(df_precipitations: Frame, df_milk: Frame) -> pl.LazyFrame:
+    # the row number keeps the milk order after the joins as preprocess.join_on_period
+    return lazy(df_milk).with_row_count('row') \
+        .join(lazy(df_precipitations).drop('date'), on='period', how='inner')
+
+
+def join_preprocess_milk_bank_data(df_bank: Frame, df_milk_price_precipitations: Frame) -> pd.DataFrame:
+    """Joins the bank data and collects the whole plan as the pandas training table"""
+    df_bank = lazy(df_bank)
+    df_milk_price_precipitations = lazy(df_milk_price_precipitations)
+    if 'row' not in df_milk_price_precipitations.columns:
+        df_milk_price_precipitations = df_milk_price_precipitations.with_row_count('row')
+    table = df_milk_price_precipitations.join(df_bank, on='period', how='inner') \
+        .sort('row') \
+        .drop(['row', 'Periodo', IV_COLUMN, 'period', 'mes_pal'])
+    table, checks = pl.collect_all([table, validate_imacec_columns(df_bank)])
+    for column in [column for column in table.columns if 'Imacec' in column]:
+        assert (checks[f'{column}_max'][0] > 100)
+        assert (checks[f'{column}_min'][0] > 30)
+    return table.to_pandas()
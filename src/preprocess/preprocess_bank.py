@@ -1,13 +1,15 @@
 import prefect
 import pandas as pd
+from typing import List, Tuple
 import src.utils as utils
+from src.preprocess import columnar
 
 
 def process_pib_columns(df: pd.DataFrame):
     """
     This function process PIB columns applying the follow treatment:
     - drop nan values
-    - parse values as integers
+    - parse values as integers with utils.convert_int rules
     - sort by Periodo column
     :param df: dataframe with central bank data.
     :return: Dataframe processed.
@@ -19,19 +21,21 @@ def process_pib_columns(df: pd.DataFrame):
     df_pib = df[cols_pib].dropna(how='any', axis=0)
     period_column = df_pib["Periodo"]
     # apply the conversion to all columns except Periodo which is the last one in cols_pib list
-    df_pib = df_pib[cols_pib[:-1]].applymap(utils.convert_int)
+    df_pib = df_pib[cols_pib[:-1]].apply(utils.convert_int_series)
     df_pib["Periodo"] = period_column
     df_pib = df_pib.sort_values(by='Periodo', ascending=True)
     return df_pib
 
 
-def process_imacec_columns(df: pd.DataFrame) -> pd.DataFrame:
+def process_imacec_columns(df: pd.DataFrame, validate: bool = True) -> pd.DataFrame:
     """
     This function process Imacec related columns applying the follow treatment:
     - drop nan values
     - capping values based on utils.to_100 function
     - sort by Periodo column
     :param df: dataframe with central bank data.
+    :param validate: check capped values with validate_imacec_columns, a few new rows processed incrementally
+                     can't pass these checks then they are done on the updated table.
     :return: Dataframe processed.
     """
     cols_imacec = [x for x in list(df.columns) if 'Imacec' in x]
@@ -43,13 +47,20 @@ def process_imacec_columns(df: pd.DataFrame) -> pd.DataFrame:
         if col == 'Periodo':
             continue
         else:
-            df_imacec[col] = df_imacec[col].apply(utils.to_100)
-            assert (df_imacec[col].max() > 100)
-            assert (df_imacec[col].min() > 30)
+            df_imacec[col] = utils.to_100_series(df_imacec[col])
+    if validate:
+        validate_imacec_columns(df_imacec)
     df_imacec = df_imacec.sort_values(by='Periodo', ascending=True)
     return df_imacec
 
 
+def validate_imacec_columns(df: pd.DataFrame) -> None:
+    """Capped Imacec values must be around 100, the maximum over 100 and the minimum over 30"""
+    for col in [x for x in list(df.columns) if 'Imacec' in x]:
+        assert (df[col].max() > 100)
+        assert (df[col].min() > 30)
+
+
 def process_iv(df: pd.DataFrame) -> pd.DataFrame:
     """
     This functions drop nan values based on columns:
@@ -63,24 +74,30 @@ def process_iv(df: pd.DataFrame) -> pd.DataFrame:
     df_iv = df[cols_iv]
     df_iv = df_iv.dropna()
     df_iv = df_iv.sort_values(by='Periodo', ascending=True)
-    df_iv['num'] = df_iv.Indice_de_ventas_comercio_real_no_durables_IVCM.apply(
-        lambda x: utils.to_100(x))
+    df_iv['num'] = utils.to_100_series(df_iv.Indice_de_ventas_comercio_real_no_durables_IVCM)
     return df_iv
 
 
+def is_etl_column(column: str) -> bool:
+    """Central bank columns used by process_pib_columns, process_imacec_columns and process_iv"""
+    return column in ['Periodo', 'Indice_de_ventas_comercio_real_no_durables_IVCM'] or 'PIB' in column or \
+        'Imacec' in column
+
+
 def load_and_clean_central_bank_data(file: str) -> pd.DataFrame:
     """
     This functions process central bank data applying the follow treatment:
     - parse date in the format year-month-day
     - drop duplicates
     - drop nan values
-    :param file: path of banco_central.csv file.
+    :param file: path of banco_central.csv file or its feather version generated by ingest.py,
+    from feather files only the columns used by the etl are read.
     :return: Dataframe processed and cleaned.
     """
-    df_bank = pd.read_csv(file)
+    df_bank = columnar.read_columnar(file, is_etl_column) if columnar.is_columnar(file) else pd.read_csv(file)
     logger = prefect.context.get("logger")
     logger.debug(f"Bank dataset original columns {df_bank.columns}")
-    df_bank["Periodo"] = df_bank["Periodo"].apply(utils.match_date)
+    df_bank["Periodo"] = utils.match_date_series(df_bank["Periodo"])
     # TODO: in this step errors parameter is setted as coerce and it could be an issue.
     #  Check date format for this dataset.
     #  2020-13-01 this date is present in data and breaks the expected format year-month-day.
@@ -91,16 +108,55 @@ def load_and_clean_central_bank_data(file: str) -> pd.DataFrame:
     return df_bank_clean
 
 
+def load_and_process_central_bank_data_chunked(file: str, chunk_size: int = 100_000) -> \
+        Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Streaming version of load_and_clean_central_bank_data followed by process_pib_columns, process_imacec_columns and
+    process_iv for large csv files. The file is read in chunks of chunk_size rows with only the columns used by the etl,
+    every chunk is cleaned and processed then memory depends on the chunk size and the processed values.
+    Periodo duplicates are dropped across chunks keeping the first one as load_and_clean_central_bank_data does.
+    :param file: path of banco_central.csv file.
+    :param chunk_size: number of rows read at once.
+    :return: the same pib, imacec and iv dataframes than the processing functions.
+    """
+    columns = [column for column in pd.read_csv(file, nrows=0).columns if is_etl_column(column)]
+    seen_periods = set()
+    pib_chunks, imacec_chunks, iv_chunks = [], [], []
+    # these columns are strings in the whole file, a chunk could be inferred as numbers
+    for chunk in pd.read_csv(file, usecols=columns, dtype=str, chunksize=chunk_size):
+        chunk = chunk[columns]
+        chunk["Periodo"] = pd.to_datetime(utils.match_date_series(chunk["Periodo"]), format='%Y-%m-%d', errors="coerce")
+        chunk = chunk[~chunk["Periodo"].isna()].drop_duplicates(subset='Periodo')
+        chunk = chunk[~chunk["Periodo"].isin(seen_periods)]
+        seen_periods.update(chunk["Periodo"])
+        pib_chunks.append(process_pib_columns(chunk))
+        imacec_chunks.append(process_imacec_columns(chunk, validate=False))
+        iv_chunks.append(process_iv(chunk))
+    df_pib = concat_chunks(pib_chunks).sort_values(by='Periodo', ascending=True)
+    df_imacec = concat_chunks(imacec_chunks).sort_values(by='Periodo', ascending=True)
+    validate_imacec_columns(df_imacec)
+    df_iv = concat_chunks(iv_chunks).sort_values(by='Periodo', ascending=True)
+    return df_pib, df_imacec, df_iv
+
+
+def concat_chunks(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    # chunks without rows after dropping nan values don't have parsed dtypes
+    return pd.concat([chunk for chunk in chunks if not chunk.empty] or chunks[:1])
+
+
 def join_preprocess_bank_data(df_pib: pd.DataFrame, df_imacec: pd.DataFrame, df_iv: pd.DataFrame) -> pd.DataFrame:
     """
     This functions generates the dataframe that will be used for model training.
-    It applies two joins based on dataframes received.
+    It applies two joins on Periodo based on dataframes received and adds the period join key.
 
     :param df_pib: dataframe generated by process_pib_columns
     :param df_imacec: dataframe generated by process_pib_columns
     :param df_iv: dataframe generated by process_iv
     :return: joined dataframe that will be used for model training
     """
-    df_pib_imacec = pd.merge(df_pib, df_imacec, on='Periodo', how='inner')
-    df_pib_imacec_iv = pd.merge(df_pib_imacec, df_iv, on='Periodo', how='inner')
+    df_imacec = df_imacec.set_index('Periodo', verify_integrity=True)
+    df_iv = df_iv.set_index('Periodo', verify_integrity=True)
+    df_pib_imacec = df_pib.join(df_imacec, on='Periodo', how='inner')
+    df_pib_imacec_iv = df_pib_imacec.join(df_iv, on='Periodo', how='inner').reset_index(drop=True)
+    df_pib_imacec_iv['period'] = utils.dates_period_key(df_pib_imacec_iv['Periodo'])
     return df_pib_imacec_iv
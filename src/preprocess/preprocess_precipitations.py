@@ -1,4 +1,6 @@
 import pandas as pd
+from src.preprocess import columnar
+import src.utils as utils
 
 
 def load_and_preprocess_precipitations(file: str) -> pd.DataFrame:
@@ -8,13 +10,15 @@ def load_and_preprocess_precipitations(file: str) -> pd.DataFrame:
     - sort by date column
     - drop duplicates
     - drop nan values
+    - add the period join key
 
-    :param file: path of precipitaciones.csv file.
+    :param file: path of precipitaciones.csv file or its feather version generated by ingest.py.
     :return: Dataframe preocessed.
     """
-    df_precipitations = pd.read_csv(file)
+    df_precipitations = columnar.read_columnar(file) if columnar.is_columnar(file) else pd.read_csv(file)
     df_precipitations["date"] = pd.to_datetime(df_precipitations["date"], format='%Y-%m-%d')
     df_precipitations_sorted = df_precipitations.sort_values(by="date", ascending=True).reset_index(drop=True)
     df_precipitations_sorted.drop_duplicates(subset='date', inplace=True)
-    df_precipitaciones_sorted = df_precipitations_sorted[~df_precipitations_sorted["date"].isna()]
+    df_precipitaciones_sorted = df_precipitations_sorted[~df_precipitations_sorted["date"].isna()].copy()
+    df_precipitaciones_sorted["period"] = utils.dates_period_key(df_precipitaciones_sorted["date"])
     return df_precipitaciones_sorted
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+import prefect
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, Dict, Optional
+from prefect.engine import FlowRunner, TaskRunner
+from prefect.engine.result import Result
+from prefect.engine.state import State
+
+
+def describe_value(value: Any) -> dict:
+    """Type, shape and memory of dataframes, series and arrays, lists and tuples are described by their items"""
+    if isinstance(value, pd.DataFrame):
+        return {"type": "DataFrame", "shape": list(value.shape),
+                "memory_mb": value.memory_usage(deep=True).sum() / 1024 ** 2}
+    if isinstance(value, pd.Series):
+        return {"type": "Series", "shape": list(value.shape), "memory_mb": value.memory_usage(deep=True) / 1024 ** 2}
+    if isinstance(value, np.ndarray):
+        return {"type": "ndarray", "shape": list(value.shape), "memory_mb": value.nbytes / 1024 ** 2}
+    if isinstance(value, (list, tuple)):
+        items = [describe_value(item) for item in value]
+        return {"type": type(value).__name__, "items": len(items),
+                "memory_mb": sum(item.get("memory_mb", 0.0) for item in items)}
+    return {"type": type(value).__name__}
+
+
+class TaskProfiler:
+    """
+    Collects wall time, cpu time, peak traced memory and input and output descriptions of every task run by
+    ProfilingTaskRunner, it's set in prefect context as task_profiler.
+    Cpu time is the time of the thread running the task, processes started by the task are not included.
+    Peak memory is the increase of memory traced by tracemalloc over the memory at the task start, when tasks run
+    at the same time their peaks include the memory allocated by the other tasks.
+    With profile_dir a cProfile dump named {task name}[-{map index}].prof is written for every task run.
+    """
+    def __init__(self, profile_dir: Optional[str] = None):
+        self.profile_dir = profile_dir
+        self.records = []
+        self.run_info = {}
+        self.start_time = None
+        self.end_time = None
+        self._running = 0
+        self._lock = threading.Lock()
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def start(self, **run_info) -> None:
+        """Starts tracing memory, run_info is added to the report"""
+        self.run_info = run_info
+        self.start_time = time.perf_counter()
+        tracemalloc.start()
+
+    def stop(self) -> None:
+        self.end_time = time.perf_counter()
+        tracemalloc.stop()
+
+    def profile(self, task_name: str, map_index: Optional[int], inputs: Dict[str, Any],
+                run: Callable[[], State]) -> State:
+        """Runs a task with run and records its profile, the state returned by run is returned"""
+        with self._lock:
+            # the peak is only reset when no other task is running to not lose their peaks
+            if self._running == 0:
+                tracemalloc.reset_peak()
+            self._running += 1
+        memory_start = tracemalloc.get_traced_memory()[0]
+        profile = cProfile.Profile() if self.profile_dir else None
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        if profile:
+            profile.enable()
+        try:
+            state = run()
+        finally:
+            if profile:
+                profile.disable()
+            cpu_seconds = time.thread_time() - cpu_started
+            wall_seconds = time.perf_counter() - started
+            peak_memory = tracemalloc.get_traced_memory()[1] - memory_start
+            with self._lock:
+                self._running -= 1
+        run_name = task_name if map_index is None else f"{task_name}-{map_index}"
+        if profile:
+            profile.dump_stats(os.path.join(self.profile_dir, f"{run_name}.prof"))
+        record = {"task": task_name, "map_index": map_index, "thread": threading.current_thread().name,
+                  "state": type(state).__name__, "started_seconds": started - self.start_time,
+                  "wall_seconds": wall_seconds, "cpu_seconds": cpu_seconds,
+                  "peak_memory_mb": max(peak_memory, 0) / 1024 ** 2,
+                  "inputs": {name: describe_value(value) for name, value in inputs.items()},
+                  "output": describe_value(state.result) if state.is_successful() else None}
+        with self._lock:
+            self.records.append(record)
+        return state
+
+    def report(self) -> dict:
+        """
+        Run report with the run info, the flow time, every task run ordered by start time and the totals by task,
+        the hot task is the one with the longest total wall time.
+        """
+        records = sorted(self.records, key=lambda record: record["started_seconds"])
+        tasks = {}
+        for record in records:
+            total = tasks.setdefault(record["task"], {"runs": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                                      "peak_memory_mb": 0.0})
+            total["runs"] += 1
+            total["wall_seconds"] += record["wall_seconds"]
+            total["cpu_seconds"] += record["cpu_seconds"]
+            total["peak_memory_mb"] = max(total["peak_memory_mb"], record["peak_memory_mb"])
+        flow_seconds = self.end_time - self.start_time if self.end_time and self.start_time else None
+        return {**self.run_info, "flow_seconds": flow_seconds,
+                "hot_task": max(tasks, key=lambda task: tasks[task]["wall_seconds"]) if tasks else None,
+                "tasks": tasks, "task_runs": records}
+
+    def save(self, report_path: str) -> None:
+        with open(report_path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+class ProfilingTaskRunner(TaskRunner):
+    """TaskRunner that runs tasks through the TaskProfiler set in prefect context, without it tasks run as usual"""
+    def get_task_run_state(self, state: State, inputs: Dict[str, Result]) -> State:
+        profiler = prefect.context.get("task_profiler")
+        if profiler is None or not state.is_running():
+            return super().get_task_run_state(state, inputs)
+        return profiler.profile(self.task.name, prefect.context.get("map_index"),
+                                {name: result.value for name, result in inputs.items()},
+                                lambda: super(ProfilingTaskRunner, self).get_task_run_state(state, inputs))
+
+
+class ProfilingFlowRunner(FlowRunner):
+    """FlowRunner whose tasks run with ProfilingTaskRunner, use it as flow.run runner_cls"""
+    def __init__(self, flow, task_runner_cls: type = None, state_handlers=None):
+        super().__init__(flow, task_runner_cls=task_runner_cls or ProfilingTaskRunner,
+                         state_handlers=state_handlers)
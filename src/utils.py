@@ -1,4 +1,6 @@
 import re
+import numpy as np
+import pandas as pd
 
 
 # TODO add test for this
@@ -39,3 +41,111 @@ def to_100(data: str) -> float:
         else:
             data = data[0] + data[1]
             return float(data[0:2] + '.' + data[2:])
+
+
+def period_key(years: pd.Series, months: pd.Series) -> pd.Series:
+    """Consecutive integer for every month (year * 12 + month), it's the join key of all datasets"""
+    return years * 12 + months
+
+
+def dates_period_key(dates: pd.Series) -> pd.Series:
+    return period_key(dates.dt.year, dates.dt.month)
+
+
+def match_date_series(dates: pd.Series) -> pd.Series:
+    """Vectorized match_date, it extracts the first date with the format 2022-01-01 of every value"""
+    matches = dates.astype(str).str.extract(r"(\d+-\d+-\d+)", expand=False)
+    if matches.isna().any():
+        raise AttributeError(f"No match found for string {dates[matches.isna()].iloc[0]}")
+    return matches
+
+
+def _char_matrix(data: pd.Series) -> np.ndarray:
+    """
+    Strings of the series as a (max_length, n_rows) uint8 matrix, shorter values are padded with 0.
+    Characters are stored by position in order to process one position for all rows at once.
+    """
+    values = np.array(data.tolist(), dtype=bytes)
+    return np.ascontiguousarray(values.view(np.uint8).reshape(len(values), values.dtype.itemsize).T)
+
+
+def _digits_value(digits: np.ndarray, start: np.ndarray, stop: np.ndarray) -> np.ndarray:
+    """Integer value of the digits between start and stop (not included) positions of every row"""
+    value = np.zeros(digits.shape[1], dtype=np.int64)
+    for position, digit in enumerate(digits):
+        inside = (start <= position) & (position < stop)
+        value = np.where(inside, value * 10 + digit, value)
+    return value
+
+
+def _dot_positions(chars: np.ndarray, lengths: np.ndarray, after: np.ndarray) -> np.ndarray:
+    """Position of the first dot after the given position of every row, the length of the row if there isn't one"""
+    positions = lengths.copy()
+    for position in range(chars.shape[0] - 1, -1, -1):
+        dot = (chars[position] == ord('.')) & (position > after)
+        positions[dot] = position
+    return positions
+
+
+def convert_int_series(data: pd.Series) -> pd.Series:
+    """
+    Vectorized convert_int, it transforms strings with the format 999.999.999 to int 999999999.
+    Digits are read from a character matrix with numpy, values with other characters or more digits than
+    int64 supports are converted with convert_int.
+    """
+    chars = _char_matrix(data)
+    is_digit = (chars >= ord('0')) & (chars <= ord('9'))
+    n_digits = is_digit.sum(axis=0)
+    valid = (is_digit | (chars == ord('.')) | (chars == 0)).all() and (n_digits > 0).all() and (n_digits <= 18).all()
+    if not valid:
+        return data.apply(convert_int).astype('int64')
+    value = np.zeros(len(data), dtype=np.int64)
+    for position_chars, position_is_digit in zip(chars, is_digit):
+        value = np.where(position_is_digit, value * 10 + (position_chars.astype(np.int64) - ord('0')), value)
+    return pd.Series(value, index=data.index, name=data.name, dtype='int64')
+
+
+def to_100_series(data: pd.Series) -> pd.Series:
+    """
+    Vectorized to_100, the same rules are applied with numpy over a character matrix.
+    Every result is built as an exact integer divided by a power of 10, it is the correctly rounded value
+    of the decimal string built by to_100 then results are bit-identical to float parsing.
+    Values with other characters than digits and dots are converted with to_100.
+    """
+    chars = _char_matrix(data)
+    lengths = (chars != 0).sum(axis=0)
+    is_digit = (chars >= ord('0')) & (chars <= ord('9'))
+    if not (is_digit | (chars == ord('.')) | (chars == 0)).all() or chars.shape[0] > 15:
+        return data.apply(to_100)
+    digits = np.where(is_digit, chars.astype(np.int64) - ord('0'), 0)
+
+    # data.split('.'): integer part is [0, first), decimal part is [first + 1, second)
+    first = _dot_positions(chars, lengths, np.full(len(data), -1))
+    second = _dot_positions(chars, lengths, first)
+    has_decimal = first < lengths
+    integer_length, decimal_length = first, np.maximum(second - first - 1, 0)
+    integer = _digits_value(digits, np.zeros_like(first), first)
+    decimal = _digits_value(digits, first + 1, second)
+    joined, joined_length = integer * 10 ** decimal_length + decimal, integer_length + decimal_length
+
+    starts_with_one = chars[0] == ord('1')
+    short = integer_length <= 2
+    missing_decimal = (starts_with_one | short) & ~has_decimal
+    if missing_decimal.any():
+        # to_100 needs the second part in these cases
+        raise IndexError(f"list index out of range for value {data[missing_decimal].iloc[0]}")
+    if (short & (joined_length == 0)).any():
+        return data.apply(to_100)
+    # integer[0:2] and integer[-1]
+    integer_head = _digits_value(digits, np.zeros_like(first), np.minimum(first, 2))
+    integer_last = digits[np.maximum(first - 1, 0), np.arange(len(data))]
+
+    numerator = np.select(
+        [starts_with_one & ~short, starts_with_one & short, ~starts_with_one & ~short],
+        [joined, joined, integer_head * 10 + integer_last],
+        default=joined)
+    decimals = np.select(
+        [starts_with_one & ~short, starts_with_one & short, ~starts_with_one & ~short],
+        [decimal_length, np.maximum(joined_length - 3, 0), np.ones_like(first)],
+        default=np.maximum(joined_length - 2, 0))
+    return pd.Series(numerator / 10.0 ** decimals, index=data.index, name=data.name)
@@ -0,0 +1,328 @@
+import io
+import os
+import json
+import asyncio
+import shutil
+import numpy as np
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+from fastapi.testclient import TestClient
+from app.model_holder import ModelHolder, N_FEATURES
+from app.batching import MicroBatcher
+from app.registry import ModelRegistry, UnknownModelVersion, model_nbytes
+from app.prediction_cache import PredictionCache, predict_cached
+from app import bulk
+from src import __version__
+
+MODEL_PATH = f"../artifacts/pipeline-model-{__version__}.joblib"
+
+
+class ModelHolderTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.model_path = os.path.join(self.temp_dir, "model.joblib")
+        shutil.copy(MODEL_PATH, self.model_path)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir)
+
+    def test_load_and_predict(self):
+        holder = ModelHolder(self.model_path)
+        self.assertFalse(holder.loaded)
+        holder.load()
+        self.assertTrue(holder.loaded)
+        self.assertEqual(holder.predict([[0.0] * N_FEATURES]).shape, (1,))
+
+    def test_reload_if_changed_swaps_model(self):
+        holder = ModelHolder(self.model_path)
+        previous_model = holder.load()
+        self.assertFalse(holder.reload_if_changed())
+        os.utime(self.model_path, (0, 0))
+        self.assertTrue(holder.reload_if_changed())
+        self.assertIsNot(previous_model, holder.model)
+
+
+class ModelRegistryTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        for version in ["0.1.0", "0.2.0", "0.3.0"]:
+            shutil.copy(MODEL_PATH.replace(".joblib", ".npz"),
+                        os.path.join(self.temp_dir, f"pipeline-model-{version}.npz"))
+        self.default = ModelHolder(os.path.join(self.temp_dir, "pipeline-model-0.1.0.npz"))
+        self.default.load()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir)
+
+    def test_versions_are_loaded_lazily(self):
+        registry = ModelRegistry(self.temp_dir, self.default)
+        self.assertEqual(["0.1.0", "0.2.0", "0.3.0"], registry.available_versions())
+        self.assertEqual(["0.1.0"], registry.loaded_versions())
+        self.assertIs(self.default, registry.get("0.1.0"))
+        holder = registry.get("0.2.0")
+        self.assertEqual(holder.predict(np.zeros((2, N_FEATURES))).shape, (2,))
+        self.assertIs(holder, registry.get("0.2.0"))
+        self.assertEqual(["0.1.0", "0.2.0"], registry.loaded_versions())
+        for version in ["0.4.0", "../0.1.0"]:
+            with self.assertRaises(UnknownModelVersion):
+                registry.get(version)
+
+    def test_least_recently_used_versions_are_evicted(self):
+        nbytes = model_nbytes(self.default.model)
+        registry = ModelRegistry(self.temp_dir, self.default, max_bytes=nbytes)
+        registry.get("0.2.0")
+        registry.get("0.3.0")
+        self.assertEqual(["0.1.0", "0.3.0"], registry.loaded_versions())
+        self.assertEqual(nbytes, registry.loaded_bytes)
+        registry = ModelRegistry(self.temp_dir, self.default, max_bytes=2 * nbytes)
+        registry.get("0.2.0")
+        registry.get("0.3.0")
+        registry.get("0.2.0")
+        self.assertEqual(["0.1.0", "0.3.0", "0.2.0"], registry.loaded_versions())
+
+
+class PredictionCacheTest(TestCase):
+    def setUp(self) -> None:
+        self.predicted = []
+
+    async def predict(self, rows: np.ndarray) -> np.ndarray:
+        self.predicted.append(len(rows))
+        return rows.sum(axis=1)
+
+    def predict_cached(self, cache: PredictionCache, token: str, rows: np.ndarray) -> np.ndarray:
+        predictions = asyncio.run(predict_cached(cache, token, rows, self.predict))
+        np.testing.assert_array_equal(predictions, rows.sum(axis=1))
+        return predictions
+
+    def test_only_missing_rows_are_predicted(self):
+        cache = PredictionCache()
+        rows = np.random.rand(4, N_FEATURES)
+        self.predict_cached(cache, "model", rows[[0, 1, 0, 1]])
+        self.predict_cached(cache, "model", rows)
+        self.assertEqual([2, 2], self.predicted)
+        self.assertEqual({"hits": 2, "misses": 6, "predicted_rows": 4},
+                         {key: cache.stats()[key] for key in ["hits", "misses", "predicted_rows"]})
+        self.predict_cached(cache, "model", rows)
+        self.assertEqual([2, 2], self.predicted)
+        self.assertEqual(0.5, cache.stats()["hit_rate"])
+
+    def test_new_model_token_is_not_served_from_cache(self):
+        cache = PredictionCache()
+        rows = np.random.rand(3, N_FEATURES)
+        self.predict_cached(cache, "model:1", rows)
+        self.predict_cached(cache, "model:2", rows)
+        self.assertEqual([3, 3], self.predicted)
+
+    def test_bounded_rows_and_ttl(self):
+        cache = PredictionCache(max_rows=2)
+        rows = np.random.rand(3, N_FEATURES)
+        self.predict_cached(cache, "model", rows)
+        self.assertEqual((2, 1), (cache.stats()["rows"], cache.stats()["evictions"]))
+        self.predict_cached(cache, "model", rows[2:])
+        self.assertEqual([3], self.predicted)
+        cache = PredictionCache(ttl_seconds=0)
+        self.predict_cached(cache, "model", rows)
+        self.predict_cached(cache, "model", rows)
+        self.assertEqual([3, 3, 3], self.predicted)
+        self.assertEqual(3, cache.stats()["expirations"])
+
+    def test_empty_input(self):
+        cache = PredictionCache()
+        self.assertEqual([], cache.keys("model", np.asarray([])))
+        predictions = asyncio.run(predict_cached(cache, "model", np.empty((0, N_FEATURES)), self.predict))
+        self.assertEqual((0,), predictions.shape)
+        self.assertEqual([], self.predicted)
+
+
+class MicroBatcherTest(TestCase):
+    @staticmethod
+    async def predict_concurrently(batcher: MicroBatcher, requests: list) -> list:
+        await batcher.start()
+        try:
+            return await asyncio.gather(*[batcher.predict(rows) for rows in requests])
+        finally:
+            await batcher.stop()
+
+    def test_concurrent_requests_are_coalesced(self):
+        batcher = MicroBatcher(lambda x: x.sum(axis=1), max_batch_rows=256, max_wait_ms=50)
+        requests = [np.full((index + 1, N_FEATURES), index, dtype=float) for index in range(5)]
+        predictions = asyncio.run(self.predict_concurrently(batcher, requests))
+        for index, prediction in enumerate(predictions):
+            np.testing.assert_array_equal(prediction, np.full(index + 1, index * N_FEATURES))
+        self.assertEqual(batcher.stats.batches, 1)
+        self.assertEqual(batcher.stats.rows, 15)
+
+    def test_batches_respect_max_rows(self):
+        batcher = MicroBatcher(lambda x: x.sum(axis=1), max_batch_rows=4, max_wait_ms=50)
+        requests = [np.ones((3, N_FEATURES)) for _ in range(3)]
+        predictions = asyncio.run(self.predict_concurrently(batcher, requests))
+        self.assertEqual([len(prediction) for prediction in predictions], [3, 3, 3])
+        self.assertEqual(batcher.stats.batches, 3)
+        self.assertEqual(batcher.stats.max_batch_rows, 3)
+
+    def test_bad_request_fails_alone(self):
+        def predict(rows: np.ndarray) -> np.ndarray:
+            if np.isnan(rows).any():
+                raise ValueError("Input contains NaN")
+            return rows.sum(axis=1)
+
+        batcher = MicroBatcher(predict, max_wait_ms=50, n_features=N_FEATURES)
+        requests = [np.ones((2, N_FEATURES)), np.full((1, N_FEATURES), np.nan), np.array([]), np.ones(N_FEATURES)]
+
+        async def predict_concurrently():
+            await batcher.start()
+            try:
+                return await asyncio.gather(*[batcher.predict(rows) for rows in requests], return_exceptions=True)
+            finally:
+                await batcher.stop()
+
+        predictions = asyncio.run(predict_concurrently())
+        np.testing.assert_array_equal(predictions[0], [N_FEATURES] * 2)
+        np.testing.assert_array_equal(predictions[3], [N_FEATURES])
+        # the empty request isn't queued and the nan one fails alone
+        self.assertIsInstance(predictions[1], ValueError)
+        self.assertIsInstance(predictions[2], ValueError)
+        self.assertEqual(2, batcher.stats.batches)
+
+
+class BulkCodecTest(TestCase):
+    def test_npy_round_trip_without_copy(self):
+        data = np.random.rand(10, N_FEATURES)
+        body = bulk.encode_npy(data)
+        decoded = bulk.decode_npy(body, N_FEATURES)
+        np.testing.assert_array_equal(decoded, data)
+        self.assertFalse(decoded.flags.owndata)
+
+    def test_npy_fortran_order_and_float32(self):
+        data = np.asfortranarray(np.random.rand(5, N_FEATURES).astype(np.float32))
+        np.testing.assert_array_equal(bulk.decode_npy(bulk.encode_npy(data), N_FEATURES), data)
+
+    def test_npy_invalid_shape_and_dtype(self):
+        with self.assertRaises(bulk.BulkFormatError):
+            bulk.decode_npy(bulk.encode_npy(np.zeros((3, 5))), N_FEATURES)
+        with self.assertRaises(bulk.BulkFormatError):
+            bulk.decode_npy(bulk.encode_npy(np.zeros((3, N_FEATURES), dtype=np.int64)), N_FEATURES)
+        with self.assertRaises(bulk.BulkFormatError):
+            bulk.decode_npy(b"not a npy file", N_FEATURES)
+
+    def test_arrow_round_trip(self):
+        if bulk.pa is None:
+            self.skipTest("pyarrow is not installed")
+        data = np.random.rand(7, N_FEATURES)
+        table = bulk.pa.table({f"feature_{index}": data[:, index] for index in range(N_FEATURES)})
+        sink = bulk.pa.BufferOutputStream()
+        with bulk.pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        np.testing.assert_array_equal(bulk.decode_arrow(sink.getvalue().to_pybytes(), N_FEATURES), data)
+        predictions = bulk.pa.ipc.open_stream(bulk.encode_arrow(data[:, 0])).read_all()
+        np.testing.assert_array_equal(predictions.column("prediction").to_numpy(), data[:, 0])
+
+
+class AppTest(TestCase):
+    def setUp(self) -> None:
+        from app.main import app, model_holder
+        model_holder.model_path = MODEL_PATH
+        self.client = TestClient(app)
+
+    def test_predict(self):
+        with self.client:
+            response = self.client.post("/milk-price/predict", json={"data": [[0.0] * N_FEATURES] * 2})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()["prediction"]), 2)
+
+    def test_bulk_predict(self):
+        data = np.random.rand(3, N_FEATURES)
+        with self.client:
+            response = self.client.post("/milk-price/predict/bulk", content=bulk.encode_npy(data),
+                                        headers={"content-type": bulk.NPY_MEDIA_TYPE})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(np.load(io.BytesIO(response.content)).shape, (3,))
+            response = self.client.post("/milk-price/predict/bulk", content=bulk.encode_npy(data[:, :5]),
+                                        headers={"content-type": bulk.NPY_MEDIA_TYPE})
+            self.assertEqual(response.status_code, 400)
+            response = self.client.post("/milk-price/predict/bulk", content=b"{}",
+                                        headers={"content-type": "application/json"})
+            self.assertEqual(response.status_code, 415)
+
+    def test_batching_stats(self):
+        with self.client:
+            self.client.post("/milk-price/predict", json={"data": [[0.0] * N_FEATURES]})
+            response = self.client.get("/milk-price/batching/stats")
+            self.assertEqual(response.status_code, 200)
+            self.assertGreaterEqual(response.json()["rows"], 1)
+
+    def test_metrics(self):
+        with self.client:
+            self.client.post("/milk-price/predict", json={"data": [[0.0] * N_FEATURES] * 3})
+            response = self.client.post("/milk-price/predict", json={"data": [[0.0] * 5]})
+            self.assertEqual(response.status_code, 422)
+            self.assertEqual(["body", "data", 0], response.json()["detail"][0]["loc"])
+            response = self.client.get("/metrics")
+            self.assertEqual(response.status_code, 200)
+            for stage in ["validation", "inference", "serialization"]:
+                metric = f'milk_price_request_stage_seconds_count{{endpoint="/milk-price/predict",stage="{stage}"}}'
+                self.assertIn(metric, response.text)
+            self.assertIn('milk_price_request_rows_bucket{endpoint="/milk-price/predict",le="5.0"}', response.text)
+            self.assertIn('milk_price_request_errors_total{endpoint="/milk-price/predict",status="422"}',
+                          response.text)
+            self.assertIn(f'milk_price_model_info{{path="{MODEL_PATH}",version="{__version__}"}} 1.0', response.text)
+            self.assertIn('milk_price_requests_in_flight{endpoint="/metrics"} 1.0', response.text)
+
+    def test_nan_request_fails_alone(self):
+        from app.main import app, batcher
+        batch_sizes = []
+
+        def predict(rows: np.ndarray) -> np.ndarray:
+            batch_sizes.append(len(rows))
+            return predict_batch(rows)
+
+        predict_batch = batcher.predict_batch
+        rows = np.random.rand(2, N_FEATURES)
+        bodies = [json.dumps({"data": rows[:1].tolist()}), json.dumps({"data": [[float("nan")] * N_FEATURES]})]
+        with TestClient(app, raise_server_exceptions=False) as client, \
+                mock.patch.object(batcher, "max_wait", 0.5), mock.patch.object(batcher, "predict_batch", predict):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                responses = list(executor.map(lambda body: client.post(
+                    "/milk-price/predict", content=body, headers={"content-type": "application/json"}), bodies))
+        self.assertEqual([200, 500], [response.status_code for response in responses])
+        self.assertEqual(1, len(responses[0].json()["prediction"]))
+        # both requests were predicted in a batch and then alone
+        self.assertEqual([2, 1, 1], batch_sizes)
+
+    def test_empty_input(self):
+        with self.client:
+            for path in ["/milk-price/predict", f"/milk-price/{__version__}/predict"]:
+                response = self.client.post(path, json={"data": []})
+                self.assertEqual(response.status_code, 422)
+                self.assertEqual(["body", "data"], response.json()["detail"][0]["loc"])
+
+    def test_version_predict(self):
+        with self.client:
+            response = self.client.post(f"/milk-price/{__version__}/predict", json={"data": [[0.0] * N_FEATURES] * 2})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()["prediction"]), 2)
+            response = self.client.post("/milk-price/unknown/predict", json={"data": [[0.0] * N_FEATURES]})
+            self.assertEqual(response.status_code, 404)
+            response = self.client.get("/milk-price/versions")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(__version__, response.json()["default"])
+
+    def test_prediction_cache(self):
+        with self.client:
+            rows = np.random.rand(2, N_FEATURES).tolist()
+            first = self.client.post("/milk-price/predict", json={"data": rows}).json()
+            hits = self.client.get("/milk-price/cache/stats").json()["hits"]
+            self.assertEqual(first, self.client.post("/milk-price/predict", json={"data": rows}).json())
+            self.assertEqual(hits + 2, self.client.get("/milk-price/cache/stats").json()["hits"])
+
+    def test_reload(self):
+        with self.client:
+            with mock.patch("app.main.ADMIN_TOKEN", ""):
+                self.assertEqual(403, self.client.post("/admin/reload").status_code)
+            with mock.patch("app.main.ADMIN_TOKEN", "secret"):
+                self.assertEqual(401, self.client.post("/admin/reload").status_code)
+                response = self.client.post("/admin/reload", headers={"X-Admin-Token": "wrong"})
+                self.assertEqual(401, response.status_code)
+                response = self.client.post("/admin/reload", headers={"X-Admin-Token": "secret"})
+                self.assertEqual(response.status_code, 200)
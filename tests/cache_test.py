@@ -0,0 +1,101 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+import prefect
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from src.cache import EtlCache
+from src.preprocess.preprocess_bank import load_and_clean_central_bank_data, process_iv
+
+
+class EtlCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = EtlCache(self.cache_dir)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.cache_dir)
+
+    def test_cached_result_is_reused(self):
+        df_bank = self.cache.cached("load", load_and_clean_central_bank_data, "../data/banco_central.csv")
+        cached_df_bank = self.cache.cached("load", load_and_clean_central_bank_data, "../data/banco_central.csv")
+        assert_frame_equal(df_bank, cached_df_bank)
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+        df_iv = self.cache.cached("iv", process_iv, df_bank)
+        assert_frame_equal(df_iv, self.cache.cached("iv", process_iv, cached_df_bank))
+        self.assertEqual((2, 2), (self.cache.hits, self.cache.misses))
+
+    def test_key_depends_on_inputs_and_name(self):
+        df = pd.DataFrame({"a": [1, 2, 3]})
+        key = self.cache.key("task", df)
+        self.assertEqual(key, self.cache.key("task", df.copy()))
+        self.assertNotEqual(key, self.cache.key("other_task", df))
+        self.assertNotEqual(key, self.cache.key("task", df.assign(a=[1, 2, 4])))
+        self.assertNotEqual(key, self.cache.key("task", df.astype(float)))
+        self.assertNotEqual(key, self.cache.key("task", df.rename(columns={"a": "b"})))
+
+        file_path = os.path.join(self.cache_dir, "input.csv")
+        df.to_csv(file_path)
+        file_key = self.cache.key("task", file_path)
+        df.assign(a=[1, 2, 4]).to_csv(file_path)
+        self.assertNotEqual(file_key, self.cache.key("task", file_path))
+
+    def test_least_recently_used_results_are_evicted(self):
+        value = pd.DataFrame({"a": range(1000)})
+        self.cache.put("first", value)
+        entry_size = os.path.getsize(os.path.join(self.cache_dir, "first.pkl"))
+        self.cache.max_bytes = 2 * entry_size
+        self.cache.put("second", value)
+        os.utime(os.path.join(self.cache_dir, "first.pkl"), (0, 0))
+        os.utime(os.path.join(self.cache_dir, "second.pkl"), (1, 1))
+        # reading first makes second the least recently used one
+        self.assertIsNotNone(self.cache.get("first"))
+        self.cache.put("third", value)
+        self.assertIsNone(self.cache.get("second"))
+        self.assertIsNotNone(self.cache.get("first"))
+        self.assertIsNotNone(self.cache.get("third"))
+
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("first"))
+
+    def test_concurrent_eviction(self):
+        value = pd.DataFrame({"a": range(1000)})
+        self.cache.put("first", value)
+        entry_size = os.path.getsize(os.path.join(self.cache_dir, "first.pkl"))
+        self.cache.max_bytes = 0
+        # a file listed and then removed by another task is skipped
+        paths = [os.path.join(self.cache_dir, "removed.pkl"), os.path.join(self.cache_dir, "first.pkl")]
+        with mock.patch("glob.glob", return_value=paths):
+            self.cache.evict()
+        self.assertIsNone(self.cache.get("first"))
+
+        self.cache.max_bytes = 2 * entry_size
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda index: self.cache.put(f"key{index}", value.assign(b=index)), range(200)))
+        self.cache.evict()
+        sizes = [os.path.getsize(os.path.join(self.cache_dir, file)) for file in os.listdir(self.cache_dir)
+                 if file.endswith(".pkl")]
+        self.assertLessEqual(sum(sizes), self.cache.max_bytes)
+
+    def test_concurrent_stats(self):
+        df = pd.DataFrame({"a": range(10)})
+        self.cache.cached("task", len, df)
+        logger = prefect.context.get("logger")
+
+        def cached(_):
+            # prefect context is local to every thread as in task runs
+            with prefect.context(logger=logger):
+                return self.cache.cached("task", len, df)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(cached, range(200)))
+        self.assertEqual((200, 1), (self.cache.hits, self.cache.misses))
+        # the processes executor pickles the cache with the prefect context
+        copy = pickle.loads(pickle.dumps(self.cache))
+        self.assertEqual(10, copy.cached("task", len, df))
+        self.assertEqual((201, 1), (copy.hits, copy.misses))
@@ -2,7 +2,10 @@ import os
 import shutil
 import unittest
 from unittest.mock import patch
-from pipeline import flow_definition, run_pipeline
+from prefect.executors import DaskExecutor, LocalDaskExecutor, LocalExecutor
+from pipeline import flow_definition, incremental_flow_definition, run_pipeline, flow_executor
+from src.containers import SearchConfig, SharedDataset
+from src.profiling import TaskProfiler
 from src.model.model import grid_definition
 from src import __version__
 
@@ -39,6 +42,44 @@ class FlowTestSuite(unittest.TestCase):
         self.assertTrue("model_serialization_task" in flow_tasks_names)
         self.assertEqual(self.num_tasks, len(self.flow.tasks))
 
+    def test_check_chunked_bank_flow_tasks(self):
+        flow = flow_definition("milk-chunked-flow-test", bank_chunk_size=100)
+        flow_tasks_names = list(map(lambda x: x.name, flow.tasks))
+        self.assertTrue("load_and_process_central_bank_data_chunked_task" in flow_tasks_names)
+        self.assertFalse("load_and_preprocess_central_bank_data_task" in flow_tasks_names)
+        self.assertFalse("process_pib_columns_task" in flow_tasks_names)
+        self.assertTrue("join_preprocess_bank_data_task" in flow_tasks_names)
+
+    def test_check_incremental_flow_tasks(self):
+        flow = incremental_flow_definition("milk-incremental-flow-test")
+        flow_tasks_names = list(map(lambda x: x.name, flow.tasks))
+        self.assertTrue("training_table_path" in flow_tasks_names)
+        self.assertTrue("update_training_table_task" in flow_tasks_names)
+        self.assertTrue("generate_datasets_task" in flow_tasks_names)
+        self.assertTrue("model_serialization_task" in flow_tasks_names)
+        self.assertFalse("load_and_preprocess_central_bank_data_task" in flow_tasks_names)
+        self.assertEqual(10, len(flow.tasks))
+
+    def test_flow_executors(self):
+        self.assertIsInstance(flow_executor("sequential"), LocalExecutor)
+        self.assertIsInstance(flow_executor("threads"), LocalDaskExecutor)
+        self.assertIsInstance(flow_executor("processes", workers=2), DaskExecutor)
+        with self.assertRaises(ValueError):
+            flow_executor("cluster")
+        with self.assertRaises(ValueError):
+            run_pipeline("processes", profiler=TaskProfiler())
+
+    @patch("pipeline.parameters_definition")
+    def test_processes_executor(self, parameters_definition_mock):
+        parameters_definition_mock.return_value = parameters_side_effect()
+        pipeline_state = run_pipeline("processes", workers=2, search=SearchConfig(strategy="random", n_iter=2))
+        self.assertTrue(pipeline_state.is_successful())
+        results = {task.name: value for task, value in pipeline_state.result.items()}
+        # the features matrix is shared with the workers through a file instead of sent with every mapped task
+        self.assertTrue(all(isinstance(dataset, SharedDataset)
+                            for dataset in results["generate_datasets_task"].result))
+        self.assertTrue(all(child.is_successful() for child in results["model_generation_task"].map_states))
+
     @patch("pipeline.parameters_definition")
     def test_flow_run_state(self, parameters_definition_mock):
         parameters_definition_mock.return_value = parameters_side_effect()
@@ -55,7 +96,7 @@ class FlowTestSuite(unittest.TestCase):
 
         # tests to check dataframe shapes
         self.assertTrue(
-            tasks_results_dict.get("load_and_preprocess_precipitations_data_task").result.shape == (496, 11))
+            tasks_results_dict.get("load_and_preprocess_precipitations_data_task").result.shape == (496, 10))
         self.assertTrue(
             tasks_results_dict.get("load_and_preprocess_milk_data_task").result.shape == (506, 5))
         self.assertTrue(
@@ -69,7 +110,7 @@ class FlowTestSuite(unittest.TestCase):
         self.assertTrue(
             tasks_results_dict.get("join_precipitations_milk_data_task").result.shape == (496, 13))
         self.assertTrue(
-            tasks_results_dict.get("join_preprocess_bank_data_task").result.shape == (81, 42))
+            tasks_results_dict.get("join_preprocess_bank_data_task").result.shape == (81, 41))
         self.assertTrue(
             len(tasks_results_dict.get("generate_datasets_task").result) == 1)
         self.assertTrue(
@@ -1,7 +1,242 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
 from unittest import TestCase
+from src.model.model import model_pipeline_definition, hyperparameter_tuning, seeded_mutual_info_regression, \
+    generate_datasets, generate_feature_subsets, load_shared_dataset, search_report
+from sklearn.model_selection import ParameterGrid
+from src.model.search import estimate_candidate_cost, schedule_candidates
+from src.preprocess.dtypes import compact_dtypes
+from src.containers import SearchConfig, RefreshConfig
+from src.model.refresh import ridge_statistics, refresh_model, save_statistics, load_statistics
+from sklearn.linear_model import Ridge
+from src.model.compiled import compile_pipeline, save_compiled_pipeline, load_compiled_pipeline
 
 
 class ModelTest(TestCase):
     # TODO: implement test for model functions
     def model_prediction_test(self):
         pass
+
+
+class CompiledPipelineTest(TestCase):
+    def setUp(self) -> None:
+        rng = np.random.RandomState(0)
+        self.x = pd.DataFrame(rng.normal(size=(80, 12)) * rng.uniform(1, 1e3, size=12))
+        self.y = self.x[0] * 2 + self.x[3] ** 2 / 1e3 + rng.normal(size=80)
+
+    def test_compiled_predictions_match_sklearn(self):
+        for k, degree in [(3, 1), (4, 2), (5, 3), (10, 5)]:
+            pipeline = model_pipeline_definition().set_params(selector__k=k, poly__degree=degree, model__alpha=0.1)
+            pipeline.fit(self.x, self.y)
+            compiled = compile_pipeline(pipeline)
+            np.testing.assert_allclose(compiled.predict(self.x.to_numpy()), pipeline.predict(self.x), rtol=1e-9)
+
+    def test_save_and_load_compiled_pipeline(self):
+        pipeline = model_pipeline_definition().set_params(selector__k=3, poly__degree=2).fit(self.x, self.y)
+        compiled = compile_pipeline(pipeline)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "model.npz")
+            save_compiled_pipeline(compiled, path)
+            loaded = load_compiled_pipeline(path)
+        np.testing.assert_array_equal(loaded.predict(self.x.to_numpy()), compiled.predict(self.x.to_numpy()))
+
+    def test_compiled_predict_checks_shape(self):
+        pipeline = model_pipeline_definition().set_params(selector__k=3).fit(self.x, self.y)
+        with self.assertRaises(ValueError):
+            compile_pipeline(pipeline).predict(np.zeros((1, 5)))
+
+
+class HyperparameterTuningTest(TestCase):
+    def setUp(self) -> None:
+        rng = np.random.RandomState(0)
+        self.x = pd.DataFrame(rng.normal(size=(60, 8)))
+        self.y = self.x[0] * 2 - self.x[1] ** 2 + rng.normal(size=60)
+        self.grid = {"selector__k": [2, 4], "model__alpha": [1, 0.1], "poly__degree": [1, 2]}
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            hyperparameter_tuning(model_pipeline_definition(), self.x, self.y, self.grid, SearchConfig(strategy="foo"))
+
+    def test_cached_grid_matches_grid_with_seeded_selector(self):
+        seeded_pipeline = model_pipeline_definition().set_params(selector__score_func=seeded_mutual_info_regression)
+        expected = hyperparameter_tuning(seeded_pipeline, self.x, self.y, self.grid)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            search = SearchConfig(strategy="cached_grid", n_jobs=2, cache_dir=cache_dir)
+            cached = hyperparameter_tuning(model_pipeline_definition(), self.x, self.y, self.grid, search)
+        self.assertEqual(cached.best_params_, expected.best_params_)
+        np.testing.assert_allclose(cached.cv_results_["mean_test_score"], expected.cv_results_["mean_test_score"])
+        self.assertIsNone(cached.best_estimator_.memory)
+
+    def test_ridge_path_matches_grid_with_seeded_selector(self):
+        seeded_pipeline = model_pipeline_definition().set_params(selector__score_func=seeded_mutual_info_regression)
+        grid = dict(self.grid, model__alpha=[1, 0.5, 0.1, 0.01], poly__degree=[1, 2, 3])
+        expected = hyperparameter_tuning(seeded_pipeline, self.x, self.y, grid)
+        ridge_path = hyperparameter_tuning(model_pipeline_definition(), self.x, self.y, grid,
+                                           SearchConfig(strategy="ridge_path"))
+        self.assertEqual(ridge_path.best_params_, expected.best_params_)
+        np.testing.assert_allclose(ridge_path.cv_results_["mean_test_score"], expected.cv_results_["mean_test_score"],
+                                   rtol=1e-7)
+        np.testing.assert_array_equal(ridge_path.cv_results_["rank_test_score"], expected.cv_results_["rank_test_score"])
+        np.testing.assert_allclose(ridge_path.predict(self.x), expected.predict(self.x), rtol=1e-7)
+
+    def test_adaptive_strategies_report_time_to_best(self):
+        for search in [SearchConfig(strategy="halving", factor=2), SearchConfig(strategy="random", n_iter=4)]:
+            result = hyperparameter_tuning(model_pipeline_definition(), self.x, self.y, self.grid, search)
+            self.assertIn(result.best_params_, result.cv_results_["params"])
+            self.assertGreater(result.search_time_, 0)
+            self.assertLessEqual(result.time_to_best_, sum(result.cv_results_["mean_fit_time"]) * 3 +
+                                 sum(result.cv_results_["mean_score_time"]) * 3)
+
+    def test_candidates_are_scheduled_by_estimated_cost(self):
+        candidates = list(ParameterGrid(self.grid))
+        order, costs = schedule_candidates(candidates, 60, 8, 3)
+        self.assertTrue(np.all(np.diff(costs[order]) <= 0))
+        self.assertEqual((4, 2), (candidates[order[0]]["selector__k"], candidates[order[0]]["poly__degree"]))
+        self.assertEqual(list(range(8)), list(schedule_candidates(candidates, 60, 8, 3, parallel=False)[0]))
+
+        seeded_pipeline = model_pipeline_definition().set_params(selector__score_func=seeded_mutual_info_regression)
+        for strategy in ["grid", "ridge_path"]:
+            # results keep the grid order when candidates are dispatched by cost
+            sequential = hyperparameter_tuning(seeded_pipeline, self.x, self.y, self.grid,
+                                               SearchConfig(strategy=strategy))
+            parallel = hyperparameter_tuning(seeded_pipeline, self.x, self.y, self.grid,
+                                             SearchConfig(strategy=strategy, n_jobs=2))
+            self.assertEqual(candidates, sequential.cv_results_["params"])
+            self.assertEqual(candidates, parallel.cv_results_["params"])
+            self.assertEqual(sequential.best_params_, parallel.best_params_)
+            np.testing.assert_allclose(sequential.cv_results_["mean_test_score"],
+                                       parallel.cv_results_["mean_test_score"])
+            np.testing.assert_array_equal(costs, parallel.estimated_costs_)
+            # time to best follows the dispatch order, the most expensive candidates first
+            np.testing.assert_array_equal(order, parallel.evaluation_order_)
+            results = parallel.cv_results_
+            times = (np.asarray(results["mean_fit_time"]) + np.asarray(results["mean_score_time"])) * 3
+            best_position = list(order).index(parallel.best_index_)
+            self.assertAlmostEqual(times[order[:best_position + 1]].sum(), parallel.time_to_best_)
+
+            # 5 polynomial columns with k=4 and degree 1, every degree 2 candidate expands to more
+            max_cost = estimate_candidate_cost({"selector__k": 4, "poly__degree": 1}, 60, 8)
+            result = hyperparameter_tuning(model_pipeline_definition(), self.x, self.y, self.grid,
+                                           SearchConfig(strategy=strategy, n_jobs=2, max_cost=max_cost))
+            self.assertTrue(all(params["poly__degree"] == 1 for params in result.cv_results_["params"]))
+            self.assertTrue(all(params["poly__degree"] == 2 for params in result.skipped_candidates_))
+            self.assertIn(result.best_params_, result.cv_results_["params"])
+            report = search_report(result, strategy)
+            self.assertEqual((4, 4), (report["candidates"], report["skipped_candidates"]))
+
+            with self.assertRaises(ValueError):
+                hyperparameter_tuning(model_pipeline_definition(), self.x, self.y, self.grid,
+                                      SearchConfig(strategy=strategy, max_cost=0))
+
+        for search in [SearchConfig(strategy="halving", factor=2, max_cost=max_cost),
+                       SearchConfig(strategy="random", n_iter=3, max_cost=max_cost)]:
+            result = hyperparameter_tuning(model_pipeline_definition(), self.x, self.y, self.grid, search)
+            self.assertTrue(all(params["poly__degree"] == 1 for params in result.cv_results_["params"]))
+
+
+class GenerateDatasetsTest(TestCase):
+    def setUp(self) -> None:
+        self.df = pd.DataFrame({"ano": np.arange(2000, 2010), "Precio_leche": np.linspace(100, 200, 10),
+                                "mes": np.arange(1, 11), "pib": np.arange(10) * 10 ** 8,
+                                "imacec": np.linspace(90.5, 110.5, 10)})
+
+    def test_features_are_views_over_a_single_matrix(self):
+        [(df_x, df_y)] = generate_datasets(self.df)
+        self.assertEqual(["ano", "mes", "pib", "imacec"], list(df_x.columns))
+        self.assertTrue((df_x.dtypes == np.float64).all())
+        np.testing.assert_array_equal(self.df[["ano", "mes", "pib", "imacec"]].to_numpy(np.float64), df_x.to_numpy())
+        self.assertTrue(df_y.equals(self.df["Precio_leche"]))
+        # all columns of the only feature subset are a view, not a copy per dataset
+        self.assertFalse(df_x.to_numpy().flags.owndata)
+
+    def test_compact_dtypes(self):
+        df = compact_dtypes(self.df)
+        self.assertEqual([np.int16, np.float64, np.int8, np.int32, np.float32], list(df.dtypes))
+        np.testing.assert_array_equal(self.df["pib"], df["pib"])
+        # pib values aren't exact in float32
+        [(df_x, _)] = generate_datasets(df)
+        self.assertTrue((df_x.dtypes == np.float64).all())
+        np.testing.assert_array_equal(df_x.to_numpy(), df[list(df_x.columns)].to_numpy(np.float64))
+        [(df_x, _)] = generate_datasets(compact_dtypes(self.df.assign(pib=self.df["pib"] // 10 ** 2)))
+        self.assertTrue((df_x.dtypes == np.float32).all())
+
+    def test_feature_subsets(self):
+        df_x = pd.DataFrame(columns=["ano", "mes", "Coquimbo", "Maule", "PIB_Pesca", "PIB", "Imacec_minero", "num"])
+        self.assertEqual([list(df_x.columns)], generate_feature_subsets(df_x))
+        subsets = generate_feature_subsets(df_x, all_subsets=True)
+        self.assertEqual(list(df_x.columns), subsets[0])
+        self.assertTrue(["ano", "mes", "PIB_Pesca", "PIB", "Imacec_minero", "num"] in subsets)
+        self.assertTrue(["ano", "mes", "Maule", "PIB_Pesca", "PIB", "Imacec_minero", "num"] in subsets)
+        self.assertTrue(["ano", "mes", "PIB_Pesca", "PIB"] in subsets)
+        self.assertTrue(["ano", "mes", "Imacec_minero", "num"] in subsets)
+        self.assertTrue(["ano", "mes", "Coquimbo", "Maule"] in subsets)
+        # without milk columns is the same subset than all features
+        self.assertEqual(7, len(subsets))
+
+    def test_shared_datasets_match_in_memory_datasets(self):
+        df = self.df.rename(columns={"pib": "PIB", "imacec": "Coquimbo"})
+        with tempfile.TemporaryDirectory() as shared_dir:
+            shared_datasets = generate_datasets(df, all_subsets=True, shared_dir=shared_dir)
+            self.assertEqual(1, len([file for file in os.listdir(shared_dir) if file.startswith("features")]))
+            for (df_x, df_y), shared_dataset in zip(generate_datasets(df, all_subsets=True), shared_datasets):
+                shared_x, shared_y = load_shared_dataset(shared_dataset)
+                pd.testing.assert_frame_equal(df_x, shared_x)
+                np.testing.assert_array_equal(df_y, shared_y)
+            # a consecutive subset is read from the memory mapped file
+            values = load_shared_dataset(shared_datasets[0])[0].to_numpy()
+            while values.base is not None and not isinstance(values, np.memmap):
+                values = values.base
+            self.assertIsInstance(values, np.memmap)
+
+
+class RefreshModelTest(TestCase):
+    def setUp(self) -> None:
+        rng = np.random.RandomState(0)
+        periods = np.arange(2015 * 12, 2015 * 12 + 60)
+        x = pd.DataFrame(rng.normal(size=(60, 6)) * rng.uniform(1, 1e3, size=6), columns=[f"f{i}" for i in range(6)])
+        self.df = x.assign(ano=(periods - 1) // 12, mes=(periods - 1) % 12 + 1,
+                           Precio_leche=x["f0"] * 2 + x["f3"] ** 2 / 1e3 + rng.normal(size=60))
+        self.features = list(x.columns)
+        self.pipeline = model_pipeline_definition().set_params(selector__k=3, poly__degree=2, model__alpha=0.1)
+        train = self.df.iloc[:40]
+        self.pipeline.fit(train[self.features], train["Precio_leche"])
+        self.statistics = ridge_statistics(self.pipeline, train[self.features], train["Precio_leche"], 0.9)
+        self.statistics.searched_at = 0.0
+        self.statistics.high_water_mark = int(train["ano"].iloc[-1] * 12 + train["mes"].iloc[-1])
+
+    def test_refreshed_ridge_matches_ridge_fitted_on_all_rows(self):
+        statistics, reason = refresh_model(self.pipeline, self.statistics, self.df, RefreshConfig(drift_threshold=10),
+                                           now=0.0)
+        self.assertEqual(reason, "20 rows added")
+        self.assertEqual((statistics.n_rows, statistics.refreshes), (60, 1))
+        phi = self.pipeline[:-1].transform(self.df[self.features])
+        ridge = Ridge(alpha=0.1).fit(phi, self.df["Precio_leche"])
+        np.testing.assert_allclose(self.pipeline.predict(self.df[self.features]), ridge.predict(phi), rtol=1e-7)
+
+    def test_no_new_months(self):
+        statistics, reason = refresh_model(self.pipeline, self.statistics, self.df.iloc[:40], now=0.0)
+        self.assertIs(statistics, self.statistics)
+        self.assertEqual(reason, "no new months")
+
+    def test_full_search_is_needed_after_drift_or_cadence(self):
+        drifted = self.df.assign(Precio_leche=-self.df["Precio_leche"])
+        coef = self.pipeline.named_steps["model"].coef_.copy()
+        statistics, reason = refresh_model(self.pipeline, self.statistics, drifted, now=0.0)
+        self.assertIsNone(statistics)
+        self.assertIn("drifted", reason)
+        np.testing.assert_array_equal(self.pipeline.named_steps["model"].coef_, coef)
+        statistics, reason = refresh_model(self.pipeline, self.statistics, self.df, RefreshConfig(full_search_days=1),
+                                           now=2 * 24 * 3600.0)
+        self.assertIsNone(statistics)
+        self.assertIn("older than 1 days", reason)
+
+    def test_save_and_load_statistics(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "statistics.npz")
+            save_statistics(self.statistics, path)
+            loaded = load_statistics(path)
+        self.assertEqual(loaded.features, self.features)
+        self.assertEqual(loaded.high_water_mark, self.statistics.high_water_mark)
+        np.testing.assert_array_equal(loaded.gram, self.statistics.gram)
@@ -1,7 +1,198 @@
-from unittest import TestCase
+import os
+import shutil
+import tempfile
+import prefect
+import numpy as np
+import pandas as pd
+from unittest import TestCase, skipIf
+from pandas.testing import assert_frame_equal
+from src.preprocess import columnar
+from src.preprocess.backend import run_etl
+from src.preprocess.preprocess import join_precipitations_milk_data, join_preprocess_milk_bank_data
+from src.preprocess.incremental import update_training_table, high_water_mark
+from src.preprocess.preprocess_bank import load_and_clean_central_bank_data, is_etl_column, process_pib_columns, \
+    process_imacec_columns, process_iv, load_and_process_central_bank_data_chunked, join_preprocess_bank_data
+from src.preprocess.preprocess_milk import load_and_preprocess_milk
+from src.preprocess.preprocess_precipitations import load_and_preprocess_precipitations
+from src.model.model import generate_datasets
+
+try:
+    import polars
+except ImportError:
+    polars = None
 
 
 class PreprocessTest(TestCase):
     # TODO: implement test for preprocess
     def preprocess_test(self):
         pass
+
+
+class PeriodJoinTest(TestCase):
+    def test_join_on_period_key(self):
+        df_precipitations = load_and_preprocess_precipitations("../data/precipitaciones.csv")
+        df_milk = load_and_preprocess_milk("../data/precio_leche.csv")
+        self.assertEqual(list(df_milk["ano"] * 12 + df_milk["mes"]), list(df_milk["period"]))
+        self.assertEqual(list(df_precipitations["date"].dt.year * 12 + df_precipitations["date"].dt.month),
+                         list(df_precipitations["period"]))
+
+        precipitations_columns, milk_columns = list(df_precipitations.columns), list(df_milk.columns)
+        df_milk_price_pp = join_precipitations_milk_data(df_precipitations, df_milk)
+        # inputs are not modified and rows keep milk data order
+        self.assertEqual(precipitations_columns, list(df_precipitations.columns))
+        self.assertEqual(milk_columns, list(df_milk.columns))
+        self.assertEqual((496, 13), df_milk_price_pp.shape)
+        self.assertTrue(df_milk_price_pp["period"].is_monotonic_increasing)
+        self.assertFalse("date" in df_milk_price_pp.columns)
+
+
+class ColumnarTest(TestCase):
+    def setUp(self) -> None:
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.output_dir)
+
+    def convert(self, name: str) -> str:
+        return columnar.convert_csv(f"../data/{name}.csv", self.output_dir, columnar.SCHEMAS[name])
+
+    def test_loaders_read_the_same_data(self):
+        assert_frame_equal(load_and_preprocess_milk("../data/precio_leche.csv"),
+                           load_and_preprocess_milk(self.convert("precio_leche")))
+        assert_frame_equal(load_and_preprocess_precipitations("../data/precipitaciones.csv"),
+                           load_and_preprocess_precipitations(self.convert("precipitaciones")))
+
+        df_bank = load_and_clean_central_bank_data("../data/banco_central.csv")
+        df_bank_columnar = load_and_clean_central_bank_data(self.convert("banco_central"))
+        # only the columns used by the etl are read from columnar files
+        etl_columns = [column for column in df_bank.columns if is_etl_column(column)]
+        self.assertEqual(etl_columns, list(df_bank_columnar.columns))
+        assert_frame_equal(df_bank[etl_columns], df_bank_columnar)
+
+    def test_schema_must_match_csv_columns(self):
+        with self.assertRaises(ValueError):
+            columnar.convert_csv("../data/precio_leche.csv", self.output_dir, columnar.precipitations_schema)
+
+
+class ChunkedBankLoaderTest(TestCase):
+    def setUp(self) -> None:
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.data_dir)
+
+    def test_chunked_loader_matches_processing_functions(self):
+        # periods published again at the end of the file are duplicated in different chunks
+        df_bank = pd.read_csv("../data/banco_central.csv")
+        file_bank_path = os.path.join(self.data_dir, "banco_central.csv")
+        pd.concat([df_bank, df_bank.head(120)]).to_csv(file_bank_path, index=False)
+
+        df_bank_clean = load_and_clean_central_bank_data(file_bank_path)
+        expected = (process_pib_columns(df_bank_clean), process_imacec_columns(df_bank_clean), process_iv(df_bank_clean))
+        for chunk_size in [50, 10_000]:
+            result = load_and_process_central_bank_data_chunked(file_bank_path, chunk_size)
+            for expected_df, df in zip(expected, result):
+                assert_frame_equal(expected_df, df)
+
+
+def run_etl_graph(file_precipitation_path: str, file_milk_path: str, file_bank_path: str) -> pd.DataFrame:
+    """Etl of the flow with the backend of the prefect context"""
+    df_precipitations = run_etl(load_and_preprocess_precipitations, file_precipitation_path)
+    df_milk = run_etl(load_and_preprocess_milk, file_milk_path)
+    df_bank = run_etl(load_and_clean_central_bank_data, file_bank_path)
+    df_bank = run_etl(join_preprocess_bank_data, run_etl(process_pib_columns, df_bank),
+                      run_etl(process_imacec_columns, df_bank), run_etl(process_iv, df_bank))
+    return run_etl(join_preprocess_milk_bank_data, df_bank,
+                   run_etl(join_precipitations_milk_data, df_precipitations, df_milk))
+
+
+class CompactDtypesTest(TestCase):
+    def test_features_round_trip_unchanged(self):
+        expected = run_etl_graph("../data/precipitaciones.csv", "../data/precio_leche.csv", "../data/banco_central.csv")
+        with prefect.context(compact_dtypes=True):
+            table = run_etl_graph("../data/precipitaciones.csv", "../data/precio_leche.csv",
+                                  "../data/banco_central.csv")
+        [(df_x, _)] = generate_datasets(table)
+        # the compact table is copied without changes into the features matrix
+        np.testing.assert_array_equal(table[df_x.columns].to_numpy(np.float64), df_x.to_numpy(np.float64))
+        pib = [column for column in df_x.columns if 'PIB' in column]
+        self.assertTrue((table[pib].max() > 2 ** 24).any())
+        np.testing.assert_array_equal(expected[pib].to_numpy(np.float64), df_x[pib].to_numpy())
+
+
+@skipIf(polars is None, "polars is not installed")
+class LazyBackendTest(TestCase):
+    def setUp(self) -> None:
+        self.output_dir = tempfile.mkdtemp()
+        self.expected = run_etl_graph("../data/precipitaciones.csv", "../data/precio_leche.csv",
+                                      "../data/banco_central.csv")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.output_dir)
+
+    def test_backends_yield_the_same_training_table(self):
+        with prefect.context(etl_backend="polars"):
+            table = run_etl_graph("../data/precipitaciones.csv", "../data/precio_leche.csv",
+                                  "../data/banco_central.csv")
+        self.assertEqual((76, 49), table.shape)
+        assert_frame_equal(self.expected, table)
+
+    def test_lazy_backend_reads_columnar_files(self):
+        paths = [columnar.convert_csv(f"../data/{name}.csv", self.output_dir, columnar.SCHEMAS[name])
+                 for name in ["precipitaciones", "precio_leche", "banco_central"]]
+        with prefect.context(etl_backend="polars"):
+            assert_frame_equal(self.expected, run_etl_graph(*paths))
+
+    def test_lazy_joins_accept_pandas_frames(self):
+        # the chunked central bank loader always returns pandas frames
+        df_pib, df_imacec, df_iv = load_and_process_central_bank_data_chunked("../data/banco_central.csv", 100)
+        df_milk_price_pp = join_precipitations_milk_data(
+            load_and_preprocess_precipitations("../data/precipitaciones.csv"),
+            load_and_preprocess_milk("../data/precio_leche.csv"))
+        with prefect.context(etl_backend="polars"):
+            df_bank = run_etl(join_preprocess_bank_data, df_pib, df_imacec, df_iv)
+            assert_frame_equal(self.expected, run_etl(join_preprocess_milk_bank_data, df_bank, df_milk_price_pp))
+
+    def test_unknown_backend(self):
+        with prefect.context(etl_backend="spark"):
+            with self.assertRaises(ValueError):
+                run_etl(load_and_preprocess_milk, "../data/precio_leche.csv")
+
+
+class IncrementalTest(TestCase):
+    def setUp(self) -> None:
+        self.data_dir = tempfile.mkdtemp()
+        self.table_path = os.path.join(self.data_dir, "training_table.pkl")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.data_dir)
+
+    def update(self, data_dir: str) -> pd.DataFrame:
+        return update_training_table(self.table_path, os.path.join(data_dir, "precipitaciones.csv"),
+                                     os.path.join(data_dir, "precio_leche.csv"),
+                                     os.path.join(data_dir, "banco_central.csv"))
+
+    def test_incremental_updates_match_a_full_rebuild(self):
+        # sources published up to different months
+        df_bank = pd.read_csv("../data/banco_central.csv")
+        df_bank[df_bank["Periodo"] < "2019-06"].to_csv(os.path.join(self.data_dir, "banco_central.csv"), index=False)
+        df_precipitations = pd.read_csv("../data/precipitaciones.csv")
+        df_precipitations[df_precipitations["date"] < "2019-03"].to_csv(
+            os.path.join(self.data_dir, "precipitaciones.csv"), index=False)
+        df_milk = pd.read_csv("../data/precio_leche.csv")
+        df_milk[df_milk["Anio"] < 2019].to_csv(os.path.join(self.data_dir, "precio_leche.csv"), index=False)
+
+        table = self.update(self.data_dir)
+        self.assertEqual((60, 49), table.shape)
+        self.assertEqual(2018 * 12 + 12, high_water_mark(table))
+
+        table = self.update("../data")
+        full_table = update_training_table(os.path.join(self.data_dir, "full_table.pkl"),
+                                           "../data/precipitaciones.csv", "../data/precio_leche.csv",
+                                           "../data/banco_central.csv")
+        self.assertEqual((76, 49), table.shape)
+        assert_frame_equal(full_table, table)
+        assert_frame_equal(table, pd.read_pickle(self.table_path))
+
+        # without new months the table doesn't change
+        assert_frame_equal(table, self.update("../data"))
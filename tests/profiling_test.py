@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from typing import List
+from prefect import Flow, task
+from prefect.executors import LocalDaskExecutor
+from src.profiling import TaskProfiler, ProfilingFlowRunner
+
+
+@task
+def load_task(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({"a": range(rows), "b": [1.0] * rows})
+
+
+@task
+def split_task(df: pd.DataFrame) -> List[pd.DataFrame]:
+    return [df.iloc[:50], df.iloc[50:]]
+
+
+@task
+def double_task(df: pd.DataFrame) -> pd.DataFrame:
+    return df * 2
+
+
+def flow_definition() -> Flow:
+    with Flow("profiling-test") as flow:
+        df = load_task(100)
+        double_task.map(split_task(df))
+    return flow
+
+
+class TaskProfilerTest(unittest.TestCase):
+    def run_flow(self, profiler: TaskProfiler, executor=None):
+        profiler.start(executor=type(executor).__name__)
+        state = flow_definition().run(executor=executor, runner_cls=ProfilingFlowRunner,
+                                      context={"task_profiler": profiler})
+        profiler.stop()
+        self.assertTrue(state.is_successful())
+        return profiler.report()
+
+    def test_every_task_run_is_profiled(self):
+        for executor in [None, LocalDaskExecutor(scheduler="threads", num_workers=2)]:
+            report = self.run_flow(TaskProfiler(), executor)
+            self.assertEqual(type(executor).__name__, report["executor"])
+            self.assertEqual({"load_task": 1, "split_task": 1, "double_task": 2},
+                             {name: total["runs"] for name, total in report["tasks"].items()})
+            self.assertEqual([0, 1], sorted(run["map_index"] for run in report["task_runs"]
+                                            if run["task"] == "double_task"))
+            load_run = [run for run in report["task_runs"] if run["task"] == "load_task"][0]
+            self.assertEqual({"type": "int"}, load_run["inputs"]["rows"])
+            self.assertEqual([100, 2], load_run["output"]["shape"])
+            self.assertGreater(load_run["output"]["memory_mb"], 0)
+            self.assertGreaterEqual(report["flow_seconds"], report["tasks"]["load_task"]["wall_seconds"])
+
+    def test_cprofile_dumps(self):
+        with tempfile.TemporaryDirectory() as profile_dir:
+            self.run_flow(TaskProfiler(profile_dir))
+            self.assertEqual(["double_task-0.prof", "double_task-1.prof", "load_task.prof", "split_task.prof"],
+                             sorted(os.listdir(profile_dir)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,8 @@
+import numpy as np
+import pandas as pd
+import src.utils as utils
 from unittest import TestCase
+from pandas.testing import assert_frame_equal, assert_series_equal
 
 
 class UtilsTest(TestCase):
@@ -8,3 +12,32 @@ class UtilsTest(TestCase):
 
     def to_100_test(self):
         pass
+
+
+class VectorizedUtilsTest(TestCase):
+    def setUp(self) -> None:
+        self.df = pd.read_csv("../data/banco_central.csv")
+
+    @staticmethod
+    def assert_bit_identical(expected: pd.Series, result: pd.Series):
+        assert_series_equal(expected, result, check_exact=True)
+        np.testing.assert_array_equal(expected.to_numpy().view(np.int64), result.to_numpy().view(np.int64))
+
+    def test_match_date_series(self):
+        assert_series_equal(self.df["Periodo"].apply(utils.match_date), utils.match_date_series(self.df["Periodo"]))
+        with self.assertRaises(AttributeError):
+            utils.match_date_series(pd.Series(["2022-01-01", "no date"]))
+
+    def test_convert_int_series(self):
+        df_pib = self.df[[column for column in self.df.columns if 'PIB' in column]].dropna()
+        assert_frame_equal(df_pib.applymap(utils.convert_int), df_pib.apply(utils.convert_int_series))
+
+    def test_to_100_series(self):
+        cols_imacec = [column for column in self.df.columns if 'Imacec' in column]
+        df_imacec = self.df[cols_imacec + ['Periodo']].dropna()
+        for column in cols_imacec:
+            self.assert_bit_identical(df_imacec[column].apply(utils.to_100), utils.to_100_series(df_imacec[column]))
+        edge_cases = pd.Series(["1.5", "12.3", "123.45.6", "99.1", "987.6", "5.", ".5", "100.000.1"])
+        self.assert_bit_identical(edge_cases.apply(utils.to_100), utils.to_100_series(edge_cases))
+        with self.assertRaises(IndexError):
+            utils.to_100_series(pd.Series(["12"]))